@@ -0,0 +1,113 @@
+import random
+from math import ceil
+
+# Vocabulary used to compose the names of the generated products and categories.
+WORDS = (
+    'riz', 'pâtes', 'chocolat', 'noir', 'lait', 'amande', 'avoine', 'bio', 'céréales', 'biscuits',
+    'confiture', 'fraise', 'abricot', 'yaourt', 'nature', 'vanille', 'fromage', 'chèvre', 'jambon',
+    'poulet', 'soupe', 'tomate', 'légumes', 'huile', 'olive', 'miel', 'pain', 'complet', 'sucre',
+    'sel', 'thé', 'café', 'jus', 'orange', 'pomme', 'compote', 'beurre', 'doux', 'crème', 'noisette',
+)
+BRANDS = (
+    'Bjorg', 'Carrefour', 'Auchan', 'Lindt', 'Nestlé', 'Danone', 'Bonne Maman', 'Lu', 'Panzani',
+    'Lustucru', 'Président', 'Monoprix', 'Casino', 'Jordans', 'Alvalle', 'Herta', 'Fleury Michon',
+)
+STORES = ('Auchan', 'Leclerc', 'Magasins U', 'Carrefour', 'Intermarché', 'Monoprix', 'Casino', 'Lidl')
+NUTRISCORE_GRADES = ('a', 'b', 'c', 'd', 'e', None)
+
+
+class OffPayloadGenerator:
+    """Generate fake responses of the OpenFoodFacts `search.pl` endpoint.
+
+    Pages are generated independently from each other and always hold
+    the same products for a given seed, so any page can be requested
+    in any order like with the real API.
+
+    Attributes:
+        products (int): The total number of products.
+        page_size (int): The number of products per page.
+        categories_per_product (int): The average number of categories of a product.
+        categories (int): The number of distinct categories. The fewer there are,
+            the more categories are shared between products.
+        seed (int): The seed of the random generator.
+    """
+
+    def __init__(self, *, products=1000, page_size=300, categories_per_product=8, categories=500, seed=0):
+        self.products = products
+        self.page_size = page_size
+        self.categories_per_product = categories_per_product
+        self.categories = categories
+        self.seed = seed
+
+        rand = random.Random(seed)
+        self._category_names = [
+            ' '.join(rand.sample(WORDS, k=rand.randint(1, 3))).capitalize() + f" {i}"
+            for i in range(categories)
+        ]
+        # Like on OpenFoodFacts, a few generic categories are much more used than the others.
+        self._category_weights = [1 / (rank + 1) for rank in range(categories)]
+
+    @property
+    def last_page(self) -> int:
+        return ceil(self.products / self.page_size)
+
+    def pages(self):
+        """Generate all the pages one after the other."""
+        for page in range(1, self.last_page + 1):
+            yield self.page(page)
+
+    def page(self, page: int) -> dict:
+        """Generate the payload of a page of products."""
+        rand = random.Random(f"{self.seed}:{page}")
+        first = (page - 1) * self.page_size
+        last = min(first + self.page_size, self.products)
+
+        return {
+            'count': self.products,
+            'page': page,
+            'page_count': max(last - first, 0),
+            'page_size': self.page_size,
+            'skip': first,
+            'products': [self._product(rand, i) for i in range(first, last)],
+        }
+
+    def _product(self, rand: random.Random, i: int) -> dict:
+        """Generate a single product, `i` being its position in the results."""
+        code = f"{3000000000000 + i:013d}"
+        name = ' '.join(rand.sample(WORDS, k=rand.randint(2, 4))).capitalize()
+        n_categories = max(1, round(rand.gauss(self.categories_per_product, 2)))
+        categories = {
+            rank: self._category_names[rank]
+            for rank in rand.choices(range(self.categories), weights=self._category_weights, k=n_categories)
+        }
+        image_url = f"https://images.openfoodfacts.org/images/products/{code}/front_fr.{i % 100}"
+
+        return {
+            'code': code,
+            'product_name': name,
+            'generic_name': f"{name} {rand.choice(WORDS)}" if rand.random() < 0.7 else '',
+            'nutriscore_grade': rand.choice(NUTRISCORE_GRADES),
+            'brands': ','.join(rand.sample(BRANDS, k=rand.randint(1, 2))),
+            'stores': ','.join(rand.sample(STORES, k=rand.randint(1, 4))),
+            'url': f"https://world.openfoodfacts.org/product/{code}/{name.lower().replace(' ', '-')}",
+            'image_url': f"{image_url}.400.jpg",
+            'image_small_url': f"{image_url}.200.jpg",
+            'categories': ','.join(categories.values()),
+            'categories_tags': [f"fr:category-{rank}" for rank in categories],
+            'last_modified_t': 1600000000 + i,
+        }
+
+
+class FakeJsonResponse:
+    """Stand for a response of the OpenFoodFacts API whose JSON body is `data`."""
+
+    def __init__(self, data, status=200):
+        self._data = data
+        self._status_code = status
+
+    @property
+    def status_code(self):
+        return self._status_code
+
+    def json(self):
+        return self._data
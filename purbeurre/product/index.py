@@ -1,28 +1,55 @@
 from os import getenv
 
-from algoliasearch_django import AlgoliaIndex
-from algoliasearch_django.decorators import register
+from django.apps import apps
 
 from .models import Product
 
+# The index to target on Algolia.
+INDEX_NAME = "{env}_{model}".format(env=getenv('APP_ENV'), model=Product.__name__)
 
-@register(Product)
-class ProductIndex(AlgoliaIndex):
-    # the index to target on Algolia.
-    index_name = "{env}_{model}".format(env=getenv('APP_ENV'), model=Product.__name__)
-
-    # Specify the fields that should be included in the index.
-    fields = (
-        'name', 'generic_name', 'brands', 'category_names', 'nutriscore_grade',
-        'image_url', 'image_small_url',
-    )
-
-    # Specify the settings of the index.
-    settings = {
-        'searchableAttributes': [
-            'name', 'generic_name', 'brands', 'category_names'
-        ],
-        'customRanking': [
-            'asc(nutriscore_grade)', 'asc(name)',
-        ]
-    }
+# The fields included in the records of the products.
+INDEX_FIELDS = (
+    'name', 'generic_name', 'brands', 'category_names', 'nutriscore_grade',
+    'image_url', 'image_small_url',
+)
+
+# The settings of the index, which the database search backend follows too.
+INDEX_SETTINGS = {
+    'searchableAttributes': [
+        'name', 'generic_name', 'brands', 'category_names'
+    ],
+    'customRanking': [
+        'asc(nutriscore_grade)', 'asc(name)',
+    ]
+}
+
+
+def get_indexed_products():
+    """Products to index, with their categories prefetched for `category_names`."""
+    return Product.objects.prefetch_related('categories')
+
+
+def get_record(product: Product) -> dict:
+    """Build the record of a product like Algolia does, its ID being the `objectID`."""
+    record = {'objectID': product.pk}
+
+    for field in INDEX_FIELDS:
+        value = getattr(product, field)
+        record[field] = value() if callable(value) else value
+
+    return record
+
+
+# Algolia is only installed once configured (see the settings).
+if apps.is_installed('algoliasearch_django'):
+    from algoliasearch_django import AlgoliaIndex
+    from algoliasearch_django.decorators import register
+
+    @register(Product)
+    class ProductIndex(AlgoliaIndex):
+        index_name = INDEX_NAME
+        fields = INDEX_FIELDS
+        settings = INDEX_SETTINGS
+
+        def get_queryset(self):
+            return get_indexed_products()
@@ -0,0 +1,26 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from product.search.cache import SearchCache
+
+# `algoliasearch_django` can't even be imported without the credentials.
+if apps.is_installed('algoliasearch_django'):
+    from algoliasearch_django.management.commands.algolia_reindex import Command as AlgoliaReindexCommand
+else:
+    AlgoliaReindexCommand = BaseCommand
+
+
+class Command(AlgoliaReindexCommand):
+    """The `algolia_reindex` command of `algoliasearch_django`, which expires the cached searches once done.
+
+    It takes precedence over the original command as the `product` app
+    is listed before `algoliasearch_django` in the installed apps.
+    """
+
+    def handle(self, *args, **options):
+        if not apps.is_installed('algoliasearch_django'):
+            raise CommandError("Algolia isn't configured, set ALGOLIA_APP_ID and ALGOLIA_API_KEY.")
+
+        super().handle(*args, **options)
+
+        SearchCache().invalidate()
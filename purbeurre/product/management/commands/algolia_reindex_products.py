@@ -0,0 +1,124 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import time
+
+from algoliasearch.exceptions import RequestException
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from product.models import Product, ProductIndexUpdate
+from product.search.cache import SearchCache
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Algolia index of products with chunked queries and parallel uploads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of products loaded per query and sent per Algolia request.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Number of Algolia requests sent at the same time.',
+        )
+
+    def handle(self, *args, **options):
+        if not apps.is_installed('algoliasearch_django'):
+            raise CommandError("Algolia isn't configured, set ALGOLIA_APP_ID and ALGOLIA_API_KEY.")
+
+        # `algoliasearch_django` can't even be imported without the credentials.
+        from algoliasearch_django import algolia_engine, get_adapter
+
+        start = time()
+        chunk_size, workers = options['chunk_size'], options['workers']
+        # Pending updates are superseded by the reindex.
+        last_update_id = ProductIndexUpdate.objects.aggregate(Max('id'))['id__max']
+
+        adapter = get_adapter(Product)
+        client = algolia_engine.client
+        index = client.init_index(adapter.index_name)
+        replicas = self._get_replicas(index)
+        # Records are sent to a temporary index which then replaces the current one,
+        # so searches are served by the previous index until the reindex is done.
+        # A replica only has one primary index, they are attached to the new index once moved.
+        tmp_index = client.init_index(adapter.tmp_index_name)
+        tmp_index.set_settings({**adapter.settings, 'replicas': []}).wait()
+        tmp_index.clear_objects()
+
+        # The rules and synonyms configured on the dashboard are kept.
+        if replicas is not None:
+            client.copy_index(adapter.index_name, adapter.tmp_index_name, {'scope': ['rules', 'synonyms']}).wait()
+
+        count = 0
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            uploads = set()
+
+            for records in self._get_records(adapter, chunk_size):
+                # Bound the number of chunks held in memory.
+                if len(uploads) >= 2 * workers:
+                    done, uploads = wait(uploads, return_when=FIRST_COMPLETED)
+                    self._raise_errors(done)
+
+                uploads.add(executor.submit(tmp_index.save_objects, records))
+                count += len(records)
+
+            self._raise_errors(wait(uploads).done)
+
+        client.move_index(adapter.tmp_index_name, adapter.index_name).wait()
+
+        if replicas:
+            index.set_settings({'replicas': replicas}).wait()
+
+        SearchCache().invalidate()
+
+        if last_update_id is not None:
+            ProductIndexUpdate.objects.filter(id__lte=last_update_id).delete()
+
+        elapsed_time = time() - start
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sucessfully reindexed {count} products in {adapter.index_name} "
+                f"({elapsed_time:.2f} seconds, {count / (elapsed_time or 1):.0f} records/s)."
+            )
+        )
+
+    @staticmethod
+    def _get_replicas(index):
+        """Get the replicas of the current index, None when there is no index yet."""
+        try:
+            return index.get_settings().get('replicas', [])
+        except RequestException as e:
+            if e.status_code == 404:
+                return None
+
+            raise
+
+    @staticmethod
+    def _get_records(adapter, chunk_size):
+        """Build the index records chunk by chunk.
+
+        Products are paginated on their primary key and the categories
+        of each chunk are fetched with a single query.
+        """
+        last_id = 0
+
+        while True:
+            products = list(
+                adapter.get_queryset().filter(id__gt=last_id).order_by('id')[:chunk_size]
+            )
+
+            if not products:
+                return
+
+            last_id = products[-1].id
+
+            yield [adapter.get_raw_record(product) for product in products]
+
+    @staticmethod
+    def _raise_errors(uploads):
+        """Raise the error of the first failed upload, if any."""
+        for upload in uploads:
+            upload.result()
@@ -0,0 +1,78 @@
+from time import time
+
+from algoliasearch.exceptions import AlgoliaException
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from product.models import Product, ProductIndexUpdate
+from product.search.cache import SearchCache
+
+
+class Command(BaseCommand):
+    help = 'Push the products changed since the last synchronization to the Algolia index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of records sent per Algolia request.',
+        )
+
+    def handle(self, *args, **options):
+        if not apps.is_installed('algoliasearch_django'):
+            raise CommandError("Algolia isn't configured, set ALGOLIA_APP_ID and ALGOLIA_API_KEY.")
+
+        # `algoliasearch_django` can't even be imported without the credentials.
+        from algoliasearch_django import algolia_engine, get_adapter
+
+        start = time()
+        batch_size = options['batch_size']
+        # Updates recorded while synchronizing are left for the next synchronization.
+        last_update_id = ProductIndexUpdate.objects.aggregate(Max('id'))['id__max']
+
+        if last_update_id is None:
+            self.stdout.write(self.style.SUCCESS("The index is already up to date."))
+            return
+
+        updates = ProductIndexUpdate.objects.filter(id__lte=last_update_id)
+        # Only the last recorded action of a product matters.
+        actions = dict(updates.values_list('product_id', 'action'))
+        save_ids = [pk for pk, action in actions.items() if action == ProductIndexUpdate.SAVE]
+        delete_ids = {pk for pk, action in actions.items() if action == ProductIndexUpdate.DELETE}
+
+        adapter = get_adapter(Product)
+        index = algolia_engine.client.init_index(adapter.index_name)
+        saved = 0
+
+        try:
+            for i in range(0, len(save_ids), batch_size):
+                batch_ids = save_ids[i:i + batch_size]
+                records = [
+                    adapter.get_raw_record(product)
+                    for product in Product.objects.filter(id__in=batch_ids).prefetch_related('categories')
+                ]
+                # Products deleted since the update was recorded.
+                delete_ids.update(set(batch_ids) - {int(record['objectID']) for record in records})
+
+                index.save_objects(records)
+                saved += len(records)
+
+            delete_ids = [str(pk) for pk in delete_ids]
+
+            for i in range(0, len(delete_ids), batch_size):
+                index.delete_objects(delete_ids[i:i + batch_size])
+        except AlgoliaException as e:
+            # Updates are kept so they are sent again on the next synchronization.
+            self.stderr.write(f"The synchronization of the index failed: {e}")
+            return
+
+        updates.delete()
+        SearchCache().invalidate()
+        elapsed_time = time() - start
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sucessfully saved {saved} and deleted {len(delete_ids)} records "
+                f"of the {adapter.index_name} index. ({elapsed_time:.2f} seconds)"
+            )
+        )
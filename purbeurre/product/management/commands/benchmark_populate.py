@@ -0,0 +1,111 @@
+import json
+import tracemalloc
+from time import perf_counter
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from product.benchmark import FakeJsonResponse, OffPayloadGenerator
+from product.management.commands.populate import Command as PopulateCommand
+from product.models import ImportCheckpoint
+from purbeurre.utils import StageTimer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the import of products of the `populate` command with generated payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help='Number of products to import.')
+        parser.add_argument('--pagesize', type=int, default=300, help='Number of product per page.')
+        parser.add_argument(
+            '--categories-per-product', type=int, default=8, help='Average number of categories of a product.',
+        )
+        parser.add_argument(
+            '--categories', type=int, default=2000,
+            help='Number of distinct categories, the fewer there are the more they are shared.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=PopulateCommand.DEFAULT_BATCH_SIZE,
+            help='Number of rows written per database query.',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=PopulateCommand.DEFAULT_CONCURRENCY,
+            help='Maximum number of pages fetched at the same time.',
+        )
+        parser.add_argument(
+            '--runs', type=int, default=1,
+            help='Number of imports in a row, the next ones re-import the same products.',
+        )
+        parser.add_argument('--json', action='store_true', help='Output the results as JSON.')
+
+    def handle(self, *args, **options):
+        generator = OffPayloadGenerator(
+            products=options['products'], page_size=options['pagesize'],
+            categories_per_product=options['categories_per_product'], categories=options['categories'],
+        )
+        # Pages are serialized beforehand so only their decoding is part of the benchmark.
+        pages = {payload['page']: json.dumps(payload) for payload in generator.pages()}
+
+        async def fetch_page(client, params, page):
+            return FakeJsonResponse(json.loads(pages[page]))
+
+        populate = PopulateCommand()
+        populate._fetch_page = fetch_page
+        params = {'page': 1, 'page_size': options['pagesize']}
+        results = []
+
+        # Everything is rolled back so the benchmark leaves the database untouched.
+        with transaction.atomic():
+            checkpoint = ImportCheckpoint.objects.create(name='benchmark', page_size=options['pagesize'])
+
+            for run in range(1, options['runs'] + 1):
+                checkpoint.start(page_size=options['pagesize'])
+                populate.timer = StageTimer()
+                queries = 0
+
+                def count_queries(execute, *args):
+                    nonlocal queries
+                    queries += 1
+                    return execute(*args)
+
+                tracemalloc.start()
+                start = perf_counter()
+
+                with connection.execute_wrapper(count_queries):
+                    count, _ = async_to_sync(populate._import_products)(
+                        params, checkpoint=checkpoint,
+                        concurrency=options['concurrency'], batch_size=options['batch_size'],
+                    )
+
+                elapsed_time = perf_counter() - start
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                results.append({
+                    'run': run,
+                    'products': options['products'],
+                    **count._asdict(),
+                    'seconds': round(elapsed_time, 3),
+                    'products_per_second': round(options['products'] / elapsed_time, 1),
+                    'queries': queries,
+                    'queries_per_product': round(queries / options['products'], 3),
+                    'peak_memory_mb': round(peak_memory / 2 ** 20, 2),
+                    'stages': populate.timer.report(),
+                })
+
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for result in results:
+            self.stdout.write(
+                f"Run {result['run']}: {result['products']} products in {result['seconds']:.2f} seconds, "
+                f"{result['products_per_second']:.0f} products/s, "
+                f"{result['queries_per_product']:.3f} queries/product ({result['queries']} queries), "
+                f"peak memory {result['peak_memory_mb']:.2f} MB "
+                f"({result['products_inserted']} inserted, {result['products_updated']} updated, "
+                f"{result['products_skipped']} unchanged)."
+            )
@@ -0,0 +1,86 @@
+import json
+from statistics import mean
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from product.search import RESULT_PARAMS, get_backend
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the size and decoding time of the search responses of the results page, '
+        'with every attribute and with only the rendered ones.'
+    )
+
+    # Searched queries when none are given.
+    DEFAULT_QUERIES = ('riz', 'chocolat noir', 'pâtes', 'lait', 'biscuits')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--query', action='append', dest='queries', help='Query to search, can be repeated.',
+        )
+        parser.add_argument('--hits-per-page', type=int, default=6, help='Number of hits per response.')
+        parser.add_argument('--runs', type=int, default=20, help='Number of decodings of each response.')
+        parser.add_argument('--json', action='store_true', help='Output the results as JSON.')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        queries = options['queries'] or self.DEFAULT_QUERIES
+        variants = {
+            'full': {},
+            'lean': RESULT_PARAMS,
+        }
+        results = {}
+
+        for variant, variant_params in variants.items():
+            sizes, search_times, decode_times = [], [], []
+
+            for query in queries:
+                params = {**variant_params, 'hitsPerPage': options['hits_per_page'], 'page': 0}
+                # The backend is called directly so the search cache doesn't answer.
+                start = perf_counter()
+                response = backend.search(query, params)
+                search_times.append(perf_counter() - start)
+
+                # Responses are measured as sent by Algolia, in JSON.
+                payload = json.dumps(response).encode()
+                sizes.append(len(payload))
+                decode_times.append(self._time_decoding(payload, options['runs']))
+
+            results[variant] = {
+                'bytes': round(mean(sizes)),
+                'decode_ms': round(mean(decode_times) * 1000, 3),
+                'search_ms': round(mean(search_times) * 1000, 1),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'response':<10}{'bytes':>10}{'decode ms':>12}{'search ms':>12}")
+
+        for variant, result in results.items():
+            self.stdout.write(
+                f"{variant:<10}{result['bytes']:>10}{result['decode_ms']:>12.3f}{result['search_ms']:>12.1f}"
+            )
+
+        full, lean = results['full'], results['lean']
+
+        if full['bytes'] and full['decode_ms']:
+            self.stdout.write(
+                f"The lean responses are {1 - lean['bytes'] / full['bytes']:.0%} smaller "
+                f"and decoded {1 - lean['decode_ms'] / full['decode_ms']:.0%} faster, on average."
+            )
+
+    @staticmethod
+    def _time_decoding(payload: bytes, runs: int) -> float:
+        """Get the fastest decoding time of a payload in seconds, the others being disturbed."""
+        times = []
+
+        for _ in range(runs):
+            start = perf_counter()
+            json.loads(payload)
+            times.append(perf_counter() - start)
+
+        return min(times)
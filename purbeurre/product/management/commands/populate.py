@@ -1,30 +1,85 @@
 import asyncio
-from time import time
+import csv
+import gzip
+import hashlib
+import json
+import sys
+from argparse import ArgumentTypeError
+from datetime import datetime
+from itertools import count as count_from, islice
+from time import perf_counter, time
 from math import ceil
+from pathlib import Path
+from typing import NamedTuple
 
 import httpx
-from algoliasearch_django.decorators import disable_auto_indexing
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps
 from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.text import slugify
 
-from product.models import Product, Category
+from product.models import Product, Category, ImportCheckpoint, ProductIndexUpdate
+from product.search.backends import DatabaseSearchBackend
+from product.search.cache import SearchCache
+from product.search.fuzzy import TrigramIndex, trigram_index
+from product.search.spelling import SpellingIndex, spelling_index
+from product.search.suggest import SuggestionIndex, suggestion_index
+from purbeurre.utils import StageTimer
+
+
+class SaveCount(NamedTuple):
+    """Numbers of rows written when saving products."""
+    products_inserted: int = 0
+    products_updated: int = 0
+    products_skipped: int = 0
+    categories_added: int = 0
 
 
 class Command(BaseCommand):
     OPENFOODFACTS_BASE_URL = "https://fr-en.openfoodfacts.org"
 
+    # Name of the checkpoint of the imports from the OpenFoodFacts API.
+    CHECKPOINT_NAME = "openfoodfacts"
+
+    # Number of rows sent in a single query when writing into the database.
+    DEFAULT_BATCH_SIZE = 500
+
+    # Number of pages requested at the same time.
+    DEFAULT_CONCURRENCY = 4
+
+    # Product fields filled by the imports.
+    PRODUCT_IMPORTED_FIELDS = (
+        'name', 'generic_name', 'brands', 'stores', 'nutriscore_grade',
+        'url', 'image_url', 'image_small_url',
+    )
+
+    # Product fields the suggestions are made of, in the order `SuggestionIndex.update` takes them.
+    PRODUCT_SUGGESTED_FIELDS = ('name', 'brands', 'nutriscore_grade')
+
     help = 'Populate the database of products and categories.'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Time spent in each stage of the import.
+        self.timer = StageTimer()
+        # Previous and new suggestions of the written products (see `_save_products_and_categories`).
+        self.product_changes = []
+
     @staticmethod
     def _get_fields() -> tuple:
         """Fields that will be present in the OpenFoodFacts responses."""
         return (
             # Product fields
-            'product_name', 'generic_name', 'nutriscore_grade', 'brands',
+            'code', 'product_name', 'generic_name', 'nutriscore_grade', 'brands',
             'stores', 'url', 'image_url', 'image_small_url',
             # Category fields
             'categories', 'categories_tags',
+            # Import fields
+            'last_modified_t',
         )
 
     def add_arguments(self, parser):
@@ -32,135 +87,597 @@ class Command(BaseCommand):
             '--pagesize', type=int, default=300,
             help='Number of product per page.',
         )
+        parser.add_argument(
+            '--batch-size', type=int, default=self.DEFAULT_BATCH_SIZE,
+            help='Number of rows written per database query.',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=self.DEFAULT_CONCURRENCY,
+            help='Maximum number of pages fetched at the same time.',
+        )
+        parser.add_argument(
+            '--since', type=self._parse_since,
+            help='Only import products modified after this date (ISO 8601 or UNIX timestamp).',
+        )
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only import products modified since the last successful import.',
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Resume the last import where it stopped if it has not been completed.',
+        )
+        parser.add_argument(
+            '--file',
+            help='Import the products from an OpenFoodFacts dump (JSONL or CSV export, optionally gzipped) '
+                 'instead of the API.',
+        )
+        parser.add_argument(
+            '--timings-json', metavar='FILE',
+            help='Write the time spent in each stage of the import as JSON to this file ("-" for stdout).',
+        )
 
     def handle(self, *args, **options):
         start = time()
-        first_page = 1
-        # First index is for products added and the second is for categories.
-        count = (0, 0)
 
         # TODO: Get ingredients too...
         params = {
             'json': True, 'action': 'process', 'page_size': options['pagesize'],
-            'page': first_page, 'fields': ','.join(self._get_fields()),
+            'page': 1, 'fields': ','.join(self._get_fields()),
             'tagtype_0': 'states', 'tag_contains_0': 'contains',
             'tag_0': 'fr:checked',
         }
 
-        response = asyncio.run(self._fetch_products(params)).pop()
-
-        if response.status_code != 200:
-            self._throw_error()
-
-        # Get the content of the JSON body...
-        payload = response.json()
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(name=self.CHECKPOINT_NAME)
 
-        # Calculate the number of pages.
-        last_page = ceil(int(payload.get('count', 0)) / params['page_size'])
+        # Products saved before an interruption aren't known, so the indexes are rebuilt.
+        resumed = options['resume'] and not checkpoint.is_complete
 
-        # Save the first page of products in the database.
-        added = self._save_products_and_categories(payload.get('products', []))
-        # Update the numbers of products/categories added.
-        count = self._update_count(count, added)
+        if resumed:
+            self.stdout.write(f"Resuming the import after {len(checkpoint.completed_pages)} completed pages.")
+        else:
+            since = options['since']
 
-        if first_page != last_page:
-            # Increment the page number for the upcoming requests.
-            params['page'] += 1
+            if since is None and options['incremental']:
+                since = checkpoint.last_modified_t
 
-            # Fetch all remaining pages...
-            reqs = asyncio.run(self._fetch_products(params, last_page=last_page))
+            checkpoint.start(page_size=options['pagesize'], since=since)
 
-            for req in reqs:
-                products = req.json().get('products', [])
+        if options['file']:
+            count, last_modified_t = self._import_dump(
+                options['file'], checkpoint=checkpoint, batch_size=options['batch_size'],
+            )
+        else:
+            params['page_size'] = checkpoint.page_size
+
+            if checkpoint.since is not None:
+                # Most recently modified products come first so the import
+                # can stop at the first product older than `since`.
+                params['sort_by'] = 'last_modified_t'
+
+            # The event loop runs in another thread while the database writes
+            # stay in this one, so pages are saved as soon as they are fetched.
+            count, last_modified_t = async_to_sync(self._import_products)(
+                params, checkpoint=checkpoint, concurrency=options['concurrency'], batch_size=options['batch_size'],
+            )
 
-                added = self._save_products_and_categories(products)
-                count = self._update_count(count, added)
+        checkpoint.complete(last_modified_t=last_modified_t)
 
         elapsed_time = time() - start
 
         self.stdout.write(
             self.style.SUCCESS(
-                f"Sucessfully imported {count[0]} products "
-                f"and {count[1]} categories. ({elapsed_time:.2f} seconds)"
+                f"Sucessfully imported {count.products_inserted} products "
+                f"({count.products_updated} updated, {count.products_skipped} unchanged) "
+                f"and {count.categories_added} categories. ({elapsed_time:.2f} seconds)"
             )
         )
-        # Reindex items of the algolia indice.
-        call_command('algolia_reindex')
+
+        # Push the imported products to the algolia indice, once Algolia is configured.
+        if apps.is_installed('algoliasearch_django'):
+            with self.timer.measure('reindex', count.products_inserted + count.products_updated):
+                call_command('algolia_sync')
+        else:
+            # Updates recorded before, which no synchronization will clear.
+            ProductIndexUpdate.objects.all().delete()
+
+        with self.timer.measure('suggestions', len(self.product_changes)):
+            self._refresh_suggestion_index(rebuild=resumed)
+
+        product_count = Product.objects.count()
+
+        # The spelling dictionary is built here rather than by the first search finding nothing.
+        with self.timer.measure('spelling', product_count):
+            spelling_index.save_snapshot(SpellingIndex.build())
+
+        # The trigram index stands for the `pg_trgm` indexes on the other databases.
+        if connection.vendor != 'postgresql':
+            with self.timer.measure('trigrams', product_count):
+                trigram_index.save_snapshot(TrigramIndex.build())
+
+        # The database search backend sees the changes even if the synchronization failed,
+        # and the workers load the new indexes.
+        SearchCache().invalidate()
+
+        self._report_timings(time() - start, options['timings_json'])
 
     @staticmethod
-    @disable_auto_indexing()
-    def _save_products_and_categories(products):
-        categories_added = 0
-        products_added = 0
-
-        # we named the var 'p' in order to avoid conflits with the package name.
-        for p in products:
-            if p.get('nutriscore_grade') is None:
-                continue
+    def _save_products_and_categories(products, batch_size=DEFAULT_BATCH_SIZE, timer=None, changes=None):
+        """Upsert a page of products along with their categories.
+
+        Products, categories and the relations between them are each written
+        with a handful of bulk queries instead of one query per row.
+        Products whose fingerprint didn't change since the last import are skipped.
+        The time spent in each stage is added to the `timer` when given.
+        The previous and new (name, brands, nutriscore grade) of the written
+        products are appended to the `changes` when given, the previous ones
+        being None for the inserted products.
+
+        Returns:
+            The numbers of products inserted, updated and skipped
+            and the number of categories added.
+        """
+        timer = timer or StageTimer()
+        # Products are identified by their barcode.
+        new_products = {}
+        # Categories names, keyed by their tag.
+        categories = {}
+        # Categories tags of each product, keyed by the product barcode.
+        products_tags = {}
+
+        with timer.measure('validation', len(products)):
+            # we named the var 'p' in order to avoid conflits with the package name.
+            for p in products:
+                if p.get('nutriscore_grade') is None or not p.get('code'):
+                    continue
+
+                product = Command._build_product(p)
+                # The first occurrence of a product wins.
+                new_products.setdefault(product.code, product)
+                tags = products_tags.setdefault(product.code, set())
+
+                for name, tag in zip(p.get('categories').split(','), p.get('categories_tags')):
+                    categories.setdefault(tag, name.strip())
+                    tags.add(tag)
+
+            for code, product in new_products.items():
+                product.fingerprint = Command._fingerprint(product, products_tags[code])
+
+        if not new_products:
+            return SaveCount()
+
+        # Fields of the written products which the suggestions are made of.
+        suggested = Command.PRODUCT_SUGGESTED_FIELDS
+
+        with timer.measure('products', len(new_products)):
+            # Products which already exist are updated in place, unless they didn't change.
+            known_rows = Command._get_rows(Product, 'code', new_products, batch_size, 'id', 'fingerprint', *suggested)
+            # Products imported before barcodes were stored are matched by their slug.
+            legacy_rows = Command._get_rows(
+                Product, 'slug', {p.slug for code, p in new_products.items() if code not in known_rows},
+                batch_size, 'id', 'fingerprint', *suggested, code__isnull=True,
+            )
+            product_ids = {}
+            now = timezone.now()
+            changed_products = []
+            skipped = 0
+
+            for code, product in list(new_products.items()):
+                row = known_rows.get(code) or legacy_rows.pop(product.slug, None)
+
+                if row is None:
+                    continue
+
+                del new_products[code]
+                product_id, fingerprint, *previous = row
 
-            categories = p.get('categories').split(',')
-            categories_tags = p.get('categories_tags')
-
-            saved_product, recently_created = Product.objects.get_or_create(
-                slug=slugify(p.get('product_name')),
-                defaults={
-                    "name": p.get('product_name'),
-                    # We check the length of `generic_name` as on the first release
-                    # no one exceeded 254 characters but one product has been updated
-                    # with a generic name length greater than the maximum field length.
-                    "generic_name": p.get('generic_name') if len(p.get('generic_name', '')) <= 254 else None,
-                    "brands": p.get('brands'),
-                    "stores": p.get('stores'),
-                    "nutriscore_grade": p.get('nutriscore_grade'),
-                    "url": p.get('url').strip(),
-                    "image_url": p.get('image_url'),
-                    "image_small_url": p.get('image_small_url'),
-                }
+                if fingerprint == product.fingerprint:
+                    # Neither the product nor its categories need to be written.
+                    del products_tags[code]
+                    skipped += 1
+                    continue
+
+                product.pk, product.updated_at = product_id, now
+                product_ids[code] = product_id
+                changed_products.append(product)
+
+                if changes is not None:
+                    changes.append((tuple(previous), tuple(getattr(product, field) for field in suggested)))
+
+            Product.objects.bulk_update(
+                changed_products, batch_size=batch_size,
+                fields=(*Command.PRODUCT_IMPORTED_FIELDS, 'code', 'fingerprint', 'updated_at'),
             )
+            Product.objects.bulk_create(new_products.values(), batch_size=batch_size)
 
-            if recently_created:
-                products_added += 1
+            if changes is not None:
+                changes.extend(
+                    (None, tuple(getattr(product, field) for field in suggested)) for product in new_products.values()
+                )
 
-            for name, tag in zip(categories, categories_tags):
-                category, newly_created = Category.objects.get_or_create(
-                    tag=tag, defaults={"name": name.strip()}
+            # Primary keys aren't returned by every backend on bulk inserts.
+            product_ids.update(Command._get_ids(Product, 'code', new_products, batch_size))
+            # Written products are pushed to the Algolia index on the next synchronization, once it is configured.
+            if apps.is_installed('algoliasearch_django'):
+                ProductIndexUpdate.objects.bulk_create(
+                    [ProductIndexUpdate(product_id=product_id) for product_id in product_ids.values()],
+                    batch_size=batch_size,
                 )
 
-                if newly_created:  # The category is newly created
-                    categories_added += 1
+        # Only the categories of the written products are needed.
+        categories = {
+            tag: categories[tag] for tags in products_tags.values() for tag in tags
+        }
+
+        with timer.measure('categories', len(categories)):
+            category_ids = Command._get_ids(Category, 'tag', categories, batch_size)
+            new_categories = [
+                Category(tag=tag, name=name) for tag, name in categories.items()
+                if tag not in category_ids
+            ]
+            Category.objects.bulk_create(new_categories, batch_size=batch_size, ignore_conflicts=True)
+            category_ids.update(
+                Command._get_ids(Category, 'tag', [c.tag for c in new_categories], batch_size)
+            )
+
+        ProductCategory = Product.categories.through
+        relations = [
+            ProductCategory(product_id=product_ids[code], category_id=category_ids[tag])
+            for code, tags in products_tags.items() for tag in tags
+        ]
+
+        with timer.measure('relations', len(relations)):
+            # Categories removed from the changed products since their last import are unlinked.
+            Command._delete_stale_relations(relations, [p.pk for p in changed_products], batch_size)
+            ProductCategory.objects.bulk_create(relations, batch_size=batch_size, ignore_conflicts=True)
+
+        # Bulk writes don't send signals, so the search documents are rebuilt here.
+        with timer.measure('documents', len(product_ids)):
+            DatabaseSearchBackend.index_products(product_ids.values(), batch_size=batch_size)
+
+        return SaveCount(len(new_products), len(changed_products), skipped, len(new_categories))
+
+    @staticmethod
+    def _delete_stale_relations(relations, product_ids, batch_size) -> None:
+        """Delete the relations of the given products to categories which aren't in `relations`."""
+        ProductCategory = Product.categories.through
+        kept_relations = {(relation.product_id, relation.category_id) for relation in relations}
+        stale_ids = []
+
+        for i in range(0, len(product_ids), batch_size):
+            queryset = ProductCategory.objects.filter(product_id__in=product_ids[i:i + batch_size])
+            stale_ids.extend(
+                relation_id
+                for relation_id, product_id, category_id in queryset.values_list('id', 'product_id', 'category_id')
+                if (product_id, category_id) not in kept_relations
+            )
+
+        for i in range(0, len(stale_ids), batch_size):
+            ProductCategory.objects.filter(id__in=stale_ids[i:i + batch_size]).delete()
+
+    @staticmethod
+    def _build_product(p) -> Product:
+        """Build an unsaved product from an OpenFoodFacts product."""
+        return Product(
+            code=str(p.get('code')),
+            slug=slugify(p.get('product_name')),
+            name=p.get('product_name'),
+            # We check the length of `generic_name` as on the first release
+            # no one exceeded 254 characters but one product has been updated
+            # with a generic name length greater than the maximum field length.
+            generic_name=p.get('generic_name') if len(p.get('generic_name') or '') <= 254 else None,
+            brands=p.get('brands'),
+            stores=p.get('stores'),
+            nutriscore_grade=p.get('nutriscore_grade'),
+            url=p.get('url').strip(),
+            image_url=p.get('image_url'),
+            image_small_url=p.get('image_small_url'),
+        )
+
+    @staticmethod
+    def _fingerprint(product, tags) -> str:
+        """Hash the imported fields of a product along with its categories tags."""
+        values = [getattr(product, field) for field in Command.PRODUCT_IMPORTED_FIELDS]
+
+        return hashlib.sha1(json.dumps([values, sorted(tags)]).encode()).hexdigest()
+
+    @staticmethod
+    def _get_ids(model, field, values, batch_size) -> dict:
+        """Map each of the given values of a unique field to the ID of its row."""
+        rows = Command._get_rows(model, field, values, batch_size, 'id')
+
+        return {value: row_id for value, (row_id,) in rows.items()}
 
-                saved_product.categories.add(category)
+    @staticmethod
+    def _get_rows(model, field, values, batch_size, *columns, **filters) -> dict:
+        """Map each of the given values of a unique field to the columns of its row."""
+        values = list(values)
+        rows = {}
+
+        for i in range(0, len(values), batch_size):
+            queryset = model.objects.filter(**{f"{field}__in": values[i:i + batch_size]}, **filters)
+            rows.update((row[0], row[1:]) for row in queryset.values_list(field, *columns))
+
+        return rows
+
+    async def _import_products(self, params, checkpoint, concurrency, batch_size):
+        """Fetch the pages of products and save them as they arrive.
 
-        return products_added, categories_added
+        Up to `concurrency` pages are requested at the same time and queued
+        once received, and a single writer saves the queued pages one by one.
+        The number of pages held in memory is therefore bounded whatever
+        the number of pages to import. Pages already completed according
+        to the checkpoint are skipped.
 
-    async def _fetch_products(self, params, last_page=None):
-        first_page = params.get('page', 1)
-        last_page = last_page or first_page
-        tasks = []
+        When the checkpoint has a `since` time, the pages must be sorted by
+        modification date and only the products modified after it are saved.
+
+        Returns:
+            The numbers of rows written (see `SaveCount`)
+            and the most recent modification time of the fetched products.
+        """
+        save_page = sync_to_async(self._save_page)
+        first_page, since = params['page'], checkpoint.since
 
         async with httpx.AsyncClient() as client:
-            for page in range(first_page, (last_page + 1)):
-                # Create a new instance for each request.
-                p = params.copy()
-                p['page'] = page
-
-                tasks.append(
-                    client.get(
-                        f"{self.OPENFOODFACTS_BASE_URL}/cgi/search.pl",
-                        params=p, timeout=10.0
-                    )
-                )
+            # The first page tells the number of pages to fetch.
+            payload = await self._get_page(client, params, first_page)
+            last_page = ceil(int(payload.get('count', 0)) / params['page_size'])
+
+            if checkpoint.last_page is not None:
+                last_page = min(last_page, checkpoint.last_page)
+
+            pending_pages = set(range(first_page, last_page + 1)) - set(checkpoint.completed_pages)
+
+            queue = asyncio.Queue(maxsize=concurrency)
+            await queue.put((first_page, payload))
+            # Workers share the same iterator so each page is fetched only once,
+            # and pages which are no longer pending are skipped.
+            remaining_pages = (page for page in range(first_page + 1, last_page + 1) if page in pending_pages)
+            workers = [
+                asyncio.create_task(self._fetch_pages(client, params, remaining_pages, queue))
+                for _ in range(min(concurrency, len(pending_pages)))
+            ]
+            count, last_modified_t = SaveCount(), 0
+
+            try:
+                while pending_pages:
+                    page, payload = await queue.get()
+
+                    if page not in pending_pages:
+                        continue
+
+                    if isinstance(payload, Exception):
+                        self._throw_error(payload)
+
+                    pending_pages.discard(page)
+                    products = payload.get('products', [])
+                    modification_times = [int(p.get('last_modified_t') or 0) for p in products]
+                    last_modified_t = max([last_modified_t, *modification_times])
+
+                    if since is not None:
+                        recent_products = [p for p, t in zip(products, modification_times) if t > since]
+
+                        if len(recent_products) < len(products):
+                            # The next pages only hold older products.
+                            pending_pages.difference_update(range(page + 1, last_page + 1))
+                            checkpoint.last_page = last_page = page
+
+                        products = recent_products
+
+                    added = await save_page(checkpoint, page, products, batch_size=batch_size)
+                    count = self._update_count(count, added)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        return count, last_modified_t or None
+
+    def _import_dump(self, path, checkpoint, batch_size):
+        """Import the products of an OpenFoodFacts dump page by page.
+
+        The dump is read record by record so only one page of products
+        is held in memory at a time. Pages already completed according
+        to the checkpoint are read but not saved again.
+
+        Returns:
+            The numbers of rows written (see `SaveCount`)
+            and the most recent modification time of the read products.
+        """
+        count, last_modified_t = SaveCount(), 0
+        records = self._read_dump(path)
+        completed_pages = set(checkpoint.completed_pages)
+
+        for page in count_from(1):
+            start = perf_counter()
+            products = list(islice(records, checkpoint.page_size))
+            self.timer.add('read', perf_counter() - start, len(products))
+
+            if not products:
+                break
+
+            last_modified_t = max([last_modified_t, *(p['last_modified_t'] for p in products)])
+
+            if page in completed_pages:
+                continue
+
+            if checkpoint.since is not None:
+                products = [p for p in products if p['last_modified_t'] > checkpoint.since]
+
+            added = self._save_page(checkpoint, page, products, batch_size=batch_size)
+            count = self._update_count(count, added)
+
+        return count, last_modified_t or None
+
+    def _save_page(self, checkpoint, page, products, batch_size):
+        """Save a page of products and mark it as completed.
+
+        Both are done in the same transaction so a page is either
+        entirely saved and checkpointed or not at all.
+        """
+        with transaction.atomic():
+            added = self._save_products_and_categories(
+                products, batch_size=batch_size, timer=self.timer, changes=self.product_changes,
+            )
+            checkpoint.completed_pages.append(page)
+            checkpoint.save(update_fields=('last_page', 'completed_pages', 'updated_at'))
+
+        return added
+
+    @classmethod
+    def _read_dump(cls, path):
+        """Read the products of an OpenFoodFacts dump.
+
+        Dumps are either the JSONL export, with one product per line,
+        or the CSV export whose columns are separated by tabs.
+        Products are filtered like the API search (checked products sold in France)
+        and only the imported fields are kept.
+        """
+        suffixes = Path(path).suffixes
+        opener = gzip.open if suffixes[-1:] == ['.gz'] else open
+
+        with opener(path, 'rt', encoding='utf-8', newline='') as file:
+            if '.jsonl' in suffixes or '.json' in suffixes:
+                records = (json.loads(line) for line in file if line.strip())
+            else:
+                # Some columns (e.g. ingredients) exceed the default field size limit.
+                csv.field_size_limit(sys.maxsize)
+                records = map(cls._parse_csv_record, csv.DictReader(file, delimiter='\t'))
+
+            for record in records:
+                if not cls._is_searchable(record):
+                    continue
+
+                product = {field: record.get(field) for field in cls._get_fields()}
+                product['categories'] = product['categories'] or ''
+                product['categories_tags'] = product['categories_tags'] or []
+                product['last_modified_t'] = int(product['last_modified_t'] or 0)
+                product['url'] = product['url'] or f"{cls.OPENFOODFACTS_BASE_URL}/product/{record.get('code')}"
+
+                if product['product_name']:
+                    yield product
+
+    @staticmethod
+    def _parse_csv_record(record) -> dict:
+        """Convert a row of the CSV export to the format of the API."""
+        for field in ('categories_tags', 'states_tags', 'countries_tags'):
+            record[field] = record[field].split(',') if record.get(field) else []
+
+        # Empty cells are empty strings whereas the API omits the field.
+        return {field: value for field, value in record.items() if value != ''}
+
+    @staticmethod
+    def _is_searchable(record) -> bool:
+        """Whether the record would be part of the API search results.
+
+        Only the products explicitly checked are, so a record without states is skipped.
+        """
+        return (
+            'en:checked' in record.get('states_tags', [])
+            and 'en:france' in record.get('countries_tags', ['en:france'])
+        )
+
+    async def _fetch_pages(self, client, params, pages, queue):
+        """Fetch the pages one after the other and queue their payloads.
+
+        Errors are queued in place of the payload so they are raised by
+        the writer, whatever they are (e.g. a body which isn't JSON):
+        otherwise the worker would stop and the writer wait for its pages.
+        """
+        for page in pages:
+            try:
+                payload = await self._get_page(client, params, page)
+            except Exception as e:
+                payload = e
+
+            await queue.put((page, payload))
+
+    async def _get_page(self, client, params, page) -> dict:
+        """Fetch a single page of products and decode its payload."""
+        with self.timer.measure('fetch', 1):
+            response = await self._fetch_page(client, params, page)
+
+        return self._get_payload(response)
+
+    async def _fetch_page(self, client, params, page):
+        """Fetch a single page of products."""
+        return await client.get(
+            f"{self.OPENFOODFACTS_BASE_URL}/cgi/search.pl",
+            params={**params, 'page': page}, timeout=10.0
+        )
+
+    def _get_payload(self, response) -> dict:
+        """Get the content of the JSON body of a response."""
+        if response.status_code != 200:
+            self._throw_error()
+
+        with self.timer.measure('decode', 1):
+            return response.json()
+
+    def _refresh_suggestion_index(self, rebuild=False) -> None:
+        """Apply the changes of the imported products to the snapshot of the suggestion index,
+        or build the index from the database without any snapshot or when asked."""
+        index = None if rebuild else suggestion_index.read_snapshot()
 
-            reqs = await asyncio.gather(*tasks)
+        if index is None:
+            index = SuggestionIndex.build()
+        else:
+            index = index.update(
+                [previous for previous, _ in self.product_changes if previous is not None],
+                [new for _, new in self.product_changes],
+            )
+
+        suggestion_index.save_snapshot(index)
+
+    def _report_timings(self, elapsed_time, json_path=None):
+        """Print the time spent in each stage of the import, or write it as JSON."""
+        stages = self.timer.report()
+
+        if json_path:
+            report = json.dumps({'seconds': round(elapsed_time, 3), 'stages': stages}, indent=2)
+
+            if json_path == '-':
+                self.stdout.write(report)
+            else:
+                Path(json_path).write_text(report)
+
+            return
+
+        self.stdout.write(f"{'Stage':<12}{'Seconds':>10}{'Count':>10}{'Rate (/s)':>12}")
+
+        for stage, timing in stages.items():
+            rate = '' if timing['rate'] is None else f"{timing['rate']:.1f}"
+            self.stdout.write(f"{stage:<12}{timing['seconds']:>10.2f}{timing['count']:>10}{rate:>12}")
 
-        return reqs
+        self.stdout.write(f"{'total':<12}{elapsed_time:>10.2f}")
 
-    def _throw_error(self):
+    @staticmethod
+    def _parse_since(value) -> int:
+        """Convert the value of the `--since` option to a UNIX timestamp."""
+        if value.isdigit():
+            return int(value)
+
+        date = parse_datetime(value) or parse_date(value)
+
+        if date is None:
+            raise ArgumentTypeError(f"'{value}' is neither a valid date nor a UNIX timestamp.")
+
+        if not hasattr(date, 'hour'):  # A date without time, start at midnight.
+            date = datetime.combine(date, datetime.min.time())
+
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date, timezone.utc)
+
+        return int(date.timestamp())
+
+    def _throw_error(self, cause=None):
         raise CommandError(
             'An error occurred when connecting to the Open Food Facts API. '
             'Please try again later.'
-        )
+        ) from cause
 
     @staticmethod
     def _update_count(count, added):
-        return tuple(map(lambda x, y: x + y, count, added))
+        return SaveCount(*map(lambda x, y: x + y, count, added))
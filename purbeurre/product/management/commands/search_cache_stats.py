@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from product.search.cache import SearchCache
+
+
+class Command(BaseCommand):
+    help = 'Show the hits and misses of the search cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters once shown.')
+
+    def handle(self, *args, **options):
+        cache = SearchCache()
+        stats = cache.stats()
+        hit_rate = 'n/a' if stats['hit_rate'] is None else f"{stats['hit_rate']:.1%}"
+
+        self.stdout.write(f"{stats['hits']} hits, {stats['misses']} misses (hit rate: {hit_rate}).")
+
+        if options['reset']:
+            cache.reset_stats()
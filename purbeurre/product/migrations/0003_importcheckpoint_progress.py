@@ -0,0 +1,38 @@
+# Generated by Django 3.2.5 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0002_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='completed_pages',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='is_complete',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='last_page',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='page_size',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='since',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
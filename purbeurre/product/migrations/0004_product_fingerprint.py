@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2026-10-18 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_importcheckpoint_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='fingerprint',
+            field=models.CharField(max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0004_product_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='code',
+            field=models.CharField(max_length=64, null=True, unique=True),
+        ),
+    ]
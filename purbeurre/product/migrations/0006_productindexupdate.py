@@ -0,0 +1,25 @@
+# Generated by Django 3.2.5 on 2026-10-18 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0005_product_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductIndexUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('save', 'Save'), ('delete', 'Delete')], default='save', max_length=6)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
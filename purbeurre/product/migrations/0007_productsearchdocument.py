@@ -0,0 +1,167 @@
+# Generated by Django 3.2.5 on 2026-10-18 15:00
+
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSTGRESQL_FORWARD_SQL = [
+    """
+    ALTER TABLE product_productsearchdocument ADD COLUMN vector tsvector
+    """,
+    """
+    CREATE FUNCTION product_productsearchdocument_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.generic_name, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(NEW.brands, '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce(NEW.category_names, '')), 'D');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER product_productsearchdocument_vector
+    BEFORE INSERT OR UPDATE ON product_productsearchdocument
+    FOR EACH ROW EXECUTE PROCEDURE product_productsearchdocument_vector()
+    """,
+    """
+    CREATE INDEX product_productsearchdocument_vector_idx
+    ON product_productsearchdocument USING GIN (vector)
+    """,
+]
+
+POSTGRESQL_REVERSE_SQL = [
+    """
+    DROP TRIGGER product_productsearchdocument_vector ON product_productsearchdocument
+    """,
+    """
+    DROP FUNCTION product_productsearchdocument_vector()
+    """,
+]
+
+# The FTS5 table only indexes the documents, whose content stays in their table.
+SQLITE_FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE product_productsearchdocument_fts USING fts5(
+        name, generic_name, brands, category_names,
+        content='product_productsearchdocument', content_rowid='product_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER product_productsearchdocument_fts_insert
+    AFTER INSERT ON product_productsearchdocument BEGIN
+        INSERT INTO product_productsearchdocument_fts(rowid, name, generic_name, brands, category_names)
+        VALUES (new.product_id, new.name, new.generic_name, new.brands, new.category_names);
+    END
+    """,
+    """
+    CREATE TRIGGER product_productsearchdocument_fts_delete
+    AFTER DELETE ON product_productsearchdocument BEGIN
+        INSERT INTO product_productsearchdocument_fts(
+            product_productsearchdocument_fts, rowid, name, generic_name, brands, category_names
+        )
+        VALUES ('delete', old.product_id, old.name, old.generic_name, old.brands, old.category_names);
+    END
+    """,
+    """
+    CREATE TRIGGER product_productsearchdocument_fts_update
+    AFTER UPDATE ON product_productsearchdocument BEGIN
+        INSERT INTO product_productsearchdocument_fts(
+            product_productsearchdocument_fts, rowid, name, generic_name, brands, category_names
+        )
+        VALUES ('delete', old.product_id, old.name, old.generic_name, old.brands, old.category_names);
+        INSERT INTO product_productsearchdocument_fts(rowid, name, generic_name, brands, category_names)
+        VALUES (new.product_id, new.name, new.generic_name, new.brands, new.category_names);
+    END
+    """,
+]
+
+SQLITE_REVERSE_SQL = [
+    """
+    DROP TABLE product_productsearchdocument_fts
+    """,
+]
+
+
+def fold(text: str) -> str:
+    """Lowercase a text and remove its accents, like `product.search.text.fold` did when this migration was written.
+
+    Frozen here so the migration doesn't depend on the search package.
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def create_full_text_index(apps, schema_editor):
+    """Create the full-text index of the search documents, when the database supports it."""
+    statements = {
+        'postgresql': POSTGRESQL_FORWARD_SQL,
+        'sqlite': SQLITE_FORWARD_SQL,
+    }.get(schema_editor.connection.vendor, [])
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_full_text_index(apps, schema_editor):
+    statements = {
+        'postgresql': POSTGRESQL_REVERSE_SQL,
+        'sqlite': SQLITE_REVERSE_SQL,
+    }.get(schema_editor.connection.vendor, [])
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_documents(apps, schema_editor):
+    """Build the search documents of the products already imported."""
+    Product = apps.get_model('product', 'Product')
+    ProductSearchDocument = apps.get_model('product', 'ProductSearchDocument')
+    last_id = 0
+
+    while True:
+        products = list(
+            Product.objects.filter(id__gt=last_id).order_by('id').prefetch_related('categories')[:1000]
+        )
+
+        if not products:
+            return
+
+        last_id = products[-1].id
+
+        ProductSearchDocument.objects.bulk_create([
+            ProductSearchDocument(
+                product_id=product.id,
+                name=fold(product.name),
+                generic_name=fold(product.generic_name),
+                brands=fold(product.brands),
+                category_names=', '.join(fold(category.name) for category in product.categories.all()),
+            )
+            for product in products
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0006_productindexupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='product.product')),
+                ('name', models.TextField()),
+                ('generic_name', models.TextField(default='')),
+                ('brands', models.TextField(default='')),
+                ('category_names', models.TextField(default='')),
+            ],
+        ),
+        migrations.RunPython(create_full_text_index, drop_full_text_index),
+        migrations.RunPython(create_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.5 on 2026-10-18 15:20
+
+from django.db import migrations
+
+# Trigram indexes of the attributes matched by the typo-tolerant search.
+POSTGRESQL_FORWARD_SQL = [
+    """
+    CREATE EXTENSION IF NOT EXISTS pg_trgm
+    """,
+    *(
+        f"""
+        CREATE INDEX product_productsearchdocument_{attribute}_trgm_idx
+        ON product_productsearchdocument USING GIN ({attribute} gin_trgm_ops)
+        """
+        for attribute in ('name', 'generic_name', 'brands')
+    ),
+]
+
+POSTGRESQL_REVERSE_SQL = [
+    f"""
+    DROP INDEX product_productsearchdocument_{attribute}_trgm_idx
+    """
+    for attribute in ('name', 'generic_name', 'brands')
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Create the trigram indexes on PostgreSQL, the other databases use an in-memory index."""
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRESQL_FORWARD_SQL:
+            schema_editor.execute(statement)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRESQL_REVERSE_SQL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0007_productsearchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -24,6 +24,8 @@ class Product(models.Model):
     __name__ = "Product"
 
     # Specific columns
+    # The barcode of the product, which identifies it on OpenFoodFacts.
+    code = models.CharField(max_length=64, unique=True, null=True)
     name = models.CharField(max_length=254)
     slug = models.SlugField(max_length=254)
     generic_name = models.CharField(max_length=254, null=True)
@@ -34,6 +36,13 @@ class Product(models.Model):
     image_url = models.CharField(max_length=255, null=True)
     image_small_url = models.CharField(max_length=255, null=True)
 
+    # Hash of the imported fields and categories, used to detect changes on re-imports.
+    fingerprint = models.CharField(max_length=40, null=True)
+
+    # Number of reviews and sum of their ratings, maintained by `ReviewService` for the product page.
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+
     # Timestamps columns
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -53,6 +62,10 @@ class Product(models.Model):
         """Returns the stores as a list."""
         return self.stores.split(',')
 
+    def average_rating(self) -> int:
+        """Returns the rounded average rating of the reviews, 0 without reviews."""
+        return round(self.rating_sum / self.review_count) if self.review_count else 0
+
     def category_names(self):
         """Proxy method for algolia indexing."""
         return [str(category) for category in self.categories.all()]
@@ -62,3 +75,149 @@ class Product(models.Model):
 
     def __repr__(self):
         return "<{} '{}'>".format(self.__name__, self.id)
+
+
+class ProductSearchDocument(models.Model):
+    """ProductSearchDocument model
+
+    The searchable texts of a product, used by the database search backend.
+    Texts are lowercased and stripped of their accents, and the database
+    maintains a full-text index on them (see the `0007` migration).
+
+    Attributes:
+        product (Product): The product the document describes.
+        name (str): The name of the product.
+        generic_name (str): The generic name of the product.
+        brands (str): The brands of the product.
+        category_names (str): The names of the categories of the product.
+    """
+    __name__ = "ProductSearchDocument"
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='search_document'
+    )
+    name = models.TextField()
+    generic_name = models.TextField(default='')
+    brands = models.TextField(default='')
+    category_names = models.TextField(default='')
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return "<{} '{}'>".format(self.__name__, self.product_id)
+
+
+class ProductIndexUpdate(models.Model):
+    """ProductIndexUpdate model
+
+    A product which must be pushed to (or removed from) the search index
+    on the next synchronization.
+
+    Attributes:
+        product_id (int): The ID of the product to synchronize.
+        action (str): Whether the product must be saved or deleted from the index.
+        created_at (str): The datetime where the update has been recorded.
+    """
+    __name__ = "ProductIndexUpdate"
+
+    SAVE = 'save'
+    DELETE = 'delete'
+    ACTIONS = [(SAVE, 'Save'), (DELETE, 'Delete')]
+
+    # Not a foreign key as deleted products must be removed from the index too.
+    product_id = models.BigIntegerField()
+    action = models.CharField(max_length=6, choices=ACTIONS, default=SAVE)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.action} {self.product_id}"
+
+    def __repr__(self):
+        return "<{} '{}:{}'>".format(self.__name__, self.action, self.product_id)
+
+
+class SearchIndexSnapshot(models.Model):
+    """SearchIndexSnapshot model
+
+    An in-memory search index built after an import, which the workers
+    load instead of building it from the products themselves.
+
+    Attributes:
+        name (str): The name of the index.
+        data (bytes): The pickled index.
+        created_at (str): The datetime where the snapshot has been created.
+        updated_at (str): The datetime where the snapshot last update occurs.
+    """
+    __name__ = "SearchIndexSnapshot"
+
+    name = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+
+    # Timestamps columns
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return "<{} '{}:{}'>".format(self.__name__, self.name, self.updated_at)
+
+
+class ImportCheckpoint(models.Model):
+    """ImportCheckpoint model
+
+    Keep track of the progress of the imports of products.
+
+    Attributes:
+        name (str): The name of the import (e.g. its source).
+        last_modified_t (int): The most recent modification time (UNIX timestamp)
+            of the products imported by the last successful import.
+        since (int): The modification time from which the current import fetches products.
+        page_size (int): The number of products per page of the current import.
+        last_page (int): The last page of the current import, if known.
+        completed_pages (list): The pages already saved by the current import.
+        is_complete (bool): Whether the current import has been completed.
+        created_at (str): The datetime where the checkpoint has been created.
+        updated_at (str): The datetime where the checkpoint last update occurs.
+    """
+    __name__ = "ImportCheckpoint"
+
+    name = models.CharField(max_length=64, unique=True)
+    last_modified_t = models.BigIntegerField(null=True)
+
+    # Progress of the current import
+    since = models.BigIntegerField(null=True)
+    page_size = models.PositiveIntegerField(null=True)
+    last_page = models.PositiveIntegerField(null=True)
+    completed_pages = models.JSONField(default=list)
+    is_complete = models.BooleanField(default=True)
+
+    # Timestamps columns
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def start(self, *, page_size: int, since: int = None) -> None:
+        """Reset the progress for a new import."""
+        self.page_size, self.since = page_size, since
+        self.last_page, self.completed_pages, self.is_complete = None, [], False
+        self.save()
+
+    def complete(self, *, last_modified_t: int = None) -> None:
+        """Mark the current import as completed."""
+        if last_modified_t is not None:
+            self.last_modified_t = max(last_modified_t, self.last_modified_t or 0)
+
+        self.is_complete = True
+        self.save()
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return "<{} '{}:{}'>".format(self.__name__, self.name, self.last_modified_t)
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from time import monotonic
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from product.search.cache import SearchCache
+from purbeurre.utils import AsyncSingleFlight, CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Parameters of the searches of the results page, which only renders the name, nutriscore
+# and image of the hits: the other attributes, highlights and snippets aren't sent.
+RESULT_PARAMS = {
+    'attributesToRetrieve': ['name', 'nutriscore_grade', 'image_small_url'],
+    'attributesToHighlight': [],
+    'attributesToSnippet': [],
+    'responseFields': ['hits', 'nbHits', 'page', 'nbPages', 'hitsPerPage'],
+}
+
+# Searches in flight in this worker.
+_async_flights = AsyncSingleFlight()
+
+# Circuit breaker of the search backend in this worker.
+breaker = CircuitBreaker(
+    failure_rate=settings.SEARCH_BREAKER['FAILURE_RATE'],
+    window=settings.SEARCH_BREAKER['WINDOW'],
+    min_calls=settings.SEARCH_BREAKER['MIN_CALLS'],
+    reset_timeout=settings.SEARCH_BREAKER['RESET_TIMEOUT'],
+)
+
+
+def get_backend():
+    """Get an instance of the search backend set by the `SEARCH_BACKEND` setting."""
+    return import_string(settings.SEARCH_BACKEND)()
+
+
+def get_fallback_backend():
+    """Get an instance of the backend set by the `SEARCH_FALLBACK_BACKEND` setting, or None."""
+    if not settings.SEARCH_FALLBACK_BACKEND:
+        return None
+
+    return import_string(settings.SEARCH_FALLBACK_BACKEND)()
+
+
+async def asearch(query: str, params: dict = None) -> dict:
+    """Search the products with the configured backend, through the search cache.
+
+    Concurrent identical searches share a single backend call: within the
+    worker thanks to a single flight, and between workers sharing the cache
+    thanks to a short lock, the others waiting for the response in the cache.
+
+    Searches fail when they take more than `SEARCH_DEADLINE` seconds, and the
+    failures trip the circuit breaker of the backend. While the backend fails
+    or the breaker is open, the stale response of the search is served, or the
+    response of the fallback backend (`SEARCH_FALLBACK_BACKEND`) when there is none.
+    The cache is called from other threads since its backend may do network calls,
+    so the event loop of the async views is never blocked.
+    """
+    backend, cache = get_backend(), SearchCache()
+    key = await _in_thread(cache.get_key)(backend, query, params)
+    response = await _in_thread(cache.get)(key)
+
+    if response is not None:
+        return response
+
+    fallback = get_fallback_backend()
+
+    # A backend can't fall back on itself.
+    if fallback is None or type(fallback) is type(backend):
+        return await _async_flights.do(key, lambda: _asearch_once(backend, cache, key, query, params))
+
+    # The searches sharing a flight count as a single call of the breaker.
+    response = await _async_flights.do(key, lambda: _asearch_with_breaker(backend, cache, key, query, params))
+
+    if response is not None:
+        return response
+
+    response = await _in_thread(cache.get_stale)(key)
+
+    if response is None:
+        key = await _in_thread(cache.get_key)(fallback, query, params)
+        response = await _in_thread(cache.get)(key)
+
+    if response is None:
+        response = await _async_flights.do(key, lambda: _asearch_once(fallback, cache, key, query, params))
+
+    return response
+
+
+async def _asearch_with_breaker(backend, cache: SearchCache, key: str, query: str, params: dict = None) -> dict:
+    """Search a response not cached yet within the deadline, unless the circuit breaker is open,
+    the outcome being recorded by the breaker. None is returned when the search failed or wasn't done."""
+    ticket = breaker.allow()
+
+    if ticket is None:
+        return None
+
+    try:
+        try:
+            response = await _asearch_once(backend, cache, key, query, params, timeout=settings.SEARCH_DEADLINE)
+        except Exception as e:
+            logger.warning("Search of %r failed on %s: %r", query, type(backend).__name__, e)
+            response = None
+
+        if response is None:
+            breaker.record_failure(ticket)
+        else:
+            breaker.record_success(ticket)
+    finally:
+        # A search cancelled along with its request has no outcome, it is only released.
+        breaker.release(ticket)
+
+    return response
+
+
+async def _asearch_once(
+    backend, cache: SearchCache, key: str, query: str, params: dict = None, timeout: float = None
+) -> dict:
+    """Search a response not cached yet, unless another worker is already searching it.
+
+    With a timeout, an `asyncio.TimeoutError` is raised once the response
+    took more than `timeout` seconds, the backend's search being cancelled.
+    """
+    deadline = monotonic() + timeout if timeout else None
+    is_locked = await _in_thread(cache.lock)(key)
+
+    if not is_locked:
+        response = await _in_thread(cache.wait)(key, timeout=timeout)
+
+        if response is not None:
+            return response
+
+    try:
+        if deadline is None:
+            response = await backend.asearch(query, params)
+        else:
+            response = await asyncio.wait_for(backend.asearch(query, params), timeout=deadline - monotonic())
+
+        if response is not None:
+            await _in_thread(cache.set)(key, response)
+    finally:
+        if is_locked:
+            await _in_thread(cache.unlock)(key)
+
+    return response
+
+
+def _in_thread(function):
+    """Adapt a sync function of the cache to be awaited, in a thread of its own."""
+    return sync_to_async(function, thread_sensitive=False)
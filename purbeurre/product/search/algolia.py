@@ -0,0 +1,111 @@
+import asyncio
+import json
+import logging
+from time import perf_counter
+from urllib.parse import quote, urlencode
+from weakref import WeakKeyDictionary
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Hosts of the search API, tried in this order like the Algolia client does.
+HOSTS = (
+    '{app_id}-dsn.algolia.net',
+    '{app_id}-1.algolianet.com',
+    '{app_id}-2.algolianet.com',
+    '{app_id}-3.algolianet.com',
+)
+# Timeouts of the Algolia client for the search requests, in seconds.
+TIMEOUT = httpx.Timeout(5, connect=2)
+# Concurrent searches of a worker are bounded by the connections to Algolia.
+LIMITS = httpx.Limits(max_connections=500, max_keepalive_connections=100)
+
+# HTTP client of each event loop, so the connections are kept alive between searches,
+# along with the task closing it.
+_clients = WeakKeyDictionary()
+
+
+async def araw_search(model, query: str = '', params: dict = None):
+    """Search on the Algolia index of a model without blocking the event loop.
+
+    Like `algoliasearch_django.raw_search`, it returns the parsed JSON of the
+    search, or None when it failed unless the Algolia exceptions are raised.
+    """
+    # `algoliasearch_django` can't even be imported without the credentials.
+    from algoliasearch_django import get_adapter
+
+    app_id, api_key = settings.ALGOLIA['APPLICATION_ID'], settings.ALGOLIA['API_KEY']
+    index_name = get_adapter(model).index_name
+    headers = {'X-Algolia-Application-Id': app_id, 'X-Algolia-API-Key': api_key}
+    body = {'params': encode_params(query, params)}
+
+    try:
+        response = await _post(f"/1/indexes/{quote(index_name, safe='')}/query", body, headers)
+        response.raise_for_status()
+
+        start = perf_counter()
+        result = response.json()
+        logger.debug(
+            'SEARCH ON %s: %d bytes decoded in %.2f ms', index_name, len(response.content),
+            (perf_counter() - start) * 1000,
+        )
+
+        return result
+    except httpx.HTTPError as e:
+        if settings.ALGOLIA.get('RAISE_EXCEPTIONS', settings.DEBUG):
+            raise e
+        else:
+            logger.warning('ERROR DURING SEARCH ON %s: %s', index_name, e)
+
+
+def encode_params(query: str, params: dict = None) -> str:
+    """Encode the query and the search parameters as the `params` string of the search API,
+    the lists (e.g. `attributesToRetrieve`) being encoded as JSON arrays."""
+    params = {
+        name: json.dumps(value) if isinstance(value, (list, tuple)) else value
+        for name, value in (params or {}).items()
+    }
+
+    return urlencode({'query': query, **params})
+
+
+async def _post(path: str, body: dict, headers: dict) -> httpx.Response:
+    """Send a request to the first host which answers it, the last host's error being raised."""
+    client = _get_client()
+    urls = [f"https://{host.format(app_id=headers['X-Algolia-Application-Id'])}{path}" for host in HOSTS]
+
+    for url in urls[:-1]:
+        try:
+            response = await client.post(url, json=body, headers=headers)
+        except httpx.TransportError as e:
+            logger.info('ALGOLIA HOST %s UNREACHABLE: %s', url, e)
+            continue
+
+        # Client errors would be the same on every host.
+        if response.status_code < 500:
+            return response
+
+    return await client.post(urls[-1], json=body, headers=headers)
+
+
+def _get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+
+    if loop not in _clients:
+        client = httpx.AsyncClient(timeout=TIMEOUT, limits=LIMITS)
+        _clients[loop] = client, loop.create_task(_close_on_shutdown(loop, client))
+
+    return _clients[loop][0]
+
+
+async def _close_on_shutdown(loop, client: httpx.AsyncClient) -> None:
+    """Close the client of a loop once it shuts down, as `async_to_sync` and `asyncio.run`
+    cancel the remaining tasks before closing their loop (e.g. on each request of a WSGI worker)."""
+    try:
+        await loop.create_future()
+    finally:
+        # The task refers to the loop, which would never be collected otherwise.
+        del _clients[loop]
+        await client.aclose()
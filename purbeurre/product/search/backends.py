@@ -0,0 +1,285 @@
+import re
+from math import ceil
+from time import perf_counter
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+
+from product.index import INDEX_SETTINGS, get_indexed_products, get_record
+from product.models import Product, ProductSearchDocument
+from product.search.algolia import araw_search, encode_params
+from product.search.fuzzy import TrigramIndex, trigram_index
+from product.search.text import fold, tokenize
+
+
+class SearchBackend:
+    """Base class of the product search backends.
+
+    Whatever the backend, searches take the Algolia search parameters
+    (`hitsPerPage` and `page`, starting at 0) and return a response
+    in the format of Algolia: the `hits`, whose `objectID` is the ID
+    of the product, and the `nbHits`, `page`, `nbPages` and `hitsPerPage`.
+    """
+    # Default number of hits per page, as on Algolia.
+    DEFAULT_HITS_PER_PAGE = 20
+
+    def search(self, query: str, params: dict = None) -> dict:
+        raise NotImplementedError
+
+    async def asearch(self, query: str, params: dict = None) -> dict:
+        """Search from an async view, in the thread of the request by default as it may query the database."""
+        return await sync_to_async(self.search)(query, params)
+
+
+class AlgoliaSearchBackend(SearchBackend):
+    """Search the products on the Algolia index, only usable once Algolia is configured."""
+
+    def search(self, query: str, params: dict = None) -> dict:
+        # `algoliasearch_django` can't even be imported without the credentials.
+        from algoliasearch_django import raw_search
+
+        return raw_search(Product, query, params)
+
+    async def asearch(self, query: str, params: dict = None) -> dict:
+        return await araw_search(Product, query, params)
+
+
+class DatabaseSearchBackend(SearchBackend):
+    """Search the products with the full-text search of the database.
+
+    The search documents (see `ProductSearchDocument`) are indexed by a
+    `tsvector` GIN index on PostgreSQL and by a FTS5 table on SQLite.
+    Products are ranked like on Algolia: by the first searchable attribute
+    matching every word of the query, then by the custom ranking of the index.
+    The last word of the query is matched as a prefix.
+
+    When the full-text search finds less than `FUZZY_MIN_HITS` products,
+    the products whose name, generic name or brands are similar to the query
+    (sharing most of its trigrams) are added after them, so that misspelled
+    queries still find something. `pg_trgm` indexes them on PostgreSQL,
+    an in-memory index (see `TrigramIndex`) on the other databases.
+    """
+    # Number of hits under which similar products are searched too.
+    FUZZY_MIN_HITS = 3
+    # Maximum number of similar products added to the hits.
+    FUZZY_MAX_HITS = 30
+    # Minimum similarity of the products to the query, from 0 to 1.
+    FUZZY_THRESHOLD = 0.5
+    # Name of the FTS5 table indexing the search documents on SQLite.
+    SQLITE_FTS_TABLE = 'product_productsearchdocument_fts'
+
+    # Weights of the searchable attributes in the PostgreSQL `tsvector`, in the same order.
+    POSTGRESQL_WEIGHTS = 'ABCD'
+
+    def search(self, query: str, params: dict = None) -> dict:
+        start = perf_counter()
+        params = params or {}
+        hits_per_page = int(params.get('hitsPerPage', self.DEFAULT_HITS_PER_PAGE))
+        page = int(params.get('page', 0))
+        words = tokenize(query)
+
+        if words:
+            product_ids, nb_hits = self._search_ids(words, limit=hits_per_page, offset=page * hits_per_page)
+
+            if nb_hits < self.FUZZY_MIN_HITS:
+                product_ids, nb_hits = self._search_ids_with_typos(
+                    words, limit=hits_per_page, offset=page * hits_per_page
+                )
+        else:
+            product_ids, nb_hits = [], 0
+
+        response = {
+            'hits': self._get_hits(product_ids, params.get('attributesToRetrieve')),
+            'nbHits': nb_hits,
+            'page': page,
+            'nbPages': ceil(nb_hits / hits_per_page),
+            'hitsPerPage': hits_per_page,
+            'query': query,
+            'params': encode_params(query, params),
+            'processingTimeMS': round((perf_counter() - start) * 1000),
+        }
+
+        if 'responseFields' in params:
+            response = {field: response[field] for field in params['responseFields'] if field in response}
+
+        return response
+
+    @staticmethod
+    def index_products(product_ids, batch_size: int = None) -> None:
+        """Rebuild the search documents of the given products."""
+        product_ids = list(product_ids)
+
+        if not product_ids:
+            return
+
+        products = Product.objects.filter(id__in=product_ids).prefetch_related('categories')
+        documents = [
+            ProductSearchDocument(
+                product_id=product.id,
+                name=fold(product.name),
+                generic_name=fold(product.generic_name),
+                brands=fold(product.brands),
+                category_names=', '.join(fold(name) for name in product.category_names()),
+            )
+            for product in products
+        ]
+
+        with transaction.atomic():
+            ProductSearchDocument.objects.filter(product_id__in=product_ids).delete()
+            ProductSearchDocument.objects.bulk_create(documents, batch_size=batch_size)
+
+    @staticmethod
+    def _get_hits(product_ids, attributes: list = None) -> list:
+        """Build the records of the products in the order of their IDs,
+        with only the given attributes (and the object ID) like `attributesToRetrieve`."""
+        products = get_indexed_products().in_bulk(product_ids)
+        hits = []
+
+        for product_id in product_ids:
+            hit = get_record(products[product_id])
+            # Algolia returns object IDs as strings.
+            hit['objectID'] = str(hit['objectID'])
+
+            if attributes is not None and '*' not in attributes:
+                hit = {name: value for name, value in hit.items() if name in attributes or name == 'objectID'}
+
+            hits.append(hit)
+
+        return hits
+
+    def _search_ids(self, words, limit, offset):
+        """Get a page of IDs of the matching products and the number of matching products."""
+        if connection.vendor == 'postgresql':
+            search = self._search_ids_postgresql
+        elif connection.vendor == 'sqlite':
+            search = self._search_ids_sqlite
+        else:
+            raise ImproperlyConfigured(
+                f"The database search backend doesn't support {connection.vendor} databases."
+            )
+
+        return search(words, limit, offset)
+
+    def _search_ids_with_typos(self, words, limit, offset):
+        """Search the IDs of the products matching the words, followed by the similar products."""
+        product_ids, _ = self._search_ids(words, limit=self.FUZZY_MIN_HITS, offset=0)
+        query = ' '.join(words)
+
+        if connection.vendor == 'postgresql':
+            similar_ids = self._search_similar_ids_postgresql(query)
+        else:
+            index = trigram_index.get()
+            similar_ids = []
+
+            # Typos aren't tolerated until the worker has loaded the index.
+            if index is not None:
+                similar_ids = index.search(query, self.FUZZY_THRESHOLD, limit=self.FUZZY_MAX_HITS)
+
+        product_ids += [product_id for product_id in similar_ids if product_id not in product_ids]
+
+        return product_ids[offset:offset + limit], len(product_ids)
+
+    def _search_similar_ids_postgresql(self, query):
+        documents, products = ProductSearchDocument._meta.db_table, Product._meta.db_table
+        attributes = TrigramIndex.ATTRIBUTES
+        # `<%` is true when the word similarity exceeds `pg_trgm.word_similarity_threshold`.
+        matches = ' OR '.join(f"%s <%% d.{attribute}" for attribute in attributes)
+        similarities = ', '.join(f"word_similarity(%s, d.{attribute})" for attribute in attributes)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, false)", [str(self.FUZZY_THRESHOLD)]
+            )
+            cursor.execute(
+                f"SELECT d.product_id FROM {documents} AS d "
+                f"INNER JOIN {products} AS p ON p.id = d.product_id "
+                f"WHERE {matches} "
+                f"ORDER BY GREATEST({similarities}) DESC, {self._get_custom_ranking()} "
+                f"LIMIT %s",
+                [*[query] * 2 * len(attributes), self.FUZZY_MAX_HITS],
+            )
+
+            return [row[0] for row in cursor.fetchall()]
+
+    def _search_ids_postgresql(self, words, limit, offset):
+        documents, products = ProductSearchDocument._meta.db_table, Product._meta.db_table
+        attribute_queries = [
+            self._to_tsquery(words, weight)
+            for weight, _ in zip(self.POSTGRESQL_WEIGHTS, self._get_searchable_attributes())
+        ]
+        ranks = ' '.join(
+            f"WHEN d.vector @@ to_tsquery('simple', %s) THEN {rank}" for rank in range(len(attribute_queries))
+        )
+        query = self._to_tsquery(words)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {documents} AS d WHERE d.vector @@ to_tsquery('simple', %s)", [query]
+            )
+            nb_hits = cursor.fetchone()[0]
+
+            cursor.execute(
+                f"SELECT d.product_id FROM {documents} AS d "
+                f"INNER JOIN {products} AS p ON p.id = d.product_id "
+                f"WHERE d.vector @@ to_tsquery('simple', %s) "
+                f"ORDER BY CASE {ranks} ELSE {len(attribute_queries)} END, {self._get_custom_ranking()} "
+                f"LIMIT %s OFFSET %s",
+                [query, *attribute_queries, limit, offset],
+            )
+
+            return [row[0] for row in cursor.fetchall()], nb_hits
+
+    def _search_ids_sqlite(self, words, limit, offset):
+        fts, products = self.SQLITE_FTS_TABLE, Product._meta.db_table
+        attributes = self._get_searchable_attributes()
+        query = self._to_fts5_query(words)
+        # Products matching every word within an attribute, then across attributes.
+        attribute_queries = [f"{attribute} : ({query})" for attribute in attributes] + [query]
+        matches = ' UNION ALL '.join(
+            f"SELECT rowid AS product_id, {rank} AS attribute_rank FROM {fts} WHERE {fts} MATCH %s"
+            for rank in range(len(attribute_queries))
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {fts} WHERE {fts} MATCH %s", [query])
+            nb_hits = cursor.fetchone()[0]
+
+            cursor.execute(
+                f"SELECT m.product_id FROM ({matches}) AS m "
+                f"INNER JOIN {products} AS p ON p.id = m.product_id "
+                f"GROUP BY m.product_id "
+                f"ORDER BY MIN(m.attribute_rank), {self._get_custom_ranking()} "
+                f"LIMIT %s OFFSET %s",
+                [*attribute_queries, limit, offset],
+            )
+
+            return [row[0] for row in cursor.fetchall()], nb_hits
+
+    @staticmethod
+    def _to_tsquery(words, weight: str = '') -> str:
+        """Build a PostgreSQL `tsquery` matching every word, the last one as a prefix."""
+        terms = [f"{word}:{weight}" if weight else word for word in words[:-1]]
+        terms.append(f"{words[-1]}:*{weight}")
+
+        return ' & '.join(terms)
+
+    @staticmethod
+    def _to_fts5_query(words) -> str:
+        """Build a FTS5 query matching every word, the last one as a prefix."""
+        return ' '.join(f'"{word}"' for word in words) + '*'
+
+    @staticmethod
+    def _get_searchable_attributes() -> list:
+        return INDEX_SETTINGS['searchableAttributes']
+
+    @staticmethod
+    def _get_custom_ranking() -> str:
+        """Convert the custom ranking of the index to an `ORDER BY` clause on the products."""
+        ordering = []
+
+        for criterion in INDEX_SETTINGS['customRanking']:
+            direction, attribute = re.fullmatch(r'(asc|desc)\((\w+)\)', criterion).groups()
+            ordering.append(f"p.{connection.ops.quote_name(attribute)} {direction.upper()}")
+
+        return ', '.join(ordering)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+from time import monotonic, sleep, time_ns
+
+from django.core.cache import caches
+
+from product.search.text import fold
+
+
+class SearchCache:
+    """Cache of the search responses, set by the `search` cache of the `CACHES` setting.
+
+    Responses are keyed by the normalized query and the search parameters.
+    The cache settings bound the lifetime (`TIMEOUT`) and the number of
+    responses kept (`MAX_ENTRIES`), the least recently used ones being evicted first.
+
+    Every key embeds the current generation of the cache, so invalidating
+    the whole cache only takes a new generation, the responses of the previous
+    ones being evicted as they expire. Hits and misses are counted too, so they
+    are shared by the workers when the cache is. The generation and the counters
+    are kept in the `search_state` cache, where no response can evict them.
+
+    A stale copy of each response is kept in the `search_stale` cache whatever
+    the generation, to be served when the backend fails.
+    """
+    ALIAS = 'search'
+    STALE_ALIAS = 'search_stale'
+    STATE_ALIAS = 'search_state'
+
+    # Seconds a worker may search a response before others stop waiting for it.
+    LOCK_TIMEOUT = 5
+    # Seconds between two checks of a response searched by another worker.
+    POLL_INTERVAL = 0.05
+
+    GENERATION_KEY = 'search:generation'
+    HITS_KEY = 'search:hits'
+    MISSES_KEY = 'search:misses'
+
+    def __init__(self, alias: str = ALIAS):
+        self.cache = caches[alias]
+        self.stale_cache = caches[self.STALE_ALIAS]
+        self.state_cache = caches[self.STATE_ALIAS]
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Fold the case, accents and whitespaces of a query, e.g. ' Riz  Thaï' becomes 'riz thai'."""
+        return ' '.join(fold(query).split())
+
+    def get_key(self, backend, query: str, params: dict = None) -> str:
+        """Get the key of the response of a search."""
+        search = json.dumps(
+            [type(backend).__name__, self.normalize(query), params or {}], sort_keys=True, default=str
+        )
+        # Hashed as some cache servers don't allow every character nor long keys.
+        digest = hashlib.sha1(search.encode()).hexdigest()
+
+        return f"search:{self.get_generation()}:{digest}"
+
+    def get(self, key: str):
+        """Get a cached response, or None."""
+        response = self.cache.get(key)
+        self._increment(self.MISSES_KEY if response is None else self.HITS_KEY)
+
+        return response
+
+    def set(self, key: str, response: dict) -> None:
+        self.cache.set(key, response)
+        self.stale_cache.set(self._get_stale_key(key), response)
+
+    def get_stale(self, key: str):
+        """Get the last response of a search, even expired or of a previous generation, or None."""
+        return self.stale_cache.get(self._get_stale_key(key))
+
+    def lock(self, key: str) -> bool:
+        """Try to become the only worker searching the response of a key."""
+        return self.cache.add(f"{key}:lock", True, timeout=self.LOCK_TIMEOUT)
+
+    def unlock(self, key: str) -> None:
+        self.cache.delete(f"{key}:lock")
+
+    def wait(self, key: str, timeout: float = None):
+        """Wait for the response another worker is searching, or None if it didn't come in time.
+
+        Args:
+            key: The key of the response.
+            timeout: Maximum seconds to wait, at most `LOCK_TIMEOUT` (the default).
+        """
+        deadline = monotonic() + min(timeout or self.LOCK_TIMEOUT, self.LOCK_TIMEOUT)
+
+        while monotonic() < deadline:
+            sleep(self.POLL_INTERVAL)
+            response = self.cache.get(key)
+
+            if response is not None:
+                return response
+
+            if self.cache.get(f"{key}:lock") is None:  # The search failed or got evicted.
+                return None
+
+        return None
+
+    def invalidate(self) -> None:
+        """Expire every cached response, e.g. once the products changed."""
+        self.state_cache.set(self.GENERATION_KEY, time_ns(), timeout=None)
+
+    def stats(self) -> dict:
+        """Get the numbers of hits and misses and the hit rate since the last reset."""
+        counts = self.state_cache.get_many([self.HITS_KEY, self.MISSES_KEY])
+        hits, misses = counts.get(self.HITS_KEY, 0), counts.get(self.MISSES_KEY, 0)
+
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+
+    def reset_stats(self) -> None:
+        self.state_cache.delete_many([self.HITS_KEY, self.MISSES_KEY])
+
+    def get_generation(self) -> int:
+        """Get the current generation of the cache, which changes on each invalidation."""
+        # A generation evicted from the cache is replaced by a new one,
+        # so responses of the previous generation are never served again.
+        return self.state_cache.get_or_set(self.GENERATION_KEY, time_ns, timeout=None)
+
+    @staticmethod
+    def _get_stale_key(key: str) -> str:
+        return f"search:stale:{key.rsplit(':', 1)[-1]}"
+
+    def _increment(self, key: str) -> None:
+        try:
+            self.state_cache.incr(key)
+        except ValueError:  # The counter doesn't exist yet.
+            if not self.state_cache.add(key, 1, timeout=None):
+                self.state_cache.incr(key)
@@ -0,0 +1,124 @@
+from array import array
+from collections import defaultdict
+
+from product.models import ProductSearchDocument
+from product.search.holder import IndexHolder
+
+
+def trigrams(text: str) -> set:
+    """Get the trigrams of the words of a folded text, padded like `pg_trgm` does."""
+    result = set()
+
+    for word in text.split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(word) + 1))
+
+    return result
+
+
+def _count_bits(mask: int) -> int:
+    return bin(mask).count('1')
+
+
+class TrigramIndex:
+    """In-memory trigram index of the name, generic name and brands of the products.
+
+    It stands for the `pg_trgm` indexes on databases without them: the
+    similarity of an attribute to a query is the share of the query trigrams
+    it contains. Only the attributes containing a word similar to one of the
+    query words are scored, so a lookup reads the products of a few words
+    instead of every product sharing a trigram with the query.
+    """
+    ATTRIBUTES = ('name', 'generic_name', 'brands')
+
+    def __init__(self, documents):
+        """Index documents given as (product ID, nutriscore grade, name, generic name, brands) tuples."""
+        postings = defaultdict(list)
+        texts = {}
+        self._product_ids = array('Q')
+        # Custom ranking of each product (nutriscore, then name) to break ties.
+        self._rankings = []
+        # Attribute texts of the products, the same texts being shared.
+        self._texts = []
+
+        for position, (product_id, grade, *attributes) in enumerate(documents):
+            self._product_ids.append(product_id)
+            self._rankings.append((grade, attributes[0]))
+
+            for i, text in enumerate(attributes):
+                text = texts.setdefault(text or '', text or '')
+                self._texts.append(text)
+
+                for word in set(text.split()):
+                    postings[word].append(position * len(self.ATTRIBUTES) + i)
+
+        # The (product, attribute) pairs containing each word, and the words containing each trigram.
+        self._postings = {word: array('L', entries) for word, entries in postings.items()}
+        self._words = defaultdict(list)
+
+        for word in self._postings:
+            for trigram in trigrams(word):
+                self._words[trigram].append(word)
+
+    def __len__(self):
+        return len(self._product_ids)
+
+    @classmethod
+    def build(cls):
+        """Build the index from the search documents of the database."""
+        documents = ProductSearchDocument.objects.values_list(
+            'product_id', 'product__nutriscore_grade', *cls.ATTRIBUTES
+        )
+
+        return cls(documents.iterator())
+
+    def search(self, query: str, threshold: float, limit: int) -> list:
+        """Get the IDs of the products most similar to a folded query, the most similar first."""
+        bits = {trigram: 1 << bit for bit, trigram in enumerate(trigrams(query))}
+
+        if not bits:
+            return []
+
+        # The query trigrams contained by each word of the catalog, as bit masks.
+        masks = defaultdict(int)
+
+        for trigram, bit in bits.items():
+            for word in self._words.get(trigram, ()):
+                masks[word] |= bit
+
+        candidates = set()
+
+        for query_word in set(query.split()):
+            query_mask = sum(bits[trigram] for trigram in trigrams(query_word))
+            minimum = threshold * _count_bits(query_mask)
+
+            for word, mask in masks.items():
+                if _count_bits(mask & query_mask) >= minimum:
+                    candidates.update(self._postings[word])
+
+        similarities, text_similarities = {}, {}
+
+        for entry in candidates:
+            text = self._texts[entry]
+            similarity = text_similarities.get(text)
+
+            if similarity is None:
+                mask = 0
+
+                for word in text.split():
+                    mask |= masks.get(word, 0)
+
+                similarity = text_similarities[text] = _count_bits(mask) / len(bits)
+
+            position = entry // len(self.ATTRIBUTES)
+
+            if similarity >= threshold and similarity > similarities.get(position, 0):
+                similarities[position] = similarity
+
+        best = sorted(similarities, key=lambda p: (-similarities[p], self._rankings[p]))[:limit]
+
+        return [self._product_ids[position] for position in best]
+
+
+# Trigram index of this worker, for the databases without `pg_trgm`.
+trigram_index = IndexHolder('trigrams', TrigramIndex.build)
@@ -0,0 +1,100 @@
+import logging
+import pickle
+from threading import Lock, Thread
+from time import monotonic
+from typing import Callable
+
+from django.db import connections
+
+from product.models import SearchIndexSnapshot
+from product.search.cache import SearchCache
+
+logger = logging.getLogger(__name__)
+
+
+class IndexHolder:
+    """Hold an in-memory index of the worker, loaded in the background.
+
+    The indexes are built by `populate` once the products are imported and
+    saved as snapshots in the database, which the workers load. The latest
+    snapshot is loaded once the search cache has been invalidated (after
+    `populate` or a reindex), or once the index is older than `MAX_AGE`
+    seconds as the generation of an unshared cache doesn't follow the
+    imports of other processes. Without any snapshot yet, the index is
+    built from the database instead.
+
+    Requests never wait for an index: they keep the previous one while the
+    next one is loaded in a background thread, and get None until then.
+
+    Attributes:
+        name: The name of the snapshots of the index.
+        index: The current index, None until the first load.
+    """
+    # Maximum age of the index in seconds.
+    MAX_AGE = 3600
+
+    def __init__(self, name: str, build: Callable):
+        """Hold the indexes named `name`, returned by `build` (called without arguments) without snapshot."""
+        self.name = name
+        self.index = None
+        self._build = build
+        self._loaded_at = None
+        self._generation = None
+        # Last update of the snapshot the index has been loaded from.
+        self._snapshot_updated_at = None
+        self._loading = False
+        self._lock = Lock()
+
+    def get(self):
+        generation = SearchCache().get_generation()
+
+        if self.index is None or self._generation != generation or monotonic() - self._loaded_at >= self.MAX_AGE:
+            with self._lock:
+                loading, self._loading = self._loading, True
+
+            if not loading:
+                Thread(target=self._load_in_background, args=(generation,), daemon=True).start()
+
+        return self.index
+
+    def load(self, generation: str = None) -> None:
+        """Load the latest snapshot of the index, or build the index when there is none."""
+        generation = generation or SearchCache().get_generation()
+        # The pickled index is only fetched when it changed.
+        snapshot = SearchIndexSnapshot.objects.filter(name=self.name).defer('data').first()
+
+        if snapshot is None:
+            index = self._build()
+        elif self.index is not None and snapshot.updated_at == self._snapshot_updated_at:
+            index = self.index
+        else:
+            index = pickle.loads(snapshot.data)
+
+        self.index, self._loaded_at, self._generation = index, monotonic(), generation
+        self._snapshot_updated_at = snapshot and snapshot.updated_at
+
+    def read_snapshot(self):
+        """Get the index of the latest snapshot, or None."""
+        data = SearchIndexSnapshot.objects.filter(name=self.name).values_list('data', flat=True).first()
+
+        return None if data is None else pickle.loads(data)
+
+    def save_snapshot(self, index) -> None:
+        """Save an index as the latest snapshot, to be loaded by the workers."""
+        SearchIndexSnapshot.objects.update_or_create(
+            name=self.name, defaults={'data': pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL)},
+        )
+
+    def clear(self) -> None:
+        """Forget the current index so the next one is loaded from scratch."""
+        self.index, self._snapshot_updated_at = None, None
+
+    def _load_in_background(self, generation):
+        try:
+            self.load(generation)
+        except Exception:
+            logger.exception("Failed to load the %s index.", self.name)
+        finally:
+            self._loading = False
+            # Connections are only closed by Django in the threads of the requests.
+            connections.close_all()
@@ -0,0 +1,186 @@
+import re
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from django.db.models import Count
+
+from product.models import Category, Product
+from product.search.holder import IndexHolder
+from product.search.text import fold, tokenize
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Get the Damerau-Levenshtein distance (optimal string alignment) of two words,
+    or `max_distance + 1` as soon as it exceeds `max_distance`."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous, current = None, list(range(len(b) + 1))
+
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+
+        if min(current) > max_distance:
+            return max_distance + 1
+
+    return current[-1]
+
+
+class SpellingIndex:
+    """Symmetric delete dictionary of the words of the product names, brands and category names.
+
+    Every word of the vocabulary is indexed by the strings obtained by deleting
+    up to `MAX_DISTANCE` of its characters. A misspelled word and its correction
+    then share a delete, so the candidates of a correction are only looked up
+    for the deletes of the misspelled word instead of scanning the vocabulary.
+    Only the first `PREFIX_LENGTH` characters of the words are indexed.
+
+    To keep the index compact, the deletes are not stored: each one is an
+    entry of a sorted array of 64 bits integers, made of a hash of the delete
+    and of the position of its word. Hash collisions only add candidates,
+    which are discarded once their actual distance is known. The hashes
+    don't depend on the process, so the index is built once by `populate`.
+    """
+    # Maximum number of typos corrected in a word.
+    MAX_DISTANCE = 2
+    # Number of first characters of the words which are indexed.
+    PREFIX_LENGTH = 7
+    # Minimum lengths of the words getting one, then two typos corrected.
+    MIN_LENGTHS = (3, 6)
+
+    _WORD_BITS = 24
+
+    def __init__(self, words):
+        """Index words given as (text, frequency) pairs, the frequency of a repeated word adding up."""
+        frequencies, spellings = Counter(), defaultdict(Counter)
+
+        for text, frequency in words:
+            for word in re.findall(r'[^\W_]+', text.lower()):
+                key = fold(word)
+                frequencies[key] += frequency
+                spellings[key][word] += frequency
+
+        self._words = sorted(frequencies)
+        self._frequencies = array('L', (frequencies[word] for word in self._words))
+        # Most frequent spelling of the words, when it has accents.
+        self._spellings = {}
+
+        for word, counts in spellings.items():
+            spelling = counts.most_common(1)[0][0]
+
+            if spelling != word:
+                self._spellings[word] = spelling
+
+        if len(self._words) >= 1 << self._WORD_BITS:
+            raise ValueError(f"Too many words to index: {len(self._words)}.")
+
+        self._entries = array('Q', sorted(
+            (self._hash(delete) << self._WORD_BITS) | position
+            for position, word in enumerate(self._words)
+            for delete in self._deletes(word)
+        ))
+
+    def __len__(self):
+        return len(self._words)
+
+    def __contains__(self, word: str) -> bool:
+        position = bisect_left(self._words, word)
+
+        return position < len(self._words) and self._words[position] == word
+
+    @classmethod
+    def build(cls):
+        """Build the index from the products and categories of the database."""
+        products = Product.objects.values_list('name', 'brands')
+        categories = (
+            Category.objects.filter(product__isnull=False)
+            .annotate(popularity=Count('product'))
+            .values_list('name', 'popularity')
+        )
+        words = []
+
+        for name, brands in products.iterator():
+            words.append((name, 1))
+            words.append((brands or '', 1))
+
+        words.extend(categories)
+
+        return cls(words)
+
+    def correct(self, query: str):
+        """Get the query with its unknown words replaced by their most likely correction,
+        or None when there is nothing to correct."""
+        words = tokenize(query)
+        corrections = [self.correct_word(word) for word in words]
+
+        if corrections == words:
+            return None
+
+        return ' '.join(self._spellings.get(word, word) for word in corrections)
+
+    def correct_word(self, word: str) -> str:
+        """Get the closest word of the vocabulary to a folded word, the most frequent one on ties,
+        or the word itself when it is known or nothing is close enough."""
+        max_distance = self._get_max_distance(word)
+
+        if not max_distance or word in self:
+            return word
+
+        best, best_key = word, None
+        seen = set()
+
+        for delete in self._deletes(word, max_distance):
+            hashed = self._hash(delete) << self._WORD_BITS
+            start = bisect_left(self._entries, hashed)
+            end = bisect_left(self._entries, hashed + (1 << self._WORD_BITS), lo=start)
+
+            for entry in self._entries[start:end]:
+                position = entry & ((1 << self._WORD_BITS) - 1)
+
+                if position in seen:
+                    continue
+
+                seen.add(position)
+                candidate = self._words[position]
+                distance = edit_distance(word, candidate, max_distance)
+
+                if distance <= max_distance:
+                    key = (distance, -self._frequencies[position], candidate)
+
+                    if best_key is None or key < best_key:
+                        best, best_key = candidate, key
+
+        return best
+
+    def _get_max_distance(self, word: str) -> int:
+        return min(sum(len(word) >= length for length in self.MIN_LENGTHS), self.MAX_DISTANCE)
+
+    def _deletes(self, word: str, max_distance: int = MAX_DISTANCE) -> set:
+        """Get the strings obtained by deleting up to `max_distance` characters of the prefix of a word."""
+        prefix = word[:self.PREFIX_LENGTH]
+        deletes = {prefix}
+
+        for n in range(1, min(max_distance, len(prefix)) + 1):
+            for positions in combinations(range(len(prefix)), n):
+                deletes.add(''.join(c for i, c in enumerate(prefix) if i not in positions))
+
+        return deletes
+
+    @staticmethod
+    def _hash(delete: str) -> int:
+        # Unlike `hash`, CRC32 gives the same hashes in every process.
+        return zlib.crc32(delete.encode())
+
+
+# Spelling index of this worker.
+spelling_index = IndexHolder('spelling', SpellingIndex.build)
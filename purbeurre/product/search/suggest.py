@@ -0,0 +1,225 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from itertools import chain
+
+from django.db.models import Count, Min
+
+from product.models import Category, Product
+from product.search.holder import IndexHolder
+from product.search.text import fold
+
+
+class SuggestionIndex:
+    """Prefix index of the product names, brands and category names.
+
+    Suggestions are kept in a sorted array of their folded texts, so the
+    suggestions starting with a prefix are found with two binary searches.
+    They are ranked by the best nutriscore of their products, then by their
+    popularity (the number of products they describe). The best suggestions
+    of the shortest prefixes, which match the most texts, are precomputed.
+
+    The popularity of each suggestion is kept per nutriscore grade, so the
+    index can be updated with the imported products instead of being rebuilt.
+    """
+    PRODUCT = 'product'
+    BRAND = 'brand'
+    CATEGORY = 'category'
+    KINDS = (PRODUCT, BRAND, CATEGORY)
+    GRADES = ('a', 'b', 'c', 'd', 'e')
+
+    # Maximum number of suggestions returned.
+    MAX_SUGGESTIONS = 20
+    # Length up to which the best suggestions of a prefix are precomputed.
+    PRECOMPUTED_PREFIX_LENGTH = 2
+
+    # Unknown grades count after the others.
+    _WIDTH = len(GRADES) + 1
+    _POPULARITY_BITS = 32
+
+    def __init__(self, suggestions):
+        """Index suggestions given as (text, kind, nutriscore grade, popularity) tuples."""
+        entries = {}
+        self._count(entries, suggestions)
+        self._clear()
+
+        for key, (text, counts) in sorted(entries.items()):
+            if any(counts):
+                self._append(key, text, counts)
+
+        self._precompute()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @classmethod
+    def build(cls):
+        """Build the index from the products and categories of the database."""
+        products = Product.objects.values_list('name', 'brands', 'nutriscore_grade')
+        suggestions = cls._get_product_suggestions(products.iterator())
+
+        return cls(chain(suggestions, cls._get_category_suggestions()))
+
+    def update(self, removed, added) -> 'SuggestionIndex':
+        """Get a copy of the index with the suggestions of imported products applied.
+
+        Args:
+            removed: The previous (name, brands, nutriscore grade) of the updated products.
+            added: The (name, brands, nutriscore grade) of the updated and inserted products.
+
+        The category suggestions depend on every product of the categories,
+        and there are few of them, so they are rebuilt from the database.
+        Only the changed suggestions are counted again, the others are copied.
+        """
+        changes, categories = {}, {}
+        self._count(changes, self._get_product_suggestions(removed, popularity=-1))
+        self._count(changes, self._get_product_suggestions(added))
+        self._count(categories, self._get_category_suggestions())
+        category = self.KINDS.index(self.CATEGORY)
+        dropped = {i for i, kind in enumerate(self._kinds) if kind == category}
+        entries = []
+
+        for (key, kind), (text, delta) in changes.items():
+            i = self._find(key, kind)
+
+            if i < len(self) and (self._keys[i], self._kinds[i]) == (key, self.KINDS.index(kind)):
+                dropped.add(i)
+                text, previous = self._texts[i], self._grade_counts[i * self._WIDTH:(i + 1) * self._WIDTH]
+                delta = [count + change for count, change in zip(previous, delta)]
+
+            if any(count > 0 for count in delta):
+                entries.append(((key, kind), text, [max(count, 0) for count in delta]))
+
+        entries.extend((key, text, counts) for key, (text, counts) in categories.items() if any(counts))
+        dropped = sorted(dropped)
+        index = self.__class__.__new__(self.__class__)
+        index._clear()
+        start = 0
+
+        for key, text, counts in sorted(entries):
+            end = self._find(*key)
+            index._copy(self, start, end, dropped)
+            index._append(key, text, counts)
+            start = end
+
+        index._copy(self, start, len(self), dropped)
+        index._precompute()
+
+        return index
+
+    def suggest(self, query: str, limit: int = 10) -> list:
+        """Get the best suggestions starting with the query, as dicts of their text and kind."""
+        prefix = ' '.join(fold(query).split())
+        limit = min(limit, self.MAX_SUGGESTIONS)
+
+        if not prefix:
+            return []
+
+        if len(prefix) <= self.PRECOMPUTED_PREFIX_LENGTH:
+            best = self._best.get(prefix, [])[:limit]
+        else:
+            best = self._get_best(prefix, limit)
+
+        return [{'text': self._texts[i], 'kind': self.KINDS[self._kinds[i]]} for i in best]
+
+    @classmethod
+    def _get_product_suggestions(cls, products, popularity=1):
+        """Get the suggestions of products given as (name, brands, nutriscore grade) tuples."""
+        for name, brands, grade in products:
+            yield name, cls.PRODUCT, grade, popularity
+
+            for brand in (brands or '').split(','):
+                yield brand, cls.BRAND, grade, popularity
+
+    @classmethod
+    def _get_category_suggestions(cls):
+        categories = (
+            Category.objects.filter(product__isnull=False)
+            .annotate(popularity=Count('product'), grade=Min('product__nutriscore_grade'))
+            .values_list('name', 'grade', 'popularity')
+        )
+
+        return ((name, cls.CATEGORY, grade, popularity) for name, grade, popularity in categories)
+
+    def _count(self, entries, suggestions) -> None:
+        """Add the popularity of the suggestions to the entries, which map each (folded text, kind) pair
+        to its text and its popularity per nutriscore grade."""
+        for text, kind, grade, popularity in suggestions:
+            key = ' '.join(fold(text).split())
+
+            if not key:
+                continue
+
+            # Texts which only differ by their case or accents are merged.
+            entry = entries.get((key, kind))
+
+            if entry is None:
+                entry = entries[(key, kind)] = (text.strip(), [0] * self._WIDTH)
+
+            entry[1][self.GRADES.index(grade) if grade in self.GRADES else len(self.GRADES)] += popularity
+
+    def _clear(self) -> None:
+        self._keys, self._texts = [], []
+        self._kinds, self._grade_counts = array('B'), array('L')
+        # Score of each suggestion, the lower the better. Suggestions of a same
+        # score are ranked by their folded text, as they are sorted by it.
+        self._scores = array('Q')
+        self._best = {}
+
+    def _append(self, key, text, counts) -> None:
+        """Append a suggestion given by its (folded text, kind) pair, text and popularity per grade,
+        suggestions being appended in the order of their pairs."""
+        max_popularity = (1 << self._POPULARITY_BITS) - 1
+        best_grade = next(grade for grade, count in enumerate(counts) if count)
+        popularity = min(sum(counts), max_popularity)
+
+        self._keys.append(key[0])
+        self._texts.append(text)
+        self._kinds.append(self.KINDS.index(key[1]))
+        self._grade_counts.extend(counts)
+        self._scores.append(best_grade << self._POPULARITY_BITS | max_popularity - popularity)
+
+    def _copy(self, index, start, end, dropped) -> None:
+        """Append the suggestions of another index from `start` to `end`, but the sorted `dropped` positions."""
+        first = bisect_left(dropped, start)
+
+        for stop in chain(dropped[first:bisect_left(dropped, end, lo=first)], [end]):
+            self._keys += index._keys[start:stop]
+            self._texts += index._texts[start:stop]
+            self._kinds += index._kinds[start:stop]
+            self._grade_counts += index._grade_counts[start * self._WIDTH:stop * self._WIDTH]
+            self._scores += index._scores[start:stop]
+            start = stop + 1
+
+    def _find(self, key: str, kind: str) -> int:
+        """Get the position of a suggestion, or where it would be inserted."""
+        i = bisect_left(self._keys, key)
+
+        while i < len(self._keys) and self._keys[i] == key and self.KINDS[self._kinds[i]] < kind:
+            i += 1
+
+        return i
+
+    def _precompute(self) -> None:
+        for length in range(1, self.PRECOMPUTED_PREFIX_LENGTH + 1):
+            start = 0
+
+            while start < len(self._keys):
+                prefix = self._keys[start][:length]
+
+                if len(prefix) < length:
+                    start += 1
+                    continue
+
+                self._best[prefix] = self._get_best(prefix, self.MAX_SUGGESTIONS)
+                start = bisect_left(self._keys, prefix + '\uffff', lo=start)
+
+    def _get_best(self, prefix: str, limit: int) -> list:
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + '\uffff', lo=start)
+
+        return heapq.nsmallest(limit, range(start, end), key=self._scores.__getitem__)
+
+
+# Suggestion index of this worker.
+suggestion_index = IndexHolder('suggestions', SuggestionIndex.build)
@@ -0,0 +1,14 @@
+import re
+import unicodedata
+
+
+def fold(text: str) -> str:
+    """Lowercase a text and remove its accents, e.g. 'Crème Brûlée' becomes 'creme brulee'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: str) -> list:
+    """Split a text into folded words."""
+    return re.findall(r'[^\W_]+', fold(text))
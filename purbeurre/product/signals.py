@@ -0,0 +1,41 @@
+from django.apps import apps
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product, ProductIndexUpdate
+from .search.backends import DatabaseSearchBackend
+
+
+@receiver(post_delete, sender=Product)
+def record_product_deletion(sender, instance, **kwargs):
+    """Remember to remove the deleted product from the Algolia index on the next synchronization.
+
+    Only `algolia_sync` clears the updates, so none are recorded until Algolia is configured.
+    """
+    if not apps.is_installed('algoliasearch_django'):
+        return
+
+    ProductIndexUpdate.objects.create(product_id=instance.pk, action=ProductIndexUpdate.DELETE)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Keep the search document of the saved product up to date.
+
+    Products written in bulk by the imports don't send this signal,
+    their documents are rebuilt by the `populate` command itself.
+    """
+    DatabaseSearchBackend.index_products([instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def index_product_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep the category names of the search documents up to date."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    # On the reverse side, the instance is a category and the products are in `pk_set`.
+    product_ids = pk_set if reverse else [instance.pk]
+
+    if product_ids:
+        DatabaseSearchBackend.index_products(product_ids)
@@ -0,0 +1,25 @@
+// Suggest product names, brands and categories while typing a search query.
+const suggestionList = document.getElementById('query-suggestions')
+const suggestUrl = suggestionList.dataset.url
+let pendingRequest = null
+
+document.querySelectorAll('input[list="query-suggestions"]').forEach(input => {
+    input.addEventListener('input', () => {
+        const query = input.value.trim()
+
+        clearTimeout(pendingRequest)
+
+        if (! query) {
+            suggestionList.replaceChildren()
+            return
+        }
+
+        // Wait for a short pause in the typing before requesting suggestions.
+        pendingRequest = setTimeout(async () => {
+            const response = await fetch(`${suggestUrl}?q=${encodeURIComponent(query)}`)
+            const {suggestions} = await response.json()
+
+            suggestionList.replaceChildren(...suggestions.map(suggestion => new Option(suggestion.text)))
+        }, 150)
+    })
+})
@@ -1,15 +1,33 @@
-from unittest import mock
+import csv
+import gzip
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from io import StringIO
+from unittest import mock, skipUnless
 
+from algoliasearch.exceptions import RequestException
 from django.test import TestCase
-from django.core.management import call_command
+from django.core.management import call_command, load_command_class
+from django.core.management.base import CommandError
+from django.utils.text import slugify
 
-from product.tests.utils import fetch_products_mock, algolia_reindex_fake
-from product.management.commands.populate import Command as PopulateCommand
-from product.models import Product
+from product.benchmark import FakeJsonResponse, OffPayloadGenerator
+from product.tests.utils import (
+    fetch_page_mock, algolia_sync_fake, disable_auto_indexing, get_off_json_fragment, is_algolia_installed,
+)
+from product.management.commands.populate import Command as PopulateCommand, SaveCount
+from product.search.backends import AlgoliaSearchBackend
+from product.search.cache import SearchCache
+from product.search.spelling import spelling_index
+from product.search.suggest import SuggestionIndex, suggestion_index
+from product.search.text import tokenize
+from product.models import Category, ImportCheckpoint, Product, ProductIndexUpdate
+from product.tests.factories import CategoryFactory, ProductFactory
 
 
-@mock.patch.object(PopulateCommand, "_fetch_products",
-                   side_effect=fetch_products_mock, autospec=True)
+@mock.patch.object(PopulateCommand, "_fetch_page",
+                   side_effect=fetch_page_mock, autospec=True)
 class CommandsTestCase(TestCase):
     def test_populate_command(self, _mock: mock.MagicMock):
         """Test the custom command `populate`."""
@@ -23,9 +41,470 @@ class CommandsTestCase(TestCase):
         # For the test, we'll limit the numbers of products
         # and expect an import of eight products.
         with mock.patch(
-                'algoliasearch_django.management.commands.algolia_reindex.Command.handle',
-                new=algolia_reindex_fake
+                'product.management.commands.algolia_sync.Command.handle',
+                new=algolia_sync_fake
         ):
             call_command('populate', *args, **opts)
 
         self.assertEqual(8, Product.objects.count())
+
+    def test_populate_command_timings(self, _mock: mock.MagicMock):
+        """Test that the time spent in each stage is printed and written as JSON."""
+        out = StringIO()
+
+        with TemporaryDirectory() as tmp_dir, mock.patch(
+                'product.management.commands.algolia_sync.Command.handle',
+                new=algolia_sync_fake
+        ):
+            path = Path(tmp_dir) / 'timings.json'
+            call_command('populate', pagesize=4, stdout=out)
+            call_command('populate', pagesize=4, timings_json=str(path), stdout=StringIO())
+            report = json.loads(path.read_text())
+
+        self.assertIn('Rate (/s)', out.getvalue())
+        self.assertEqual(
+            [
+                'fetch', 'decode', 'validation', 'products', 'categories', 'relations', 'documents',
+                # The imported products are only pushed to Algolia once it is configured.
+                *(['reindex'] if is_algolia_installed() else []), 'suggestions', 'spelling', 'trigrams',
+            ],
+            list(report['stages'])
+        )
+        # Two pages of four products, all of them unchanged on the second import.
+        self.assertEqual(2, report['stages']['fetch']['count'])
+        self.assertEqual(8, report['stages']['validation']['count'])
+        self.assertEqual(0, report['stages'].get('reindex', {'count': 0})['count'])
+        self.assertGreaterEqual(report['seconds'], report['stages']['products']['seconds'])
+
+    def test_populate_command_updates_the_suggestion_index(self, _mock: mock.MagicMock):
+        """Test that the imported products are applied to the snapshot of the suggestion index."""
+        async def fetch_renamed_page_mock(command, client, params, page):
+            response = await fetch_page_mock(command, client, params, page)
+            response.json()['products'][0]['product_name'] = "Riz renommé"
+
+            return response
+
+        with mock.patch(
+                'product.management.commands.algolia_sync.Command.handle',
+                new=algolia_sync_fake
+        ):
+            call_command('populate', pagesize=4, stdout=StringIO())
+            name = Product.objects.get(code=get_off_json_fragment(page=1)['products'][0]['code']).name
+
+            self.assertTrue(suggestion_index.read_snapshot().suggest(name))
+
+            _mock.side_effect = fetch_renamed_page_mock
+
+            with mock.patch.object(SuggestionIndex, 'build') as build_mock:
+                call_command('populate', pagesize=4, stdout=StringIO())
+
+        index = suggestion_index.read_snapshot()
+
+        build_mock.assert_not_called()
+        self.assertEqual([{'text': "Riz renommé", 'kind': 'product'}], index.suggest("riz ren"))
+        self.assertEqual([], [s for s in index.suggest(name) if s['text'] == name])
+
+    def test_populate_command_builds_the_spelling_index(self, _mock: mock.MagicMock):
+        """Test that the spelling dictionary is built from the imported products and saved."""
+        with mock.patch(
+                'product.management.commands.algolia_sync.Command.handle',
+                new=algolia_sync_fake
+        ):
+            call_command('populate', pagesize=4, stdout=StringIO())
+
+        word = tokenize(Product.objects.order_by('name').values_list('name', flat=True).first())[0]
+
+        self.assertIn(word, spelling_index.read_snapshot())
+
+    def test_save_products_and_categories_upserts(self, _mock: mock.MagicMock):
+        """Test that importing a page twice updates the products in place."""
+        products = get_off_json_fragment(page=1)['products']
+
+        added = PopulateCommand._save_products_and_categories(products, batch_size=2)
+
+        self.assertEqual(SaveCount(4, 0, 0, Category.objects.count()), added)
+
+        products[0]['nutriscore_grade'] = 'e'
+        products[0]['categories'] += ',Nouvelle catégorie'
+        products[0]['categories_tags'] = products[0]['categories_tags'] + ['fr:nouvelle-categorie']
+
+        added = PopulateCommand._save_products_and_categories(products, batch_size=2)
+        updated_product = Product.objects.get(slug=slugify(products[0]['product_name']))
+
+        self.assertEqual(SaveCount(0, 1, 3, 1), added)
+        self.assertEqual(4, Product.objects.count())
+        self.assertEqual('e', updated_product.nutriscore_grade)
+        self.assertIn('fr:nouvelle-categorie', updated_product.categories.values_list('tag', flat=True))
+
+    def test_save_products_and_categories_unlinks_removed_categories(self, _mock: mock.MagicMock):
+        """Test that the categories removed from an updated product are no longer linked to it."""
+        products = get_off_json_fragment(page=1)['products']
+        PopulateCommand._save_products_and_categories(products)
+
+        removed_tag, *kept_tags = products[0]['categories_tags']
+        products[0]['categories'] = products[0]['categories'].split(',', 1)[1]
+        products[0]['categories_tags'] = kept_tags
+
+        added = PopulateCommand._save_products_and_categories(products, batch_size=2)
+        updated_product = Product.objects.get(code=products[0]['code'])
+
+        self.assertEqual(SaveCount(0, 1, 3, 0), added)
+        self.assertEqual(set(kept_tags), set(updated_product.categories.values_list('tag', flat=True)))
+        # The category still exists for the other products.
+        self.assertTrue(Category.objects.filter(tag=removed_tag).exists())
+
+    def test_save_products_and_categories_identifies_products_by_barcode(self, _mock: mock.MagicMock):
+        """Test that distinct products sharing the same name aren't merged."""
+        products = get_off_json_fragment(page=1)['products'][:2]
+        products[1]['product_name'] = products[0]['product_name']
+
+        added = PopulateCommand._save_products_and_categories(products)
+
+        self.assertEqual(2, added.products_inserted)
+        self.assertEqual(
+            {p['code'] for p in products},
+            set(Product.objects.filter(slug=slugify(products[0]['product_name'])).values_list('code', flat=True))
+        )
+
+    @disable_auto_indexing()
+    def test_save_products_and_categories_adopts_products_without_barcode(self, _mock: mock.MagicMock):
+        """Test that products imported before barcodes were stored are updated in place."""
+        [p] = get_off_json_fragment(page=1)['products'][:1]
+        legacy_product = ProductFactory(code=None, name=p['product_name'], slug=slugify(p['product_name']))
+
+        added = PopulateCommand._save_products_and_categories([p])
+        legacy_product.refresh_from_db()
+
+        self.assertEqual(SaveCount(0, 1, 0, len(p['categories_tags'])), added)
+        self.assertEqual(p['code'], legacy_product.code)
+        self.assertEqual(1, Product.objects.count())
+
+    def test_save_products_and_categories_skips_unchanged_products(self, _mock: mock.MagicMock):
+        """Test that products which didn't change since the last import aren't written again."""
+        products = get_off_json_fragment(page=1)['products']
+        PopulateCommand._save_products_and_categories(products)
+
+        with self.assertNumQueries(1):
+            added = PopulateCommand._save_products_and_categories(products)
+
+        self.assertEqual(SaveCount(0, 0, 4, 0), added)
+
+    def test_populate_command_with_a_failing_page(self, _mock: mock.MagicMock):
+        """Test that a page which can't be fetched stops the import."""
+        async def fetch_page_failure(command, client, params, page):
+            if page == 1:
+                return await fetch_page_mock(command, client, params, page)
+
+            return FakeJsonResponse({}, status=503)
+
+        _mock.side_effect = fetch_page_failure
+
+        with self.assertRaises(CommandError):
+            call_command('populate', pagesize=4, concurrency=2)
+
+        # The first page has been saved and checkpointed before the failure.
+        checkpoint = ImportCheckpoint.objects.get(name=PopulateCommand.CHECKPOINT_NAME)
+
+        self.assertEqual(4, Product.objects.count())
+        self.assertEqual([1], checkpoint.completed_pages)
+        self.assertFalse(checkpoint.is_complete)
+
+    def test_populate_command_with_an_undecodable_page(self, _mock: mock.MagicMock):
+        """Test that a page whose body isn't JSON stops the import instead of blocking it."""
+        async def fetch_page_html(command, client, params, page):
+            if page == 1:
+                return await fetch_page_mock(command, client, params, page)
+
+            response = FakeJsonResponse({})
+            response.json = mock.Mock(side_effect=json.JSONDecodeError("Expecting value", "<html>", 0))
+
+            return response
+
+        _mock.side_effect = fetch_page_html
+
+        with self.assertRaises(CommandError) as context:
+            call_command('populate', pagesize=4, concurrency=2)
+
+        self.assertIsInstance(context.exception.__cause__, json.JSONDecodeError)
+        self.assertEqual(4, Product.objects.count())
+
+    def test_populate_command_resume(self, _mock: mock.MagicMock):
+        """Test that a resumed import only saves the pages not completed yet."""
+        ImportCheckpoint.objects.create(
+            name=PopulateCommand.CHECKPOINT_NAME, page_size=4, completed_pages=[1], is_complete=False
+        )
+
+        with mock.patch(
+                'product.management.commands.algolia_sync.Command.handle',
+                new=algolia_sync_fake
+        ):
+            call_command('populate', resume=True, pagesize=300)
+
+        checkpoint = ImportCheckpoint.objects.get(name=PopulateCommand.CHECKPOINT_NAME)
+
+        # Only the products of the second page have been saved.
+        self.assertEqual(4, Product.objects.count())
+        self.assertEqual(4, _mock.call_args.args[2]['page_size'])
+        self.assertEqual([1, 2], checkpoint.completed_pages)
+        self.assertTrue(checkpoint.is_complete)
+
+
+@mock.patch('product.management.commands.algolia_sync.Command.handle', new=algolia_sync_fake)
+@mock.patch.object(PopulateCommand, "_fetch_page", autospec=True)
+class IncrementalPopulateCommandTests(TestCase):
+    @staticmethod
+    async def fetch_sorted_page_mock(command, client, params, page):
+        """Fetch a fake page whose products are sorted by modification date."""
+        response = await fetch_page_mock(command, client, params, page)
+
+        for i, p in enumerate(response.json()['products']):
+            p['last_modified_t'] = 1000 - 100 * (4 * (page - 1) + i)
+
+        return response
+
+    def test_populate_command_since(self, _mock: mock.MagicMock):
+        """Test that only the products modified after `since` are imported."""
+        _mock.side_effect = self.fetch_sorted_page_mock
+
+        call_command('populate', '--since=650', pagesize=4)
+
+        self.assertEqual(4, Product.objects.count())
+        self.assertEqual('last_modified_t', _mock.call_args.args[2]['sort_by'])
+        self.assertEqual(1000, ImportCheckpoint.objects.get(name=PopulateCommand.CHECKPOINT_NAME).last_modified_t)
+
+    def test_populate_command_incremental(self, _mock: mock.MagicMock):
+        """Test that an incremental import starts from the last checkpoint."""
+        _mock.side_effect = self.fetch_sorted_page_mock
+        ImportCheckpoint.objects.create(name=PopulateCommand.CHECKPOINT_NAME, last_modified_t=850)
+
+        call_command('populate', pagesize=4, incremental=True)
+
+        self.assertEqual(1, _mock.call_count)
+        self.assertEqual(2, Product.objects.count())
+
+
+@mock.patch('product.management.commands.algolia_sync.Command.handle', new=algolia_sync_fake)
+class DumpPopulateCommandTests(TestCase):
+    def setUp(self) -> None:
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = Path(tmp_dir.name)
+        self.products = get_off_json_fragment(page=1)['products'] + get_off_json_fragment(page=2)['products']
+
+        for i, p in enumerate(self.products):
+            p['code'] = str(i)
+            p['last_modified_t'] = 1000 + i
+            p['states_tags'] = ['en:checked']
+            p['countries_tags'] = ['en:france']
+
+        # This one isn't sold in France so it must be ignored.
+        self.products[0]['countries_tags'] = ['en:spain']
+        # This one was never checked so it must be ignored too.
+        del self.products[1]['states_tags']
+
+    def test_populate_command_from_jsonl_dump(self):
+        """Test the import of a gzipped JSONL dump."""
+        path = self.tmp_path / 'products.jsonl.gz'
+
+        with gzip.open(path, 'wt', encoding='utf-8') as file:
+            file.writelines(json.dumps(p) + '\n' for p in self.products)
+
+        call_command('populate', file=str(path), pagesize=3)
+
+        self.assertEqual(6, Product.objects.count())
+        self.assertEqual(1007, ImportCheckpoint.objects.get(name=PopulateCommand.CHECKPOINT_NAME).last_modified_t)
+
+    def test_populate_command_from_csv_dump(self):
+        """Test the import of a CSV dump, whose columns are separated by tabs."""
+        path = self.tmp_path / 'products.csv'
+        columns = ['code', *PopulateCommand._get_fields(), 'states_tags', 'countries_tags']
+
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=columns, delimiter='\t', extrasaction='ignore')
+            writer.writeheader()
+
+            for p in self.products:
+                writer.writerow({
+                    **p,
+                    **{f: ','.join(p.get(f, [])) for f in ('categories_tags', 'states_tags', 'countries_tags')}
+                })
+
+        call_command('populate', file=str(path), pagesize=3)
+
+        self.assertEqual(6, Product.objects.count())
+        self.assertTrue(Product.objects.filter(categories__tag='en:plant-based-foods').exists())
+
+
+@skipUnless(is_algolia_installed(), "Algolia isn't configured.")
+@mock.patch('algoliasearch_django.algolia_engine.client.init_index')
+class AlgoliaSyncCommandTests(TestCase):
+    @disable_auto_indexing()
+    def test_algolia_sync_command(self, init_index_mock: mock.MagicMock):
+        """Test that only the recorded updates are pushed to the index."""
+        index = init_index_mock.return_value
+        saved_product, unchanged_product, deleted_product = ProductFactory.create_batch(3)
+        ProductIndexUpdate.objects.bulk_create([
+            ProductIndexUpdate(product_id=saved_product.pk),
+            ProductIndexUpdate(product_id=deleted_product.pk),
+        ])
+        deleted_product_id = deleted_product.pk
+        deleted_product.delete()
+        cache_key = SearchCache().get_key(AlgoliaSearchBackend(), "riz")
+
+        call_command('algolia_sync')
+
+        [saved_records], _ = index.save_objects.call_args
+        self.assertEqual([str(saved_product.pk)], [str(r['objectID']) for r in saved_records])
+        index.delete_objects.assert_called_once_with([str(deleted_product_id)])
+        self.assertFalse(ProductIndexUpdate.objects.exists())
+        # Cached search responses are expired.
+        self.assertNotEqual(cache_key, SearchCache().get_key(AlgoliaSearchBackend(), "riz"))
+
+    def test_algolia_sync_command_without_updates(self, init_index_mock: mock.MagicMock):
+        """Test that nothing is sent when no product changed."""
+        call_command('algolia_sync')
+
+        init_index_mock.assert_not_called()
+
+    def test_populate_records_index_updates(self, _mock: mock.MagicMock):
+        """Test that the imported products are recorded for the next synchronization."""
+        PopulateCommand._save_products_and_categories(get_off_json_fragment(page=1)['products'])
+
+        self.assertEqual(
+            set(Product.objects.values_list('id', flat=True)),
+            set(ProductIndexUpdate.objects.values_list('product_id', flat=True)),
+        )
+
+
+class WithoutAlgoliaTests(TestCase):
+    def test_algolia_commands_fail_without_algolia(self):
+        for name in ('algolia_sync', 'algolia_reindex', 'algolia_reindex_products'):
+            # Loaded beforehand, as `algolia_reindex` extends the command of `algoliasearch_django` once installed.
+            command = load_command_class('product', name)
+
+            with self.subTest(command=name), mock.patch('django.apps.apps.is_installed', return_value=False):
+                with self.assertRaisesMessage(CommandError, "Algolia isn't configured"):
+                    call_command(command, stdout=StringIO())
+
+    @mock.patch('django.apps.apps.is_installed', return_value=False)
+    def test_index_updates_are_not_recorded_without_algolia(self, _mock: mock.MagicMock):
+        """Test that no update is left for a synchronization which never comes."""
+        PopulateCommand._save_products_and_categories(get_off_json_fragment(page=1)['products'])
+        Product.objects.first().delete()
+
+        self.assertFalse(ProductIndexUpdate.objects.exists())
+
+    @disable_auto_indexing()
+    @mock.patch.object(PopulateCommand, "_fetch_page", autospec=True, side_effect=fetch_page_mock)
+    def test_populate_clears_the_index_updates_without_algolia(self, *_mocks: mock.MagicMock):
+        ProductIndexUpdate.objects.create(product_id=ProductFactory().pk)
+
+        with mock.patch('django.apps.apps.is_installed', return_value=False):
+            call_command('populate', pagesize=4, stdout=StringIO())
+
+        self.assertFalse(ProductIndexUpdate.objects.exists())
+
+
+@skipUnless(is_algolia_installed(), "Algolia isn't configured.")
+class AlgoliaReindexCommandTests(TestCase):
+    @mock.patch('algoliasearch_django.management.commands.algolia_reindex.reindex_all', return_value=0)
+    def test_algolia_reindex_command_expires_the_cached_searches(self, reindex_all_mock: mock.MagicMock):
+        cache_key = SearchCache().get_key(AlgoliaSearchBackend(), "riz")
+
+        call_command('algolia_reindex', stdout=StringIO())
+
+        reindex_all_mock.assert_called_once_with(Product, batch_size=1000)
+        self.assertNotEqual(cache_key, SearchCache().get_key(AlgoliaSearchBackend(), "riz"))
+
+
+@skipUnless(is_algolia_installed(), "Algolia isn't configured.")
+@mock.patch('algoliasearch_django.algolia_engine.client')
+class AlgoliaReindexProductsCommandTests(TestCase):
+    def setUp(self) -> None:
+        # `algoliasearch_django` can't even be imported without the credentials.
+        from algoliasearch_django import get_adapter
+
+        self.adapter = get_adapter(Product)
+        self.indexes = {}
+
+    def init_index(self, name):
+        return self.indexes.setdefault(name, mock.MagicMock(name=name))
+
+    @disable_auto_indexing()
+    def test_algolia_reindex_products_command(self, client_mock: mock.MagicMock):
+        """Test that products are sent in chunks with their categories prefetched."""
+        client_mock.init_index.side_effect = self.init_index
+        adapter = self.adapter
+        tmp_index = self.init_index(adapter.tmp_index_name)
+        self.init_index(adapter.index_name).get_settings.side_effect = RequestException("Index does not exist", 404)
+        products = ProductFactory.create_batch(5, categories=CategoryFactory.create_batch(2))
+        ProductIndexUpdate.objects.create(product_id=products[0].pk)
+
+        # One query for the pending updates, two per chunk (products and their categories),
+        # one for the last empty chunk and one to clear the updates.
+        with self.assertNumQueries(1 + 2 * 3 + 1 + 1):
+            call_command('algolia_reindex_products', chunk_size=2, workers=2)
+
+        records = [r for call in tmp_index.save_objects.call_args_list for r in call.args[0]]
+
+        self.assertEqual(3, tmp_index.save_objects.call_count)
+        self.assertEqual([p.pk for p in products], sorted(r['objectID'] for r in records))
+        self.assertTrue(all(len(r['category_names']) == 2 for r in records))
+        client_mock.move_index.assert_called_once()
+        self.assertFalse(ProductIndexUpdate.objects.exists())
+        # There was no index to keep the rules, synonyms and replicas of.
+        client_mock.copy_index.assert_not_called()
+
+    def test_algolia_reindex_products_command_keeps_the_index_configuration(self, client_mock: mock.MagicMock):
+        """Test that the rules, synonyms and replicas of the current index are kept."""
+        client_mock.init_index.side_effect = self.init_index
+        adapter = self.adapter
+        index = self.init_index(adapter.index_name)
+        index.get_settings.return_value = {'replicas': ["products_by_name"]}
+
+        call_command('algolia_reindex_products', stdout=StringIO())
+
+        self.init_index(adapter.tmp_index_name).set_settings.assert_called_once_with(
+            {**adapter.settings, 'replicas': []}
+        )
+        self.assertEqual(
+            [
+                mock.call.copy_index(adapter.index_name, adapter.tmp_index_name, {'scope': ['rules', 'synonyms']}),
+                mock.call.move_index(adapter.tmp_index_name, adapter.index_name),
+            ],
+            [c for c in client_mock.mock_calls if c[0] in ('copy_index', 'move_index')],
+        )
+        index.set_settings.assert_called_once_with({'replicas': ["products_by_name"]})
+
+
+class BenchmarkPopulateCommandTests(TestCase):
+    def test_off_payload_generator(self):
+        """Test that the generated pages look like the responses of the API."""
+        generator = OffPayloadGenerator(products=25, page_size=10, categories_per_product=4, categories=10)
+        pages = list(generator.pages())
+        products = [p for page in pages for p in page['products']]
+
+        self.assertEqual(3, len(pages))
+        self.assertEqual([10, 10, 5], [len(page['products']) for page in pages])
+        self.assertEqual(25, len({p['code'] for p in products}))
+        self.assertEqual(pages[1], generator.page(2))
+        # Categories are shared between products.
+        self.assertLessEqual(len({tag for p in products for tag in p['categories_tags']}), 10)
+
+        for p in products:
+            self.assertEqual(len(p['categories'].split(',')), len(p['categories_tags']))
+
+    def test_benchmark_populate_command(self):
+        """Test that the benchmark reports its measures and leaves the database untouched."""
+        out = StringIO()
+
+        call_command('benchmark_populate', products=40, pagesize=10, runs=2, json=True, stdout=out)
+        first_run, second_run = json.loads(out.getvalue())
+
+        self.assertGreater(first_run['products_inserted'], 0)
+        self.assertEqual(first_run['products_inserted'], second_run['products_skipped'])
+        self.assertIn('queries_per_product', first_run)
+        self.assertIn('peak_memory_mb', first_run)
+        self.assertEqual(40, first_run['stages']['validation']['count'])
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(ImportCheckpoint.objects.exists())
@@ -0,0 +1,894 @@
+import asyncio
+import json
+from io import StringIO
+from threading import Timer
+from unittest import mock, skipUnless
+
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import call_command
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+
+from product.index import get_record
+from product.models import Product, ProductSearchDocument
+from product.search import RESULT_PARAMS, asearch, breaker
+from product.search.algolia import _clients, _get_client, araw_search, encode_params
+from product.search.backends import DatabaseSearchBackend
+from product.search.cache import SearchCache
+from product.search.fuzzy import TrigramIndex, trigram_index, trigrams
+from product.search.holder import IndexHolder
+from product.search.spelling import SpellingIndex, edit_distance, spelling_index
+from product.search.suggest import SuggestionIndex, suggestion_index
+from product.search.text import fold, tokenize
+from purbeurre.utils import CircuitBreaker
+from .factories import CategoryFactory, ProductFactory
+from .utils import clear_search_caches, disable_auto_indexing, is_algolia_installed
+
+
+class SearchTextTests(TestCase):
+    def test_fold(self):
+        """Test that texts are lowercased and stripped of their accents."""
+        self.assertEqual("creme brulee a l'ancienne", fold("Crème Brûlée à l'Ancienne"))
+        self.assertEqual('', fold(None))
+
+    def test_tokenize(self):
+        self.assertEqual(['pate', 'a', 'tartiner', '100'], tokenize("Pâte à tartiner (100%)"))
+
+
+class DatabaseSearchBackendTests(TestCase):
+    @classmethod
+    @disable_auto_indexing()
+    def setUpTestData(cls):
+        cls.basmati = ProductFactory(name="Riz Basmati", nutriscore_grade='b', brands="Cora")
+        cls.wholegrain = ProductFactory(name="Riz complet", nutriscore_grade='c', brands="Taureau Ailé")
+        # The brands are set, as random ones may be similar to the misspelled queries.
+        cls.cake = ProductFactory(
+            name="Galettes", generic_name="Galettes de riz soufflé", nutriscore_grade='a', brands="Gerblé"
+        )
+        cls.paella = ProductFactory(
+            name="Paëlla", generic_name=None, nutriscore_grade='a', brands="Tipiak",
+            categories=(CategoryFactory(name="Plats à base de riz"),),
+        )
+        cls.pasta = ProductFactory(name="Pâtes", generic_name=None, nutriscore_grade='a', brands="Barilla")
+        cls.pate = ProductFactory(name="Pâté de campagne", generic_name=None, nutriscore_grade='d', brands="Hénaff")
+
+    def setUp(self) -> None:
+        trigram_index.clear()
+        self.addCleanup(trigram_index.clear)
+        trigram_index.load()
+        self.backend = DatabaseSearchBackend()
+
+    def search_names(self, query, **params):
+        return [hit['name'] for hit in self.backend.search(query, params)['hits']]
+
+    def test_search_ranking(self):
+        """Test that hits are ranked by matching attribute, then by nutriscore and name."""
+        self.assertEqual(
+            ["Riz Basmati", "Riz complet", "Galettes", "Paëlla"], self.search_names("riz")
+        )
+
+    @skipUnless(is_algolia_installed(), "Algolia isn't configured.")
+    def test_hits_are_the_algolia_records(self):
+        """Test that the records built without Algolia are the ones pushed to its index."""
+        from algoliasearch_django import get_adapter
+
+        self.assertEqual(get_adapter(Product).get_raw_record(self.paella), get_record(self.paella))
+
+    @mock.patch.object(DatabaseSearchBackend, 'FUZZY_MIN_HITS', 0)
+    def test_search_is_accent_and_case_insensitive(self):
+        self.assertEqual(["Paëlla"], self.search_names("PAELLA"))
+        self.assertEqual(["Pâtes"], self.search_names("pates"))
+        self.assertEqual(["Riz complet"], self.search_names("taureau aile"))
+
+    @mock.patch.object(DatabaseSearchBackend, 'FUZZY_MIN_HITS', 0)
+    def test_search_matches_every_word_and_the_last_one_as_prefix(self):
+        self.assertEqual(["Riz Basmati"], self.search_names("riz basm"))
+        self.assertEqual(["Galettes"], self.search_names("riz souffle"))
+        self.assertEqual([], self.search_names("bas riz"))
+        self.assertEqual([], self.search_names("  ,;  "))
+
+    def test_search_tolerates_typos(self):
+        """Test that products similar to the query are found when few products match it."""
+        self.assertEqual(["Riz Basmati"], self.search_names("basmatti"))
+        self.assertEqual(["Galettes"], self.search_names("galete"))
+        self.assertEqual("Riz Basmati", self.search_names("bas riz")[0])
+        # Products matching the query come first.
+        self.assertEqual(["Pâtes", "Pâté de campagne"], self.search_names("pates"))
+        self.assertEqual(2, self.backend.search("pates", {'hitsPerPage': 1})['nbPages'])
+
+    def test_search_response(self):
+        """Test that the response has the format of Algolia responses."""
+        response = self.backend.search("riz", {'hitsPerPage': 3, 'page': 1})
+
+        self.assertEqual(4, response['nbHits'])
+        self.assertEqual(2, response['nbPages'])
+        self.assertEqual(1, response['page'])
+        self.assertEqual(3, response['hitsPerPage'])
+
+        [hit] = response['hits']
+
+        self.assertEqual(str(self.paella.pk), hit['objectID'])
+        self.assertEqual(['Plats à base de riz'], hit['category_names'])
+
+        for field in ('name', 'generic_name', 'brands', 'nutriscore_grade', 'image_url', 'image_small_url'):
+            self.assertIn(field, hit)
+
+    def test_search_response_projection(self):
+        """Test that only the requested attributes and response fields are returned."""
+        response = self.backend.search("riz basmati", RESULT_PARAMS)
+
+        self.assertEqual({'hits', 'nbHits', 'page', 'nbPages', 'hitsPerPage'}, set(response))
+        self.assertEqual(
+            [{
+                'objectID': str(self.basmati.pk),
+                'name': "Riz Basmati",
+                'nutriscore_grade': 'b',
+                'image_small_url': self.basmati.image_small_url,
+            }],
+            response['hits'],
+        )
+
+    @disable_auto_indexing()
+    def test_search_documents_follow_the_products(self):
+        """Test that documents are updated along with the products and their categories."""
+        self.pasta.name = "Pâtes au riz"
+        self.pasta.save()
+        self.assertIn("Pâtes au riz", self.search_names("riz"))
+
+        self.paella.categories.clear()
+        self.assertNotIn("Paëlla", self.search_names("riz"))
+
+        CategoryFactory(name="Riz").product_set.add(self.paella)
+        self.assertIn("Paëlla", self.search_names("riz"))
+
+        self.basmati.delete()
+        self.assertNotIn("Riz Basmati", self.search_names("riz"))
+        self.assertFalse(ProductSearchDocument.objects.filter(product_id=self.basmati.pk).exists())
+
+
+@override_settings(SEARCH_BACKEND='product.search.backends.DatabaseSearchBackend')
+class DatabaseSearchViewTests(TestCase):
+    def setUp(self) -> None:
+        clear_search_caches()
+
+    @disable_auto_indexing()
+    def test_search_request_with_the_database_backend(self):
+        products = [ProductFactory(name=f"Riz n°{i}") for i in range(8)]
+
+        response = self.client.get(reverse('product:search') + '?query=riz&page=2')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([p.name for p in products[6:]], [p['name'] for p in response.context['products']])
+        self.assertEqual(2, response.context['meta']['last_page'])
+        self.assertEqual(8, response.context['meta']['total'])
+
+    async def test_search_request_through_asgi(self):
+        with disable_auto_indexing():
+            await sync_to_async(ProductFactory)(name="Riz Basmati")
+
+        response = await self.async_client.get(reverse('product:search') + '?query=riz')
+
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, "Riz Basmati")
+
+
+@override_settings(SEARCH_BACKEND='product.search.backends.DatabaseSearchBackend')
+class BenchmarkSearchCommandTests(TestCase):
+    @disable_auto_indexing()
+    def test_benchmark_search_command(self):
+        for i in range(6):
+            ProductFactory(name=f"Riz n°{i}", categories=(CategoryFactory(),))
+
+        out = StringIO()
+        call_command('benchmark_search', '--query', "riz", '--runs', 2, '--json', stdout=out)
+        results = json.loads(out.getvalue())
+
+        self.assertEqual({'full', 'lean'}, set(results))
+        self.assertLess(results['lean']['bytes'], results['full']['bytes'] / 2)
+
+        out = StringIO()
+        call_command('benchmark_search', '--query', "riz", '--runs', 2, stdout=out)
+
+        self.assertIn("smaller", out.getvalue())
+
+
+@override_settings(SEARCH_FALLBACK_BACKEND=None)
+@mock.patch('product.search.get_backend')
+class SearchCacheTests(TestCase):
+    def setUp(self) -> None:
+        clear_search_caches()
+        self.cache = SearchCache()
+        self.search = async_to_sync(asearch)
+
+    def test_equivalent_queries_share_a_response(self, get_backend_mock: mock.MagicMock):
+        """Test that queries differing by their case, accents or whitespaces are searched once."""
+        backend = get_backend_mock.return_value
+        backend.asearch = mock.AsyncMock(return_value={'hits': [], 'nbHits': 0})
+
+        for query in ("riz", "Riz ", "RIZ", "  rïz"):
+            self.assertEqual({'hits': [], 'nbHits': 0}, self.search(query, {'page': 0, 'hitsPerPage': 6}))
+
+        backend.asearch.assert_awaited_once_with("riz", {'page': 0, 'hitsPerPage': 6})
+        self.assertEqual({'hits': 3, 'misses': 1, 'hit_rate': 0.75}, self.cache.stats())
+
+        self.search("riz", {'page': 1, 'hitsPerPage': 6})
+        self.search("riz", {'page': 0, 'hitsPerPage': 12})
+
+        self.assertEqual(3, backend.asearch.await_count)
+
+    def test_invalidate(self, get_backend_mock: mock.MagicMock):
+        backend = get_backend_mock.return_value
+        backend.asearch = mock.AsyncMock(return_value={'hits': []})
+
+        self.search("riz")
+        self.cache.invalidate()
+        self.search("riz")
+
+        self.assertEqual(2, backend.asearch.await_count)
+
+    def test_failed_searches_are_not_cached(self, get_backend_mock: mock.MagicMock):
+        backend = get_backend_mock.return_value
+        backend.asearch = mock.AsyncMock(return_value=None)
+
+        self.search("riz")
+        self.search("riz")
+
+        self.assertEqual(2, backend.asearch.await_count)
+
+    @override_settings(CACHES={
+        'search': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'lru',
+            'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 10},
+        },
+        'search_stale': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'lru_stale'},
+        'search_state': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'lru_state'},
+    })
+    def test_least_recently_used_responses_are_evicted(self, get_backend_mock: mock.MagicMock):
+        async def echo_search(query, params):
+            return {'query': query}
+
+        backend = get_backend_mock.return_value
+        backend.asearch = mock.AsyncMock(side_effect=echo_search)
+        generation = SearchCache().get_generation()
+
+        # A popular query stays cached while the others get evicted.
+        for i in range(20):
+            self.search(f"query {i}")
+            self.search("riz")
+
+        searched_queries = [c.args[0] for c in backend.asearch.await_args_list]
+        self.search("query 0")
+
+        self.assertEqual(1, searched_queries.count("riz"))
+        self.assertEqual(22, backend.asearch.await_count)
+        # Neither the generation nor the counters are evicted along with the responses.
+        self.assertEqual(generation, SearchCache().get_generation())
+        self.assertEqual({'hits': 19, 'misses': 22, 'hit_rate': 0.463}, SearchCache().stats())
+
+    def test_search_cache_stats_command(self, get_backend_mock: mock.MagicMock):
+        get_backend_mock.return_value.asearch = mock.AsyncMock(return_value={'hits': []})
+        out = StringIO()
+        self.search("riz")
+        self.search("riz")
+
+        call_command('search_cache_stats', reset=True, stdout=out)
+
+        self.assertIn("1 hits, 1 misses (hit rate: 50.0%)", out.getvalue())
+        self.assertEqual({'hits': 0, 'misses': 0, 'hit_rate': None}, self.cache.stats())
+
+
+@override_settings(SEARCH_FALLBACK_BACKEND=None)
+@mock.patch('product.search.get_backend')
+class SearchCoalescingTests(TestCase):
+    def setUp(self) -> None:
+        clear_search_caches()
+        self.cache = SearchCache()
+
+    def test_concurrent_identical_searches_share_a_call(self, get_backend_mock: mock.MagicMock):
+        async def slow_search(query, params):
+            await asyncio.sleep(0.1)
+            return {'query': query}
+
+        backend = get_backend_mock.return_value
+        backend.asearch = mock.AsyncMock(side_effect=slow_search)
+
+        async def search_concurrently():
+            return await asyncio.gather(*(asearch("Riz", {'page': 0}) for _ in range(50)))
+
+        self.assertEqual([{'query': "Riz"}] * 50, async_to_sync(search_concurrently)())
+        backend.asearch.assert_awaited_once()
+
+        # The response is cached for the next searches.
+        self.assertEqual({'query': "Riz"}, async_to_sync(asearch)("riz", {'page': 0}))
+        backend.asearch.assert_awaited_once()
+
+    def test_concurrent_searches_share_the_error(self, get_backend_mock: mock.MagicMock):
+        async def failing_search(query, params):
+            await asyncio.sleep(0.1)
+            raise ConnectionError
+
+        backend = get_backend_mock.return_value
+        backend.asearch = mock.AsyncMock(side_effect=failing_search)
+
+        async def search_concurrently():
+            return await asyncio.gather(*(asearch("riz") for _ in range(4)), return_exceptions=True)
+
+        errors = async_to_sync(search_concurrently)()
+
+        backend.asearch.assert_awaited_once()
+        self.assertTrue(all(isinstance(e, ConnectionError) for e in errors))
+        self.assertIsNone(self.cache.cache.get(f"{self.cache.get_key(backend, 'riz')}:lock"))
+
+    def test_cancelled_search_hands_the_call_over(self, get_backend_mock: mock.MagicMock):
+        """Test that the searches sharing the call of a cancelled one still get the response."""
+        async def slow_search(query, params):
+            await asyncio.sleep(0.1)
+            return {'query': query}
+
+        backend = get_backend_mock.return_value
+        backend.asearch = mock.AsyncMock(side_effect=slow_search)
+
+        async def search_and_disconnect():
+            first = asyncio.ensure_future(asearch("riz"))
+            await asyncio.sleep(0.05)
+            others = asyncio.gather(*(asearch("riz") for _ in range(3)))
+            await asyncio.sleep(0.01)
+            first.cancel()
+
+            return await others, first.cancelled()
+
+        responses, cancelled = async_to_sync(search_and_disconnect)()
+
+        self.assertTrue(cancelled)
+        self.assertEqual([{'query': "riz"}] * 3, responses)
+        # A single follower searched again.
+        self.assertEqual(2, backend.asearch.await_count)
+
+    def test_search_waits_for_the_response_of_another_worker(self, get_backend_mock: mock.MagicMock):
+        backend = get_backend_mock.return_value
+        backend.asearch = mock.AsyncMock()
+        key = self.cache.get_key(backend, "riz")
+        # Another worker is searching the response.
+        self.cache.lock(key)
+        Timer(0.1, self.cache.set, args=(key, {'query': "riz"})).start()
+
+        self.assertEqual({'query': "riz"}, async_to_sync(asearch)("riz"))
+        backend.asearch.assert_not_awaited()
+
+    @mock.patch.object(SearchCache, 'LOCK_TIMEOUT', 0.2)
+    def test_search_once_the_other_worker_is_too_slow(self, get_backend_mock: mock.MagicMock):
+        backend = get_backend_mock.return_value
+        backend.asearch = mock.AsyncMock(return_value={'query': "riz"})
+        self.cache.lock(self.cache.get_key(backend, "riz"))
+
+        self.assertEqual({'query': "riz"}, async_to_sync(asearch)("riz"))
+        backend.asearch.assert_awaited_once()
+
+
+@override_settings(
+    SEARCH_BACKEND='product.search.backends.AlgoliaSearchBackend',
+    SEARCH_FALLBACK_BACKEND='product.search.backends.DatabaseSearchBackend',
+    SEARCH_DEADLINE=0.1,
+)
+@mock.patch('product.search.backends.AlgoliaSearchBackend.asearch')
+class SearchFallbackTests(TestCase):
+    @classmethod
+    @disable_auto_indexing()
+    def setUpTestData(cls):
+        ProductFactory(name="Riz Basmati")
+
+    def setUp(self) -> None:
+        clear_search_caches()
+        breaker.reset()
+        self.addCleanup(breaker.reset)
+        # The typos aren't tolerated, as the trigram index isn't loaded in the background during the tests.
+        patcher = mock.patch('product.search.holder.Thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search_names(self, query):
+        with self.assertLogs('product.search', level='WARNING'):
+            response = async_to_sync(asearch)(query)
+
+        return [hit['name'] for hit in response['hits']]
+
+    def test_slow_search_falls_back_to_the_database(self, asearch_mock: mock.AsyncMock):
+        async def slow_search(query, params):
+            await asyncio.sleep(1)
+
+        asearch_mock.side_effect = slow_search
+
+        self.assertEqual(["Riz Basmati"], self.search_names("riz"))
+
+    def test_failed_search_falls_back_to_the_stale_response(self, asearch_mock: mock.AsyncMock):
+        asearch_mock.return_value = {'hits': [{'name': "Riz Thaï"}]}
+        async_to_sync(asearch)("riz")
+        SearchCache().invalidate()
+
+        asearch_mock.side_effect = ConnectionError
+
+        self.assertEqual(["Riz Thaï"], self.search_names("riz"))
+        # Searches without stale response fall back to the database.
+        self.assertEqual(["Riz Basmati"], self.search_names("riz basmati"))
+
+    @mock.patch.multiple(breaker, min_calls=2, reset_timeout=60)
+    def test_backend_is_not_called_while_the_breaker_is_open(self, asearch_mock: mock.AsyncMock):
+        asearch_mock.side_effect = ConnectionError
+
+        self.search_names("riz")
+        self.search_names("riz basmati")
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+
+        response = async_to_sync(asearch)("basmati")
+
+        self.assertEqual(["Riz Basmati"], [hit['name'] for hit in response['hits']])
+        self.assertEqual(2, asearch_mock.await_count)
+
+    @mock.patch.multiple(breaker, min_calls=3, reset_timeout=60)
+    def test_concurrent_searches_are_a_single_call_of_the_breaker(self, asearch_mock: mock.AsyncMock):
+        async def failing_search(query, params):
+            await asyncio.sleep(0.01)
+            raise ConnectionError
+
+        async def search_twice():
+            return await asyncio.gather(asearch("riz"), asearch("riz"))
+
+        asearch_mock.return_value = {'hits': [{'name': "Riz Thaï"}]}
+        async_to_sync(asearch)("riz")
+        SearchCache().invalidate()
+        asearch_mock.side_effect = failing_search
+
+        with self.assertLogs('product.search', level='WARNING'):
+            responses = async_to_sync(search_twice)()
+
+        self.assertEqual([asearch_mock.return_value] * 2, responses)
+        self.assertEqual(2, asearch_mock.await_count)
+        # A success and a single failure, which would trip the breaker if counted twice.
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+
+    @mock.patch.multiple(breaker, min_calls=1, reset_timeout=0)
+    def test_cancelled_trial_search_lets_another_one_through(self, asearch_mock: mock.AsyncMock):
+        async def slow_search(query, params):
+            await asyncio.sleep(1)
+
+        async def cancelled_search():
+            task = asyncio.ensure_future(asearch("riz basmati"))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        asearch_mock.side_effect = ConnectionError
+        self.search_names("riz")
+        self.assertEqual(CircuitBreaker.HALF_OPEN, breaker.state)
+
+        asearch_mock.side_effect = slow_search
+        async_to_sync(cancelled_search)()
+
+        self.assertEqual(2, asearch_mock.await_count)
+        self.assertIsNotNone(breaker.allow())
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self) -> None:
+        self.breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=4, reset_timeout=30)
+
+    def test_breaker_opens_once_too_many_calls_failed(self):
+        for failed in (True, False, False, True):
+            ticket = self.breaker.allow()
+            self.assertIsNotNone(ticket)
+            self.breaker.record_failure(ticket) if failed else self.breaker.record_success(ticket)
+
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertIsNone(self.breaker.allow())
+
+    def test_breaker_needs_a_minimum_of_calls(self):
+        for _ in range(3):
+            self.breaker.record_failure(self.breaker.allow())
+
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    @mock.patch('purbeurre.utils.monotonic')
+    def test_half_open_breaker_lets_a_single_call_through(self, monotonic_mock: mock.MagicMock):
+        monotonic_mock.return_value = 0
+
+        for _ in range(4):
+            self.breaker.record_failure(self.breaker.allow())
+
+        monotonic_mock.return_value = 30
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        ticket = self.breaker.allow()
+        self.assertIsNotNone(ticket)
+        self.assertIsNone(self.breaker.allow())
+
+        # The trial call failed, the breaker opens again.
+        self.breaker.record_failure(ticket)
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+
+        monotonic_mock.return_value = 60
+        ticket = self.breaker.allow()
+        self.breaker.record_success(ticket)
+        self.breaker.release(ticket)
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+        self.assertIsNotNone(self.breaker.allow())
+
+    @mock.patch('purbeurre.utils.monotonic')
+    def test_outcomes_of_calls_started_before_the_breaker_opened_are_ignored(self, monotonic_mock: mock.MagicMock):
+        monotonic_mock.return_value = 0
+        tickets = [self.breaker.allow() for _ in range(6)]
+
+        for ticket in tickets[:4]:
+            self.breaker.record_failure(ticket)
+
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+
+        # A late success neither closes the breaker nor counts as its trial call.
+        monotonic_mock.return_value = 30
+        self.breaker.record_success(tickets[4])
+        self.breaker.release(tickets[4])
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+
+        ticket = self.breaker.allow()
+        self.breaker.record_failure(tickets[5])
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.breaker.record_success(ticket)
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    @mock.patch('purbeurre.utils.monotonic')
+    def test_abandoned_trial_call_lets_another_one_through(self, monotonic_mock: mock.MagicMock):
+        monotonic_mock.return_value = 0
+
+        for _ in range(4):
+            self.breaker.record_failure(self.breaker.allow())
+
+        monotonic_mock.return_value = 30
+        ticket = self.breaker.allow()
+        self.assertIsNone(self.breaker.allow())
+
+        self.breaker.release(ticket)
+
+        self.assertIsNotNone(self.breaker.allow())
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+
+
+@skipUnless(is_algolia_installed(), "Algolia isn't configured.")
+@override_settings(ALGOLIA={'APPLICATION_ID': "TEST", 'API_KEY': "secret"})
+class AlgoliaAsyncSearchTests(TestCase):
+    def search(self, handler, query="riz", params=None):
+        """Search with the responses of the handler instead of Algolia."""
+        async def search():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                with mock.patch('product.search.algolia._get_client', return_value=client):
+                    return await araw_search(Product, query, params)
+
+        return async_to_sync(search)()
+
+    def test_search(self):
+        from algoliasearch_django import get_adapter
+
+        requests = []
+
+        def handler(request: httpx.Request):
+            requests.append(request)
+            return httpx.Response(200, json={'hits': [], 'nbHits': 0})
+
+        self.assertEqual({'hits': [], 'nbHits': 0}, self.search(handler, params={'hitsPerPage': 6, 'page': 1}))
+
+        request, = requests
+        self.assertEqual(
+            f"https://test-dsn.algolia.net/1/indexes/{get_adapter(Product).index_name}/query", str(request.url)
+        )
+        self.assertEqual("secret", request.headers['X-Algolia-API-Key'])
+        self.assertEqual({'params': "query=riz&hitsPerPage=6&page=1"}, json.loads(request.content))
+
+    def test_encode_params(self):
+        self.assertEqual(
+            "query=riz+thai&attributesToRetrieve=%5B%22name%22%5D&attributesToHighlight=%5B%5D&page=1",
+            encode_params("riz thai", {'attributesToRetrieve': ['name'], 'attributesToHighlight': [], 'page': 1}),
+        )
+
+    def test_search_on_the_next_hosts(self):
+        """Test that unreachable or failing hosts are skipped."""
+        hosts = []
+
+        def handler(request: httpx.Request):
+            hosts.append(request.url.host)
+
+            if len(hosts) == 1:
+                raise httpx.ConnectError("Unreachable", request=request)
+
+            return httpx.Response(503 if len(hosts) == 2 else 200, json={'hits': []})
+
+        self.assertEqual({'hits': []}, self.search(handler))
+        self.assertEqual(["test-dsn.algolia.net", "test-1.algolianet.com", "test-2.algolianet.com"], hosts)
+
+    def test_failed_search(self):
+        hosts = []
+
+        def handler(request: httpx.Request):
+            hosts.append(request.url.host)
+            return httpx.Response(403, json={'message': "Invalid API key"})
+
+        with self.assertLogs('product.search.algolia', level='WARNING'):
+            self.assertIsNone(self.search(handler))
+
+        # Client errors aren't retried on the other hosts.
+        self.assertEqual(1, len(hosts))
+
+    def test_client_is_closed_with_its_loop(self):
+        """Test that each event loop reuses its client, which is closed once the loop shuts down."""
+        async def get_clients():
+            return _get_client(), _get_client()
+
+        client, same_client = async_to_sync(get_clients)()
+
+        self.assertIs(client, same_client)
+        self.assertTrue(client.is_closed)
+        self.assertEqual(0, len(_clients))
+        self.assertIsNot(client, asyncio.run(get_clients())[0])
+
+
+class TrigramIndexTests(TestCase):
+    def test_trigrams(self):
+        self.assertEqual({'  r', ' ri', 'riz', 'iz ', '  a', ' au', 'au '}, trigrams("riz au"))
+
+    def test_search(self):
+        """Test that products are ranked by similarity, then by nutriscore and name."""
+        index = TrigramIndex([
+            (1, 'b', "riz basmati", "", "cora"),
+            (2, 'a', "riz thai", "riz parfume", ""),
+            (3, 'a', "galettes", "galettes de riz", "bjorg"),
+            (4, 'c', "pates", None, "barilla"),
+        ])
+
+        self.assertEqual(4, len(index))
+        self.assertEqual([1], index.search("basmatti", threshold=0.5, limit=10))
+        self.assertEqual([3, 2, 1], index.search("riz", threshold=0.5, limit=10))
+        self.assertEqual([3, 2], index.search("riz", threshold=0.5, limit=2))
+        self.assertEqual([4], index.search("barila", threshold=0.5, limit=10))
+        self.assertEqual([], index.search("", threshold=0.5, limit=10))
+
+
+class IndexHolderTests(TestCase):
+    def setUp(self) -> None:
+        clear_search_caches()
+        self.build = mock.Mock(side_effect=lambda: SuggestionIndex([("Riz", SuggestionIndex.PRODUCT, 'a', 1)]))
+        self.holder = IndexHolder('test', self.build)
+
+    @mock.patch('product.search.holder.Thread')
+    def test_index_is_loaded_in_the_background(self, thread_mock: mock.MagicMock):
+        self.assertIsNone(self.holder.get())
+        self.assertIsNone(self.holder.get())
+        # A single load runs at a time.
+        thread_mock.assert_called_once_with(
+            target=self.holder._load_in_background, args=(SearchCache().get_generation(),), daemon=True
+        )
+        self.build.assert_not_called()
+
+        self.holder.load()
+        self.holder._loading = False
+        index = self.holder.get()
+
+        self.assertEqual(1, len(index))
+        self.assertEqual(1, thread_mock.call_count)
+
+        # Once the search cache is invalidated, the previous index is kept while the next one is loaded.
+        SearchCache().invalidate()
+
+        self.assertIs(index, self.holder.get())
+        self.assertEqual(2, thread_mock.call_count)
+
+    def test_snapshot_is_loaded_instead_of_built(self):
+        self.holder.save_snapshot(SuggestionIndex([("Riz", 'product', 'a', 1), ("Pâtes", 'product', 'a', 1)]))
+
+        self.holder.load()
+        index = self.holder.index
+
+        self.assertEqual(2, len(index))
+        self.assertEqual(2, len(self.holder.read_snapshot()))
+        self.build.assert_not_called()
+
+        # The data of an unchanged snapshot isn't fetched again.
+        with self.assertNumQueries(1):
+            self.holder.load()
+
+        self.assertIs(index, self.holder.index)
+
+    @mock.patch('product.search.holder.connections')
+    def test_failed_load_is_logged(self, connections_mock: mock.MagicMock):
+        self.build.side_effect = ValueError
+        self.holder._loading = True
+
+        with self.assertLogs('product.search.holder', 'ERROR'):
+            self.holder._load_in_background(SearchCache().get_generation())
+
+        self.assertIsNone(self.holder.index)
+        self.assertFalse(self.holder._loading)
+        connections_mock.close_all.assert_called_once()
+
+
+class SuggestionIndexTests(TestCase):
+    def setUp(self) -> None:
+        self.index = SuggestionIndex([
+            ("Riz Basmati", SuggestionIndex.PRODUCT, 'b', 1),
+            ("riz basmati", SuggestionIndex.PRODUCT, 'a', 1),
+            ("Riz au lait", SuggestionIndex.PRODUCT, 'c', 1),
+            ("Rizières", SuggestionIndex.BRAND, 'b', 5),
+            ("Riz", SuggestionIndex.CATEGORY, 'b', 40),
+            ("Pâtes", SuggestionIndex.CATEGORY, 'a', 10),
+            ("  ", SuggestionIndex.BRAND, 'a', 1),
+        ])
+
+    def suggest_texts(self, query, index=None, **kwargs):
+        return [s['text'] for s in (index or self.index).suggest(query, **kwargs)]
+
+    def test_suggest_ranking(self):
+        """Test that suggestions are ranked by nutriscore, then by popularity."""
+        self.assertEqual(["Riz Basmati", "Riz", "Rizières", "Riz au lait"], self.suggest_texts("riz"))
+        self.assertEqual(["Riz Basmati", "Riz", "Rizières", "Riz au lait"], self.suggest_texts("r"))
+        self.assertEqual(["Riz Basmati", "Riz"], self.suggest_texts("RI", limit=2))
+
+    def test_suggest_prefix(self):
+        self.assertEqual(["Pâtes"], self.suggest_texts("pat"))
+        self.assertEqual(["Riz au lait"], self.suggest_texts("riz  au"))
+        self.assertEqual([{'text': "Rizières", 'kind': 'brand'}], self.index.suggest("rizi"))
+        self.assertEqual([], self.suggest_texts("basmati"))
+        self.assertEqual([], self.suggest_texts(" "))
+
+    def test_suggestions_are_merged(self):
+        """Test that texts differing by their case or accents are a single suggestion."""
+        self.assertEqual(5, len(self.index))
+
+    def test_update(self):
+        """Test that the suggestions of the imported products replace their previous ones."""
+        index = self.index.update(
+            [("Riz Basmati", "Rizières", 'b'), ("Riz au lait", None, 'c')],
+            [("Riz Basmati", "Rizières", 'c'), ("Riz complet", None, 'a')],
+        )
+
+        self.assertEqual(["Riz Basmati", "Riz complet", "Rizières"], self.suggest_texts("riz", index=index))
+        # Categories are rebuilt from the database, which has none.
+        self.assertEqual([], self.suggest_texts("pat", index=index))
+        self.assertEqual(5, len(self.index))
+
+    @disable_auto_indexing()
+    def test_build(self):
+        category = CategoryFactory(name="Riz")
+        ProductFactory(name="Riz rond", brands="Taureau Ailé,Lustucru", nutriscore_grade='a', categories=(category,))
+        ProductFactory(name="Riz long", brands="Lustucru", nutriscore_grade='b', categories=(category,))
+        CategoryFactory(name="Riz sauvage")
+
+        index = SuggestionIndex.build()
+
+        self.assertEqual(["Riz", "Riz rond", "Riz long"], [s['text'] for s in index.suggest("riz")])
+        self.assertEqual(["Lustucru"], [s['text'] for s in index.suggest("lus")])
+        self.assertEqual(["Taureau Ailé"], [s['text'] for s in index.suggest("taureau a")])
+
+
+class SuggestViewTests(TestCase):
+    def setUp(self) -> None:
+        clear_search_caches()
+        suggestion_index.clear()
+        self.addCleanup(suggestion_index.clear)
+        self.url = reverse('product:suggest')
+
+    @disable_auto_indexing()
+    @mock.patch('product.search.holder.Thread')
+    def test_suggest(self, thread_mock: mock.MagicMock):
+        ProductFactory(name="Riz Basmati", brands="Cora")
+
+        # Nothing is suggested until the index is loaded in the background.
+        self.assertEqual([], self.client.get(self.url, {'q': "riz"}).json()['suggestions'])
+        thread_mock.return_value.start.assert_called_once()
+
+        suggestion_index.load()
+        response = self.client.get(self.url, {'q': "riz"})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            {'query': "riz", 'suggestions': [{'text': "Riz Basmati", 'kind': 'product'}]}, response.json()
+        )
+        self.assertEqual(1, len(self.client.get(self.url, {'q': "riz", 'limit': "x"}).json()['suggestions']))
+
+    def test_suggest_without_query(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual({'query': "", 'suggestions': []}, response.json())
+        self.assertIsNone(suggestion_index.index)
+
+
+class SpellingIndexTests(TestCase):
+    def setUp(self) -> None:
+        self.index = SpellingIndex([
+            ("Chocolat noir", 3),
+            ("Chocolat au lait", 1),
+            ("Pâtes complètes", 2),
+            ("Pates", 1),
+            ("Confiture de fraises", 1),
+            ("Lindt, Lu", 1),
+        ])
+
+    def test_edit_distance(self):
+        self.assertEqual(0, edit_distance("riz", "riz", 2))
+        self.assertEqual(1, edit_distance("chocolat", "chocolt", 2))
+        self.assertEqual(1, edit_distance("noir", "nior", 2))
+        self.assertEqual(2, edit_distance("fraises", "frizes", 2))
+        self.assertEqual(3, edit_distance("confiture", "riz", 2))
+
+    def test_correct_word(self):
+        self.assertEqual(11, len(self.index))
+        self.assertEqual("chocolat", self.index.correct_word("chocolt"))
+        self.assertEqual("noir", self.index.correct_word("nior"))
+        self.assertEqual("confiture", self.index.correct_word("konfiturre"))
+        # Words which are known, too short or too far from the vocabulary are kept.
+        self.assertEqual("lu", self.index.correct_word("lu"))
+        self.assertEqual("la", self.index.correct_word("la"))
+        self.assertEqual("tomate", self.index.correct_word("tomate"))
+
+    def test_correct_word_ranking(self):
+        """Test that the closest word is preferred, then the most frequent one."""
+        index = SpellingIndex([("lait", 1), ("laid", 5), ("lit", 10)])
+
+        self.assertEqual("laid", index.correct_word("lai"))
+        self.assertEqual("lit", index.correct_word("liit"))
+
+    def test_correct(self):
+        self.assertEqual("chocolat noir", self.index.correct("Chocolt nior"))
+        # Corrected words get their most frequent spelling.
+        self.assertEqual("pâtes complètes", self.index.correct("pates complettes"))
+        self.assertIsNone(self.index.correct("Chocolat NOIR"))
+        self.assertIsNone(self.index.correct(""))
+
+    @disable_auto_indexing()
+    def test_build(self):
+        ProductFactory(name="Riz Basmati", brands="Taureau Ailé", categories=(CategoryFactory(name="Céréales"),))
+
+        index = SpellingIndex.build()
+
+        self.assertEqual("riz basmati taureau ailé céréales", index.correct("riz basmatti toreau aile cereale"))
+
+
+@mock.patch('product.search.get_backend')
+class SpellingCorrectionViewTests(TestCase):
+    def setUp(self) -> None:
+        clear_search_caches()
+        spelling_index.clear()
+        self.addCleanup(spelling_index.clear)
+        self.url = reverse('product:search')
+
+    @staticmethod
+    def fake_search(query, params):
+        hits = [{'objectID': "1", 'name': "Chocolat noir"}] if query == "chocolat noir" else []
+
+        return {'hits': hits, 'nbHits': len(hits), 'nbPages': len(hits), 'hitsPerPage': 6}
+
+    @disable_auto_indexing()
+    def test_search_is_retried_with_the_corrected_query(self, get_backend_mock: mock.MagicMock):
+        get_backend_mock.return_value.asearch = mock.AsyncMock(side_effect=self.fake_search)
+        ProductFactory(name="Chocolat noir")
+        spelling_index.load()
+
+        response = self.client.get(self.url, {'query': "chocolat nior"})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("chocolat noir", response.context['meta']['corrected_query'])
+        self.assertEqual(["Chocolat noir"], [p['name'] for p in response.context['products']])
+        self.assertContains(response, "?query=chocolat%20nior&exact=1")
+
+        # The query is searched as is when asked.
+        response = self.client.get(self.url, {'query': "chocolat nior", 'exact': 1})
+
+        self.assertIsNone(response.context['meta']['corrected_query'])
+        self.assertEqual([], response.context['products'])
+
+    @disable_auto_indexing()
+    def test_correction_without_results_is_not_offered(self, get_backend_mock: mock.MagicMock):
+        get_backend_mock.return_value.asearch = mock.AsyncMock(side_effect=self.fake_search)
+        ProductFactory(name="Chocolat blanc")
+        spelling_index.load()
+
+        response = self.client.get(self.url, {'query': "chocolat blan"})
+
+        self.assertIsNone(response.context['meta']['corrected_query'])
+        self.assertEqual(2, get_backend_mock.return_value.asearch.await_count)
@@ -1,9 +1,9 @@
 from unittest import mock
 
-from algoliasearch_django.decorators import disable_auto_indexing
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.shortcuts import reverse
-from product.tests.utils import algolia_mock_responses
+from product.search.spelling import spelling_index
+from product.tests.utils import algolia_mock_responses, clear_search_caches, disable_auto_indexing
 
 from .factories import CategoryFactory, ProductFactory
 
@@ -42,12 +42,14 @@ class ProductModelTests(TestCase):
         self.assertEqual(p_name, str(p))
 
 
-# We don't patch `algoliasearch_django.raw_search` because we use a from/import
-# statement for the import so the raw_search is in the `product.views` namespace.
-@mock.patch("product.views.raw_search",
+# The search view is async so it searches with `araw_search`, which we patch
+# in the `product.search.backends` namespace as it's imported with a from/import statement.
+@override_settings(SEARCH_BACKEND='product.search.backends.AlgoliaSearchBackend')
+@mock.patch("product.search.backends.araw_search",
             side_effect=algolia_mock_responses, autospec=True)
 class ProductListViewTests(TestCase):
     def setUp(self) -> None:
+        clear_search_caches()
         self.search_url = reverse('product:search')
         self.template_name = 'product/index.html'
 
@@ -77,12 +79,29 @@ class ProductListViewTests(TestCase):
             self.assertIn('nutriscore_grade', p)
 
     def test_search_request_with_zero_results(self, _mock):
+        # Queries without results are corrected with the spelling index.
+        spelling_index.load()
+        self.addCleanup(spelling_index.clear)
+
         response = self.search_query("NoResultsExpected")
 
         self.assertEqual(200, response.status_code)
         self.assertEqual(0, len(response.context['products']))
         self.assertQuerysetEqual(response.context['products'], [])
 
+    @override_settings(SEARCH_FALLBACK_BACKEND=None)
+    def test_search_request_when_the_search_fails(self, _mock):
+        """Test that a failed search without fallback shows a message instead of an error."""
+        _mock.side_effect = None
+        _mock.return_value = None
+
+        response = self.search_query("Riz")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([], response.context['products'])
+        self.assertTrue(response.context['meta']['search_failed'])
+        self.assertContains(response, "La recherche est momentanément indisponible")
+
     def search_query(self, query):
         """Call the product index view.
 
@@ -1,20 +1,39 @@
 import json
+from contextlib import ContextDecorator
 from pathlib import Path
 
+from django.apps import apps
+from django.core.cache import caches
+
+from product.benchmark import FakeJsonResponse
 from product.models import Product
+from product.search.cache import SearchCache
+
+
+def is_algolia_installed() -> bool:
+    """Whether `algoliasearch_django` is installed, which it only is once Algolia is configured."""
+    return apps.is_installed('algoliasearch_django')
 
 
-class FakeJsonResponse:
-    def __init__(self, data, status=200):
-        self._data = data
-        self._status_code = status
+class _NoAutoIndexing(ContextDecorator):
+    def __enter__(self):
+        return self
 
-    @property
-    def status_code(self):
-        return self._status_code
+    def __exit__(self, *exc):
+        return False
 
-    def json(self):
-        return self._data
+
+def disable_auto_indexing():
+    """`algoliasearch_django.decorators.disable_auto_indexing`, doing nothing when Algolia isn't installed.
+
+    `algoliasearch_django` can't even be imported without the credentials.
+    """
+    if not is_algolia_installed():
+        return _NoAutoIndexing()
+
+    from algoliasearch_django.decorators import disable_auto_indexing as algolia_disable_auto_indexing
+
+    return algolia_disable_auto_indexing()
 
 
 def algolia_mock_responses(model, query: str = "", params=None):  # pragma: no cover
@@ -57,15 +76,21 @@ def get_off_json_fragment(page=1):
         return json.load(file)
 
 
-async def fetch_products_mock(self, params, last_page=None) -> list:
-    """Only used for mocking the `_fetch_product` of the `populate` command."""
-    page = 1 if last_page is None else 2
-
-    fake_json = FakeJsonResponse(get_off_json_fragment(page=page))
+async def fetch_page_mock(self, client, params, page) -> FakeJsonResponse:
+    """Only used for mocking the `_fetch_page` of the `populate` command."""
+    payload = get_off_json_fragment(page=min(page, 2))
+    # Only two fragments are available so we pretend there are two pages.
+    payload['count'] = 2 * params['page_size']
 
-    return [fake_json]
+    return FakeJsonResponse(payload)
 
 
-def algolia_reindex_fake(self, *args, **options):
-    """Fake the `algolia_reindex` command."""
+def algolia_sync_fake(self, *args, **options):
+    """Fake the `algolia_sync` command."""
     pass
+
+
+def clear_search_caches():
+    """Clear the responses, stale copies, generation and counters of the search cache."""
+    for alias in (SearchCache.ALIAS, SearchCache.STALE_ALIAS, SearchCache.STATE_ALIAS):
+        caches[alias].clear()
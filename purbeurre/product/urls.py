@@ -6,5 +6,6 @@ app_name = 'product'
 
 urlpatterns = [
     path('search/', views.index, name="search"),
-    path('<int:pk>/', views.ProductDetailView.as_view(), name="show")
+    path('suggest/', views.suggest, name="suggest"),
+    path('<int:pk>/', views.show, name="show")
 ]
@@ -1,32 +1,60 @@
-from django.shortcuts import render, redirect, reverse
-from django.views.generic import DetailView
-from algoliasearch_django import raw_search
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render, redirect, reverse
 
 from .models import Product
+from .search import RESULT_PARAMS, asearch
+from .search.spelling import spelling_index
+from .search.suggest import suggestion_index
 from review.services import ReviewService
 
 
-def index(request):
+async def index(request):
+    """Search the products, the backend being awaited so the worker serves other requests meanwhile."""
     query: str = request.GET.get('query', '')
     current_page = int(request.GET.get('page', 1))
 
     if not query:  # No query, don't do a search request
         return redirect(reverse('home:index'))
 
-    # Algolia search parameters
+    # Search parameters, in the Algolia format whatever the backend.
     params = {
+        **RESULT_PARAMS,
         "hitsPerPage": 6,
         # We subtract by one because algolia starts at index 0 for pages.
         "page": current_page - 1,
     }
 
-    response = raw_search(Product, query, params)
+    response = await asearch(query, params)
+    corrected_query = None
+    # Every backend failed, the page tells so instead of showing no results.
+    search_failed = response is None
+
+    if search_failed:
+        response = {'hits': [], 'nbHits': 0, 'nbPages': 0, 'hitsPerPage': params['hitsPerPage']}
+
+    # Nothing found, retry with the misspelled words corrected unless the query is asked as is.
+    if not search_failed and not response['nbHits'] and not request.GET.get('exact'):
+        # Not in the thread shared by the thread-sensitive calls of the worker, as it reads the search cache.
+        index = await sync_to_async(spelling_index.get, thread_sensitive=False)()
+        # Queries aren't corrected until the worker has loaded the index.
+        corrected_query = index.correct(query) if index is not None else None
+
+        if corrected_query:
+            corrected_response = await asearch(corrected_query, params)
+
+            if corrected_response and corrected_response['nbHits']:
+                response = corrected_response
+            else:
+                corrected_query = None
 
     ctx = {
         "products": response['hits'],
 
         "meta": {
             "input_query": query,
+            "corrected_query": corrected_query,
+            "search_failed": search_failed,
             "page": current_page,
             "previous_page": current_page - 1 or None,
             "next_page": current_page + 1 if response['nbPages'] >= current_page + 1 else None,
@@ -37,23 +65,44 @@ def index(request):
         }
     }
 
-    return render(request, 'product/index.html', context=ctx)
+    # Templates may query the database, e.g. for the user.
+    return await sync_to_async(render)(request, 'product/index.html', context=ctx)
+
 
+def suggest(request):
+    """Suggest product names, brands and categories starting with the `q` parameter."""
+    query: str = request.GET.get('q', '')
 
-class ProductDetailView(DetailView):
-    model = Product
-    template_name = 'product/show.html'
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
 
-    def get_context_data(self, **kwargs):
-        ctx = super().get_context_data(**kwargs)
-        # Add a list containing the nutriscore letters
-        ctx.setdefault('nutriscore_letters', ['a', 'b', 'c', 'd', 'e'])
+    # Nothing is suggested until the worker has loaded the index.
+    index = suggestion_index.get() if query.strip() else None
 
-        ctx['reviews'], ctx['user_review'] = ReviewService.get_product_reviews(
-            request=self.request, product_id=self.object.id
-        )
-        ctx['avg_reviews_rating'], ctx['total_reviews'] = ReviewService.get_avg_product_reviews_rating(
-            product_id=self.object.id
-        )
+    return JsonResponse({
+        "query": query,
+        "suggestions": index.suggest(query, limit=max(limit, 1)) if index is not None else [],
+    })
+
+
+async def show(request, pk: int):
+    """Show a product with its reviews, the database being queried in the thread of the request."""
+    product = await sync_to_async(get_object_or_404)(Product, pk=pk)
+    reviews, user_review = await sync_to_async(ReviewService.get_product_reviews)(
+        request=request, product_id=product.id
+    )
+
+    ctx = {
+        "product": product,
+        # List containing the nutriscore letters
+        "nutriscore_letters": ['a', 'b', 'c', 'd', 'e'],
+        "reviews": reviews,
+        "user_review": user_review,
+        # Review stats kept on the product, so they don't need any query.
+        "avg_reviews_rating": product.average_rating(),
+        "total_reviews": product.review_count,
+    }
 
-        return ctx
+    return await sync_to_async(render)(request, 'product/show.html', context=ctx)
@@ -14,3 +14,17 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'purbeurre.settings')
 
 application = get_asgi_application()
+
+# The worker loads the search indexes in the background as it starts, instead of on its first searches.
+from django.db import connection  # noqa: E402
+
+from product.search.fuzzy import trigram_index  # noqa: E402
+from product.search.spelling import spelling_index  # noqa: E402
+from product.search.suggest import suggestion_index  # noqa: E402
+
+suggestion_index.get()
+spelling_index.get()
+
+# PostgreSQL searches the similar products with `pg_trgm` instead.
+if connection.vendor != 'postgresql':
+    trigram_index.get()
@@ -0,0 +1,186 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections.abc import Sequence
+from typing import Optional
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import IntegerField, Q, QuerySet
+
+# Bounds of the integers of the sort keys, stored as 64-bit integers at most.
+MIN_INTEGER, MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+
+class CursorPage(Sequence):
+    """A page of objects, with the cursors of the pages around it.
+
+    Attributes:
+        object_list: The objects of the page.
+        next_cursor: The cursor of the next page, None on the last page.
+        previous_cursor: The cursor of the previous page, None on the first page.
+    """
+
+    def __init__(self, object_list: list, next_cursor: Optional[str], previous_cursor: Optional[str]):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self)} objects>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Paginate a queryset by keyset: each page starts after the sort key of the last object of the previous one.
+
+    Unlike the `OFFSET` of `django.core.paginator.Paginator`, a page is fetched
+    from the index of the sort key whatever its depth, and the objects are never
+    counted. Pages are addressed by opaque cursors holding the sort key of
+    the object they start from, so only the next and previous pages are known.
+
+    The ordering is a list of fields (prefixed with "-" when descending), the last
+    one being unique, whose values are serializable to JSON (e.g. integers).
+    """
+
+    def __init__(self, queryset: QuerySet, ordering: Sequence, per_page: int):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+
+    def get_page(self, cursor: Optional[str] = None) -> CursorPage:
+        """Get the page of a cursor, the first page when the cursor is missing or invalid."""
+        backwards, values = self._decode_cursor(cursor) if cursor else (False, None)
+        queryset = self.queryset.order_by(*self.ordering)
+
+        if values is not None:
+            if backwards:
+                queryset = queryset.reverse()
+
+            try:
+                queryset = queryset.filter(self._get_keyset_filter(values, backwards))
+            except (TypeError, ValueError, ValidationError):
+                # The sort key doesn't match the fields of the ordering.
+                return self.get_page()
+
+        objects = list(queryset[:self.per_page + 1])
+        object_list, has_more = objects[:self.per_page], len(objects) > self.per_page
+
+        if not backwards:
+            # Some objects precede a cursor, at least the last one of the previous page.
+            has_next, has_previous = has_more, values is not None
+        elif object_list:
+            object_list.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            return self.get_page()
+
+        next_cursor = previous_cursor = None
+
+        if has_next:
+            next_cursor = self._encode_cursor(object_list[-1], backwards=False)
+
+        if has_previous and object_list:
+            previous_cursor = self._encode_cursor(object_list[0], backwards=True)
+
+        return CursorPage(object_list, next_cursor, previous_cursor)
+
+    def _get_keyset_filter(self, values: list, backwards: bool) -> Q:
+        """Get the filter of the objects after (or before) a sort key.
+
+        e.g. for the ordering (a, b): a > x OR (a = x AND b > y).
+        """
+        keyset_filter = Q()
+
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != backwards else 'gt'
+            equal = {previous.lstrip('-'): value for previous, value in zip(self.ordering[:i], values)}
+            keyset_filter |= Q(**equal, **{f"{name}__{lookup}": values[i]})
+
+        return keyset_filter
+
+    def _encode_cursor(self, obj, backwards: bool) -> str:
+        values = [getattr(obj, field.lstrip('-')) for field in self.ordering]
+        cursor = json.dumps([int(backwards), values], separators=(',', ':'))
+
+        return urlsafe_b64encode(cursor.encode()).decode().rstrip('=')
+
+    def _decode_cursor(self, cursor: str):
+        """Get the direction and the sort key of a cursor, without sort key when it is invalid."""
+        try:
+            backwards, values = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            return False, None
+
+        if backwards not in (0, 1) or not isinstance(values, list) or len(values) != len(self.ordering):
+            return False, None
+
+        fields = [self._get_field(field.lstrip('-')) for field in self.ordering]
+
+        if not all(self._is_valid_value(field, value) for field, value in zip(fields, values)):
+            return False, None
+
+        return bool(backwards), values
+
+    def _get_field(self, name: str):
+        """Get the model field or the output field of the annotation sorting the objects, None if unknown."""
+        if name in self.queryset.query.annotations:
+            return self.queryset.query.annotations[name].output_field
+
+        try:
+            return self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    @staticmethod
+    def _is_valid_value(field, value) -> bool:
+        """Check that a value of a sort key can be compared with its field by the database."""
+        if value is None:
+            return field is not None and field.null
+
+        if isinstance(value, int) and not MIN_INTEGER <= value <= MAX_INTEGER:
+            return False
+
+        if isinstance(field, IntegerField):
+            # Booleans are integers in Python, but not in a sort key.
+            return type(value) is int
+
+        if not isinstance(value, (str, int, float)):
+            return False
+
+        if field is not None:
+            try:
+                field.to_python(value)
+            except ValidationError:
+                return False
+
+        return True
+
+
+class CursorPaginationMixin:
+    """Paginate a list view by cursor (see `CursorPaginator`), with its `paginate_by` and `cursor_ordering`.
+
+    The context keeps the names of the `ListView` pagination, with a `CursorPage`
+    as `page_obj` and the cursor read from the `cursor` parameter of the query string.
+    """
+    cursor_ordering = ('id',)
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, self.cursor_ordering, page_size)
+        page = paginator.get_page(self.request.GET.get('cursor'))
+
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -61,8 +61,6 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
 
-    'algoliasearch_django',
-
     # Project apps
     'home.apps.HomeConfig',
     'account.apps.AccountConfig',
@@ -186,6 +184,72 @@ ALGOLIA = {
     'API_KEY': getenv('ALGOLIA_API_KEY'),
 }
 
+# The Algolia app can't be loaded without credentials, the products are then only searched in the database.
+if ALGOLIA['APPLICATION_ID'] and ALGOLIA['API_KEY']:
+    INSTALLED_APPS.append('algoliasearch_django')
+
+# Backend of the product search, defaults to the database when Algolia isn't configured.
+SEARCH_BACKEND = getenv('SEARCH_BACKEND') or (
+    'product.search.backends.AlgoliaSearchBackend' if 'algoliasearch_django' in INSTALLED_APPS
+    else 'product.search.backends.DatabaseSearchBackend'
+)
+
+# Backend searching the products while the search backend fails, none to let its errors through.
+SEARCH_FALLBACK_BACKEND = getenv('SEARCH_FALLBACK_BACKEND') or (
+    'product.search.backends.DatabaseSearchBackend'
+    if SEARCH_BACKEND != 'product.search.backends.DatabaseSearchBackend' else None
+)
+# Seconds a search may take before it is considered failed.
+SEARCH_DEADLINE = float(getenv('SEARCH_DEADLINE') or 1)
+# Failures of the search backend tripping the circuit breaker: rate over the last calls, and seconds before retrying.
+SEARCH_BREAKER = {
+    'FAILURE_RATE': float(getenv('SEARCH_BREAKER_FAILURE_RATE') or 0.5),
+    'WINDOW': int(getenv('SEARCH_BREAKER_WINDOW') or 20),
+    'MIN_CALLS': int(getenv('SEARCH_BREAKER_MIN_CALLS') or 10),
+    'RESET_TIMEOUT': float(getenv('SEARCH_BREAKER_RESET_TIMEOUT') or 30),
+}
+
+# Engine computing the substitutes of the products: "matrix" scores them in memory, "sql" in the database.
+SUBSTITUTE_ENGINE = getenv('SUBSTITUTE_ENGINE') or 'matrix'
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# Backend of the search caches, set a Memcached server as location to share them between the workers.
+SEARCH_CACHE_BACKEND = getenv('SEARCH_CACHE_BACKEND') or 'django.core.cache.backends.locmem.LocMemCache'
+# Seconds the stale copies of the search responses are kept, to be served when the search backend fails.
+SEARCH_CACHE_STALE_TIMEOUT = int(getenv('SEARCH_CACHE_STALE_TIMEOUT') or 86400)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Search responses.
+    'search': {
+        'BACKEND': SEARCH_CACHE_BACKEND,
+        'LOCATION': getenv('SEARCH_CACHE_LOCATION') or 'search',
+        'TIMEOUT': int(getenv('SEARCH_CACHE_TIMEOUT') or 300),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(getenv('SEARCH_CACHE_MAX_ENTRIES') or 1000),
+        },
+    },
+    # Stale copies of the search responses, apart so they don't evict the fresh ones.
+    'search_stale': {
+        'BACKEND': SEARCH_CACHE_BACKEND,
+        'LOCATION': getenv('SEARCH_CACHE_LOCATION') or 'search_stale',
+        'TIMEOUT': SEARCH_CACHE_STALE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(getenv('SEARCH_CACHE_STALE_MAX_ENTRIES') or 10000),
+        },
+    },
+    # Generation and counters of the search cache, which the responses mustn't evict.
+    'search_state': {
+        'BACKEND': SEARCH_CACHE_BACKEND,
+        'LOCATION': getenv('SEARCH_CACHE_LOCATION') or 'search_state',
+        'TIMEOUT': None,
+    },
+}
+
 # Sentry configuration
 sentry_sdk.init(
     dsn=getenv('SENTRY_DSN'),
@@ -1,4 +1,9 @@
-from typing import Any
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Any, Awaitable, Callable, Hashable
 
 
 def strtobool(val: Any) -> bool:
@@ -18,3 +23,193 @@ def strtobool(val: Any) -> bool:
         return val.lower() in ('y', 'yes', 't', 'true', 'on', '1')
 
     return bool(val)
+
+
+class StageTimer:
+    """Accumulate the time spent in each stage of a process.
+
+    Stages may be measured from several threads at the same time,
+    their durations are then summed and can exceed the wall clock time.
+
+    Attributes:
+        stages: The elapsed seconds and number of processed items, keyed by stage.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = Lock()
+
+    @contextmanager
+    def measure(self, stage: str, count: int = 0):
+        """Measure the time spent in the block as part of the given stage."""
+        start = perf_counter()
+
+        try:
+            yield
+        finally:
+            self.add(stage, perf_counter() - start, count)
+
+    def add(self, stage: str, seconds: float, count: int = 0):
+        """Add a duration and a number of processed items to a stage."""
+        with self._lock:
+            elapsed, total = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (elapsed + seconds, total + count)
+
+    def report(self) -> dict:
+        """Summarize each stage, in the order they were first measured.
+
+        Returns:
+            The seconds spent, the number of processed items
+            and the number of items processed per second, keyed by stage.
+        """
+        return {
+            stage: {
+                'seconds': round(seconds, 3),
+                'count': count,
+                'rate': round(count / seconds, 1) if seconds else None,
+            }
+            for stage, (seconds, count) in self.stages.items()
+        }
+
+
+class _Abandoned(Exception):
+    """Raised to the followers of a call whose leader was cancelled."""
+
+
+class AsyncSingleFlight:
+    """Share a single call between the concurrent coroutines awaiting the same key.
+
+    The first caller of a key awaits the function itself, so it keeps its
+    context (e.g. the thread of its database queries), and the callers
+    arriving before it returns await its result (or its exception) instead
+    of calling the function too. When the first caller is cancelled (e.g. its
+    client disconnected), one of the others calls its own function instead,
+    the rest awaiting it. Calls are only shared within an event loop.
+    """
+
+    def __init__(self):
+        self._futures = {}
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable]) -> Any:
+        """Await the function, unless a call of the same key is in flight, and return its result."""
+        loop = asyncio.get_running_loop()
+
+        while (loop, key) in self._futures:
+            try:
+                # A cancelled caller mustn't cancel the call of the others.
+                return await asyncio.shield(self._futures[(loop, key)])
+            except _Abandoned:
+                # The first follower to resume takes the call over.
+                continue
+
+        future = self._futures[(loop, key)] = loop.create_future()
+
+        try:
+            result = await function()
+        except asyncio.CancelledError:
+            future.set_exception(_Abandoned())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved, the callers waiting for it raise it too.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._futures[(loop, key)]
+
+        return result
+
+
+class CircuitBreaker:
+    """Stop calling a failing service for a while once too many of its last calls failed.
+
+    The breaker is closed while the service works. It opens once at least
+    `failure_rate` of the last `window` calls failed (after `min_calls` calls),
+    and callers must then do without the service. After `reset_timeout` seconds,
+    it lets a single call through (half-open): the breaker closes again if
+    it succeeds, and opens for another `reset_timeout` seconds otherwise.
+
+    Each call gets a ticket from `allow`, with which its outcome is recorded.
+    The outcomes of the calls started before the breaker last opened or closed
+    are ignored, and each call must be released once done (e.g. in a `finally`)
+    so an abandoned trial call lets another one through.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_rate: float = 0.5, window: int = 20, min_calls: int = 10, reset_timeout: float = 30):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._failures = deque(maxlen=window)
+        self._opened_at = None
+        self._probing = False
+        # Incremented whenever the breaker opens or closes, the tickets being the generation of their call.
+        self._generation = 1
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+
+        return self.OPEN if monotonic() - self._opened_at < self.reset_timeout else self.HALF_OPEN
+
+    def allow(self):
+        """Get the ticket of a call to the service, or None when the service mustn't be called."""
+        with self._lock:
+            state = self.state
+
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return self._generation
+
+            return self._generation if state == self.CLOSED else None
+
+    def record_success(self, ticket: int) -> None:
+        with self._lock:
+            if ticket != self._generation:
+                return
+
+            if self._opened_at is not None:  # The trial call succeeded.
+                self._close()
+
+            self._failures.append(False)
+
+    def record_failure(self, ticket: int) -> None:
+        with self._lock:
+            if ticket != self._generation:
+                return
+
+            if self._opened_at is not None:  # The trial call failed.
+                self._open()
+                return
+
+            self._failures.append(True)
+            failure_rate = sum(self._failures) / len(self._failures)
+
+            if len(self._failures) >= self.min_calls and failure_rate >= self.failure_rate:
+                self._open()
+
+    def release(self, ticket: int) -> None:
+        """End a call, letting another trial call through if it was one without recorded outcome."""
+        with self._lock:
+            if ticket == self._generation and self._opened_at is not None:
+                self._probing = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._close()
+
+    def _open(self) -> None:
+        self._opened_at, self._probing = monotonic(), False
+        self._generation += 1
+
+    def _close(self) -> None:
+        self._opened_at, self._probing = None, False
+        self._generation += 1
+        self._failures.clear()
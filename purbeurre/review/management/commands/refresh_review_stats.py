@@ -0,0 +1,19 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from review.services import ReviewService
+
+
+class Command(BaseCommand):
+    help = 'Recompute the number of reviews and the sum of their ratings of every product from scratch.'
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        count = ReviewService.refresh_product_stats()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Refreshed the review stats of {count} products. ({perf_counter() - start:.2f} seconds)"
+            )
+        )
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.5 on 2026-10-18 15:50
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def compute_product_review_stats(apps, schema_editor):
+    """Fill the review stats of the products from their reviews, like `ReviewService.refresh_product_stats`."""
+    Product = apps.get_model('product', 'Product')
+    Review = apps.get_model('review', 'Review')
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+
+    Product.objects.update(
+        review_count=Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0),
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0009_product_review_stats'),
+        ('review', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(compute_product_review_stats, migrations.RunPython.noop),
+    ]
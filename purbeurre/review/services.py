@@ -1,36 +1,91 @@
 from typing import Union
 
-from django.core.paginator import Paginator, Page
-from django.db.models import Avg
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
 from django.http import HttpRequest
 
+from product.models import Product
+from purbeurre.pagination import CursorPage, CursorPaginator
+from review.forms import CreateReviewForm
 from review.models import Review
 
 
 class ReviewService:
     @staticmethod
-    def get_product_reviews(*, request: HttpRequest, product_id: int, per_page: int = 6) -> [Page, Union[Review, None]]:
-        """Get all reviews of the specified product. Pagination is applied"""
+    def get_product_reviews(
+        *, request: HttpRequest, product_id: int, per_page: int = 6
+    ) -> [CursorPage, Union[Review, None]]:
+        """Get all reviews of the specified product. Pagination is applied by cursor (the `cursor` parameter)"""
         user_review = None
-        page_number = request.GET.get('page', 1)
 
         if request.user.is_authenticated:
             user_review = Review.objects.filter(user=request.user, product_id=product_id).first()
 
-        review_list = Review.objects.filter(product_id=product_id)
+        review_list = Review.objects.filter(product_id=product_id).select_related('user')
         if user_review:
             review_list = review_list.exclude(user=request.user)
 
-        paginator = Paginator(review_list, per_page=per_page)
-        page = paginator.get_page(page_number)
+        paginator = CursorPaginator(review_list, ordering=('id',), per_page=per_page)
+        page = paginator.get_page(request.GET.get('cursor'))
 
         return page, user_review
 
     @staticmethod
-    def get_avg_product_reviews_rating(*, product_id) -> [int, int]:
-        """Get the average reviews rating of the specified product"""
-        query = Review.objects.filter(product_id=product_id)
-        total_reviews = len(query)
-        avg = query.aggregate(Avg('rating')).get('rating__avg')
+    def save_review(form: CreateReviewForm, *, user, product_id: int) -> Review:
+        """Create or edit the review of a valid form, along with the review stats of its product."""
+        with transaction.atomic():
+            previous_rating = None
 
-        return round(avg or 0), total_reviews
+            if form.instance.pk is not None:
+                # The stored rating, as the instance of the form already holds the new one.
+                previous_rating = Review.objects.select_for_update().values_list('rating', flat=True).get(
+                    pk=form.instance.pk
+                )
+
+            review = form.save(user=user, product_id=product_id)
+
+            if previous_rating is None:
+                ReviewService._update_product_stats(product_id, reviews=1, ratings=review.rating)
+            else:
+                ReviewService._update_product_stats(product_id, reviews=0, ratings=review.rating - previous_rating)
+
+        return review
+
+    @staticmethod
+    def delete_review(review: Review) -> None:
+        """Delete a review, along with its rating from the review stats of its product."""
+        with transaction.atomic():
+            rating = Review.objects.select_for_update().filter(pk=review.pk).values_list('rating', flat=True).first()
+
+            # Already deleted by a concurrent request.
+            if rating is None:
+                return
+
+            review.delete()
+            ReviewService._update_product_stats(review.product_id, reviews=-1, ratings=-rating)
+
+    @staticmethod
+    def refresh_product_stats() -> int:
+        """Recompute the review stats of every product from their reviews.
+
+        The stats only follow the reviews written through `save_review` and `delete_review`,
+        this fixes them after other changes (e.g. reviews deleted along with their user).
+
+        Returns:
+            The number of products.
+        """
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+
+        return Product.objects.update(
+            review_count=Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0),
+            rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        )
+
+    @staticmethod
+    def _update_product_stats(product_id: int, *, reviews: int, ratings: int) -> None:
+        # Updated in the database so concurrent reviews add up, without changing the `updated_at` of the product.
+        # The stats never go below zero, even when they missed reviews written otherwise (see `refresh_product_stats`).
+        Product.objects.filter(pk=product_id).update(
+            review_count=Greatest(F('review_count') + reviews, 0), rating_sum=Greatest(F('rating_sum') + ratings, 0)
+        )
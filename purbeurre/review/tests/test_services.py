@@ -1,9 +1,15 @@
-from django.core.paginator import Page
+import json
+from base64 import urlsafe_b64encode
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.http import HttpRequest
 
 from product.tests.factories import ProductFactory
+from purbeurre.pagination import CursorPage, CursorPaginator
 from review.models import Review as ReviewModel
+from review.forms import CreateReviewForm
 from review.services import ReviewService
 from account.tests.factories import UserFactory
 from review.tests.factories import ReviewFactory
@@ -20,7 +26,7 @@ class ReviewServiceTests(TestCase):
 
         page, user_review = ReviewService.get_product_reviews(request=self.fake_request, product_id=a_product.id)
 
-        self.assertIsInstance(page, Page)
+        self.assertIsInstance(page, CursorPage)
         self.assertEqual(len(page.object_list), 0)
         self.assertEqual(user_review, None)
 
@@ -30,11 +36,9 @@ class ReviewServiceTests(TestCase):
         other_reviews_total = 3
         other_reviews = ReviewFactory.create_batch(size=other_reviews_total, product=a_product)
 
-        self.fake_request.GET.setdefault('page', 1)
-
         page, user_review = ReviewService.get_product_reviews(request=self.fake_request, product_id=a_product.id)
 
-        self.assertIsInstance(page, Page)
+        self.assertIsInstance(page, CursorPage)
         self.assertIsInstance(user_review, ReviewModel)
         self.assertEqual(len(page.object_list), other_reviews_total)
         self.assertQuerysetEqual(page.object_list, other_reviews)
@@ -48,22 +52,122 @@ class ReviewServiceTests(TestCase):
 
         page, user_review = ReviewService.get_product_reviews(request=self.fake_request, product_id=a_product.id)
 
-        self.assertIsInstance(page, Page)
+        self.assertIsInstance(page, CursorPage)
         self.assertNotIn(a_review, page.object_list)
         self.assertEqual(len(page.object_list), 3)
         self.assertQuerysetEqual(page.object_list, reviews)
         self.assertEqual(user_review, None)
 
-    def test_get_average_product_reviews_rating(self) -> None:
+    def test_get_product_reviews_by_cursor(self) -> None:
+        a_product = ProductFactory()
+        reviews = ReviewFactory.create_batch(size=8, product=a_product)
+
+        first_page, _ = ReviewService.get_product_reviews(request=self.fake_request, product_id=a_product.id)
+        self.fake_request.GET['cursor'] = first_page.next_cursor
+        second_page, _ = ReviewService.get_product_reviews(request=self.fake_request, product_id=a_product.id)
+
+        self.assertEqual(reviews[:6], first_page.object_list)
+        self.assertEqual(reviews[6:], second_page.object_list)
+        self.assertFalse(second_page.has_next())
+
+    def test_save_and_delete_reviews(self) -> None:
+        """Test that the review stats of the product follow the created, edited and deleted reviews."""
         a_product = ProductFactory()
-        n_3stars_reviews = 3
-        n_5stars_reviews = 5
-        ReviewFactory.create_batch(size=n_3stars_reviews, rating=3, product=a_product)
-        ReviewFactory.create_batch(size=n_5stars_reviews, rating=5, product=a_product)
+        data = {'title': 'Un titre', 'content': 'Un contenu'}
 
-        estimated_average = round(
-            (3 * n_3stars_reviews + 5 * n_5stars_reviews) / (n_3stars_reviews + n_5stars_reviews)
+        review = ReviewService.save_review(
+            CreateReviewForm({**data, 'rating': 2}), user=self.user, product_id=a_product.id
         )
-        service_average, _ = ReviewService.get_avg_product_reviews_rating(product_id=a_product.id)
+        ReviewService.save_review(CreateReviewForm({**data, 'rating': 5}), user=UserFactory(), product_id=a_product.id)
+        a_product.refresh_from_db()
+
+        self.assertEqual((2, 7), (a_product.review_count, a_product.rating_sum))
+        self.assertEqual(4, a_product.average_rating())
+
+        form = CreateReviewForm({**data, 'rating': 4}, instance=review)
+        self.assertTrue(form.is_valid())
+        ReviewService.save_review(form, user=self.user, product_id=a_product.id)
+        a_product.refresh_from_db()
+
+        self.assertEqual((2, 9), (a_product.review_count, a_product.rating_sum))
+
+        ReviewService.delete_review(review)
+        # Deleting it twice doesn't count it twice.
+        ReviewService.delete_review(review)
+        a_product.refresh_from_db()
+
+        self.assertEqual((1, 5), (a_product.review_count, a_product.rating_sum))
+        self.assertEqual(5, a_product.average_rating())
+
+    def test_delete_review_missed_by_the_stats(self) -> None:
+        """Test that the stats stay positive when they missed the deleted review (e.g. created in the shell)."""
+        review = ReviewFactory(rating=4)
+
+        ReviewService.delete_review(review)
+        review.product.refresh_from_db()
+
+        self.assertEqual((0, 0), (review.product.review_count, review.product.rating_sum))
+
+    def test_refresh_review_stats_command(self) -> None:
+        a_product, another_product = ProductFactory.create_batch(2)
+        ReviewFactory.create_batch(size=3, rating=4, product=a_product)
+        out = StringIO()
+
+        call_command('refresh_review_stats', stdout=out)
+        a_product.refresh_from_db()
+        another_product.refresh_from_db()
+
+        self.assertIn("Refreshed the review stats of 2 products.", out.getvalue())
+        self.assertEqual((3, 12), (a_product.review_count, a_product.rating_sum))
+        self.assertEqual((0, 0), (another_product.review_count, another_product.rating_sum))
+        self.assertEqual(0, another_product.average_rating())
+
+
+class CursorPaginatorTests(TestCase):
+    def setUp(self) -> None:
+        self.reviews = ReviewFactory.create_batch(size=12)
+        self.paginator = CursorPaginator(ReviewModel.objects.all(), ordering=('-rating', 'id'), per_page=5)
+        self.ordered_reviews = sorted(self.reviews, key=lambda review: (-review.rating, review.id))
+
+    def test_get_pages(self) -> None:
+        """Test that pages follow each other in both directions, with a single query each."""
+        with self.assertNumQueries(1):
+            first_page = self.paginator.get_page()
+
+        with self.assertNumQueries(1):
+            second_page = self.paginator.get_page(first_page.next_cursor)
+
+        last_page = self.paginator.get_page(second_page.next_cursor)
+
+        self.assertEqual(self.ordered_reviews[:5], first_page.object_list)
+        self.assertEqual(self.ordered_reviews[5:10], second_page.object_list)
+        self.assertEqual(self.ordered_reviews[10:], last_page.object_list)
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(second_page.has_previous() and second_page.has_next())
+        self.assertFalse(last_page.has_next())
+
+        with self.assertNumQueries(1):
+            previous_page = self.paginator.get_page(last_page.previous_cursor)
+
+        self.assertEqual(second_page.object_list, previous_page.object_list)
+        self.assertEqual(first_page.object_list, self.paginator.get_page(previous_page.previous_cursor).object_list)
+        self.assertFalse(self.paginator.get_page(previous_page.previous_cursor).has_previous())
+
+    def test_get_page_with_an_invalid_cursor(self) -> None:
+        """Test that the first page is returned for cursors which can't be decoded or don't match the ordering."""
+        first_page = self.ordered_reviews[:5]
+
+        for cursor in ('', 'not a cursor', 'W10', 'WzAsWzFdXQ', 'WzAsWyJhIiwiYiJdXQ'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(first_page, self.paginator.get_page(cursor).object_list)
+
+    def test_get_page_with_a_crafted_cursor(self) -> None:
+        """Test that the first page is returned for sort keys out of the range or of the type of their fields."""
+        first_page = self.ordered_reviews[:5]
+
+        for cursor in ([0, [3, 10 ** 30]], [0, [-10 ** 30, 1]], [0, [3, "1"]], [0, [3, 1.5]], [0, [True, 1]],
+                       [0, [None, 1]], [0, [3, [1]]], [2, [3, 1]], [0, [3, 1, 1]]):
+            with self.subTest(cursor=cursor):
+                encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode()
 
-        self.assertEqual(estimated_average, service_average)
+                self.assertEqual(first_page, self.paginator.get_page(encoded).object_list)
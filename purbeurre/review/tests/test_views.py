@@ -12,6 +12,7 @@ from product.tests.factories import ProductFactory
 from purbeurre.tests import SeleniumServerTestCase
 from .factories import ReviewFactory
 from ..models import Review
+from ..services import ReviewService
 
 
 class ReviewViewsTests(TestCase):
@@ -38,6 +39,32 @@ class ReviewViewsTests(TestCase):
         self.assertNotIn(another_review, ctx_reviews.object_list)
         self.assertEqual(ctx_user_review, None)
 
+    def test_review_stats_of_the_product_page(self):
+        """Test that the review stats are read from the product, without querying the reviews."""
+        a_product = ProductFactory()
+        ReviewFactory(product=a_product, rating=4)
+        ReviewFactory(product=a_product, rating=5)
+        ReviewService.refresh_product_stats()
+
+        # The product and the page of reviews with their authors.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('product:show', args=(a_product.id,)))
+
+        self.assertEqual(4, response.context['avg_reviews_rating'])
+        self.assertEqual(2, response.context['total_reviews'])
+
+    def test_store_a_review(self):
+        self.client.force_login(user=self.user)
+        a_product = ProductFactory()
+        data = {'title': 'Un titre', 'content': 'Un contenu', 'rating': 4, 'product_id': a_product.id}
+
+        response = self.client.post(reverse('review:store'), data=data)
+
+        self.assertRedirects(response, expected_url=reverse('product:show', args=(a_product.id,)))
+        a_product.refresh_from_db()
+        self.assertTrue(Review.objects.filter(user=self.user, product=a_product, rating=4).exists())
+        self.assertEqual((1, 4), (a_product.review_count, a_product.rating_sum))
+
     def test_get_an_existing_review(self):
         review_rating = 5
         a_review = ReviewFactory(rating=review_rating)
@@ -55,6 +82,7 @@ class ReviewViewsTests(TestCase):
     def test_update_an_existing_review(self):
         self.client.force_login(user=self.user)
         a_review = ReviewFactory(user=self.user, rating=4)
+        ReviewService.refresh_product_stats()
         updated_values = {
             'title': a_review.title[::-1],
             'content': a_review.content[::-1],
@@ -69,15 +97,19 @@ class ReviewViewsTests(TestCase):
         self.assertEqual(a_review.title, updated_values['title'])
         self.assertEqual(a_review.content, updated_values['content'])
         self.assertEqual(a_review.rating, updated_values['rating'])
+        self.assertEqual((1, 5), (a_review.product.review_count, a_review.product.rating_sum))
 
     def test_delete_an_existing_review(self):
         self.client.force_login(user=self.user)
         review_to_delete = ReviewFactory(user=self.user)
+        ReviewService.refresh_product_stats()
 
         response = self.client.post(reverse('review:review', args=(review_to_delete.id,)), data={'delete': True})
 
         self.assertRedirects(response, expected_url=reverse('product:show', args=(review_to_delete.product_id,)))
         self.assertFalse(Review.objects.filter(pk=review_to_delete.id).exists())
+        review_to_delete.product.refresh_from_db()
+        self.assertEqual((0, 0), (review_to_delete.product.review_count, review_to_delete.product.rating_sum))
 
 
 @tag('selenium')
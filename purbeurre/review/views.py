@@ -4,6 +4,7 @@ from django.views import View
 
 from .models import Review as ReviewModel
 from .forms import CreateReviewForm
+from .services import ReviewService
 
 
 class Review(View):
@@ -31,14 +32,14 @@ class Review(View):
         form = self.form_class(request.POST or None, instance=self.review)
 
         if form.is_valid():
-            form.save(user=request.user, product_id=self.review.product_id)
+            ReviewService.save_review(form, user=request.user, product_id=self.review.product_id)
             return redirect(reverse('product:show', args=(self.review.product.id,)))
 
         return render(request, template_name=self.template_name, context={"review": self.review})
 
     def delete(self, request, *args, **kwargs):
         product_id = self.review.product.id
-        self.review.delete()
+        ReviewService.delete_review(self.review)
 
         return redirect(reverse('product:show', args=(product_id,)))
 
@@ -49,6 +50,6 @@ def store(request):
     product_id = request.POST.get('product_id')
 
     if form.is_valid():
-        form.save(user=request.user, product_id=product_id)
+        ReviewService.save_review(form, user=request.user, product_id=product_id)
 
     return redirect(reverse('product:show', args=(request.POST.get('product_id'),)))
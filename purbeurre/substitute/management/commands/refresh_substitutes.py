@@ -0,0 +1,47 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from substitute.services import SubstituteService
+
+
+class Command(BaseCommand):
+    help = 'Precompute the best substitutes of the products, to run once the products are imported.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only refresh the products whose substitutes may have changed since the last refresh.',
+        )
+        parser.add_argument(
+            '--top', type=int, default=SubstituteService.DEFAULT_TOP,
+            help='Number of substitutes kept for each product.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=SubstituteService.DEFAULT_BATCH_SIZE,
+            help='Number of products whose substitutes are computed per query.',
+        )
+        parser.add_argument(
+            '--candidates', type=int,
+            help='Only score the given number of the healthiest products of each category, '
+                 'faster on large categories but approximate. Every product is scored by default.',
+        )
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        product_ids = None
+        last_refresh = SubstituteService.get_last_refresh()
+
+        # Without any substitutes yet, everything is computed.
+        if options['incremental'] and last_refresh is not None:
+            product_ids = SubstituteService.get_outdated_product_ids(since=last_refresh)
+
+        count = SubstituteService.refresh(
+            product_ids, top=options['top'], batch_size=options['batch_size'], candidates=options['candidates'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Refreshed the substitutes of {count} products. ({perf_counter() - start:.2f} seconds)"
+            )
+        )
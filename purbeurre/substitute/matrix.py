@@ -0,0 +1,128 @@
+from array import array
+from collections import Counter
+from heapq import nsmallest
+
+from product.models import Product
+
+
+class CategoryMatrix:
+    """In-memory sparse matrix of the categories of the products, scoring their substitutes.
+
+    The product × category relation is stored twice in compressed sparse rows
+    (CSR) of positions: the categories of each product and the products of each
+    category, the healthiest first. The scores of the substitutes of a product are
+    the product of its row with the matrix, i.e. the number of categories each
+    other product shares with it, counted over the products of its categories.
+
+    Substitutes are ranked like the SQL engine of `SubstituteService` does:
+    by shared categories, then by nutriscore, then by ID, and only the products
+    with a nutriscore at least as good as the original one are kept.
+    """
+
+    def __init__(self, products, relations):
+        """Build the matrix from (product ID, nutriscore grade) pairs and (product ID, category ID) pairs."""
+        self._product_ids = array('Q')
+        # Nutriscore grade of each product as a character code, compared like the SQL strings.
+        self._grades = array('B')
+        self._positions = {}
+
+        for product_id, grade in products:
+            self._positions[product_id] = len(self._product_ids)
+            self._product_ids.append(product_id)
+            self._grades.append(ord(grade) if grade else 0)
+
+        category_positions = {}
+        rows, columns = [], []
+
+        for product_id, category_id in relations:
+            position = self._positions.get(product_id)
+
+            if position is not None:
+                rows.append(position)
+                columns.append(category_positions.setdefault(category_id, len(category_positions)))
+
+        # Products ordered by nutriscore then ID, and the place of each product in this order,
+        # so the substitutes are ranked by comparing integers instead of tuples.
+        self._ordered = array('L', sorted(
+            range(len(self._product_ids)), key=lambda position: (self._grades[position], self._product_ids[position])
+        ))
+        self._order = array('L', [0] * len(self._ordered))
+
+        for order, position in enumerate(self._ordered):
+            self._order[position] = order
+
+        self._categories_ptr, self._categories = self._compress(rows, columns, len(self._product_ids))
+        # The products of each category are listed in order, so its healthiest products come first.
+        ordered = sorted(zip(rows, columns), key=lambda relation: self._order[relation[0]])
+        self._products_ptr, self._products = self._compress(
+            [column for _, column in ordered], [row for row, _ in ordered], len(category_positions)
+        )
+
+    def __len__(self):
+        return len(self._product_ids)
+
+    @classmethod
+    def build(cls):
+        """Build the matrix from the products and categories of the database."""
+        products = Product.objects.values_list('id', 'nutriscore_grade')
+        relations = Product.categories.through.objects.values_list('product_id', 'category_id')
+
+        return cls(products.iterator(), relations.iterator())
+
+    def get_substitutes(self, product_id: int, top: int, candidates: int = None) -> list:
+        """Get the `top` best substitutes of a product as (product ID, score) pairs, the best first.
+
+        With `candidates`, only the `candidates` healthiest products of each
+        category of the product are scored (on all the categories they share
+        with it), which is faster on large categories but approximate.
+        """
+        position = self._positions.get(product_id)
+
+        if position is None:
+            return []
+
+        scores = Counter()
+        start, end = self._categories_ptr[position], self._categories_ptr[position + 1]
+
+        for category in self._categories[start:end]:
+            first, last = self._products_ptr[category], self._products_ptr[category + 1]
+            scores.update(self._products[first:last if candidates is None else min(last, first + candidates)])
+
+        del scores[position]
+
+        if candidates is not None:
+            categories, categories_ptr = set(self._categories[start:end]), self._categories_ptr
+            scores = {
+                candidate: len(categories.intersection(
+                    self._categories[categories_ptr[candidate]:categories_ptr[candidate + 1]]
+                ))
+                for candidate in scores
+            }
+
+        grade, grades, order, size = self._grades[position], self._grades, self._order, len(self._order)
+        # The best substitutes have the lowest keys: the highest score, then the lowest order.
+        best = nsmallest(top, [
+            order[candidate] - score * size for candidate, score in scores.items() if grades[candidate] <= grade
+        ])
+
+        return [(self._product_ids[self._ordered[key % size]], -(key // size)) for key in best]
+
+    @staticmethod
+    def _compress(rows: list, columns: list, size: int) -> tuple:
+        """Get the row pointers and the column indices of the CSR form of a matrix given by coordinates."""
+        pointers = array('L', [0] * (size + 1))
+
+        for row in rows:
+            pointers[row + 1] += 1
+
+        for row in range(size):
+            pointers[row + 1] += pointers[row]
+
+        # Each entry is placed at the next free index of its row.
+        indices, offsets = array('L', [0] * len(rows)), pointers[:-1]
+
+        for row, column in zip(rows, columns):
+            indices[offsets[row]] = column
+            offsets[row] += 1
+
+        return pointers, indices
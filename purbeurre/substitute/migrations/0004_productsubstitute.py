@@ -0,0 +1,33 @@
+# Generated by Django 3.2.5 on 2026-10-18 15:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0008_productsearchdocument_trigram_indexes'),
+        ('substitute', '0003_auto_20220415_0758'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSubstitute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField()),
+                ('rank', models.PositiveIntegerField()),
+                ('refreshed_at', models.DateTimeField()),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='top_substitutes', to='product.product')),
+                ('substitute', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='top_substitute_of', to='product.product')),
+            ],
+            options={
+                'ordering': ['product', 'rank'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productsubstitute',
+            constraint=models.UniqueConstraint(fields=('product', 'rank'), name='unique_product_substitute_rank'),
+        ),
+    ]
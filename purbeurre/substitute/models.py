@@ -47,3 +47,49 @@ class UserSubstitute(models.Model):
             self.original_product_id,
             self.substitute_product_id
         )
+
+
+class ProductSubstitute(models.Model):
+    """ProductSubstitute model
+
+    A precomputed substitute of a product: a product sharing some of its
+    categories with a nutriscore as good or better. Only the best substitutes
+    of each product are kept, and they are refreshed by the `refresh_substitutes`
+    command (see `SubstituteService`).
+
+    Attributes:
+        product_id (int): The product which is substituted.
+        substitute_id (int): The product which substitutes it.
+        score (int): The number of categories both products share.
+        rank (int): The position of the substitute among those of the product, from 1.
+        refreshed_at (str): The datetime where the substitutes of the product have been computed.
+    """
+    __name__ = "ProductSubstitute"
+
+    # The unique constraint indexes the products already.
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="top_substitutes",
+        db_index=False,
+    )
+    substitute = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="top_substitute_of",
+    )
+    score = models.PositiveIntegerField()
+    rank = models.PositiveIntegerField()
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_product_substitute_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} substitué par {self.substitute_id} ({self.score})"
+
+    def __repr__(self):
+        return "<{} '{}, {}:{}'>".format(self.__name__, self.product_id, self.rank, self.substitute_id)
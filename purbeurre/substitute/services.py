@@ -0,0 +1,169 @@
+from datetime import datetime
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from product.models import Product
+from substitute.matrix import CategoryMatrix
+from substitute.models import ProductSubstitute
+
+
+class SubstituteService:
+    # Number of substitutes kept for each product.
+    DEFAULT_TOP = 60
+    # Number of products whose substitutes are computed per query.
+    DEFAULT_BATCH_SIZE = 500
+
+    @staticmethod
+    def refresh(
+        product_ids=None, *, top: int = DEFAULT_TOP, batch_size: int = DEFAULT_BATCH_SIZE,
+        candidates: int = None,
+    ) -> int:
+        """Recompute the substitutes of the given products, of every product by default.
+
+        Substitutes are ranked by the number of categories they share with
+        the product, then by nutriscore. They are scored in memory by a
+        `CategoryMatrix`, or in the database when `SUBSTITUTE_ENGINE` is "sql".
+        With `candidates`, only the `candidates` healthiest products of each
+        category of a product are scored, so the largest categories don't make
+        the refresh quadratic: the ranking is then approximate, a product sharing
+        many categories but less healthy than them being left out.
+        Each batch of products is refreshed in its own transaction,
+        so their substitutes are never seen half computed.
+
+        Returns:
+            The number of refreshed products.
+        """
+        if product_ids is None:
+            product_ids = Product.objects.values_list('id', flat=True)
+
+        product_ids = sorted(set(product_ids))
+        refreshed_at = timezone.now()
+        matrix = CategoryMatrix.build() if settings.SUBSTITUTE_ENGINE == 'matrix' else None
+
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size]
+
+            with transaction.atomic():
+                ProductSubstitute.objects.filter(product_id__in=batch).delete()
+
+                if matrix is None:
+                    SubstituteService._insert_substitutes(batch, top, candidates, refreshed_at)
+                else:
+                    ProductSubstitute.objects.bulk_create(
+                        SubstituteService._score_substitutes(matrix, batch, top, candidates, refreshed_at),
+                        batch_size=batch_size,
+                    )
+
+        return len(product_ids)
+
+    @staticmethod
+    def get_last_refresh():
+        """Get the datetime of the last refresh, None if the substitutes have never been computed."""
+        return ProductSubstitute.objects.aggregate(last_refresh=Max('refreshed_at'))['last_refresh']
+
+    @staticmethod
+    def get_outdated_product_ids(since: datetime) -> set:
+        """Get the IDs of the products whose substitutes may have changed since a datetime.
+
+        These are the products modified since then, the products sharing
+        a category with them (which may now be substituted by them),
+        and the products they were substituting.
+        """
+        changed_products = Product.objects.filter(updated_at__gte=since)
+        product_ids = set(changed_products.values_list('id', flat=True))
+
+        if product_ids:
+            product_ids.update(
+                Product.objects.filter(categories__product__in=changed_products).values_list('id', flat=True)
+            )
+            product_ids.update(
+                ProductSubstitute.objects.filter(substitute__in=changed_products).values_list('product_id', flat=True)
+            )
+
+        return product_ids
+
+    @staticmethod
+    def _score_substitutes(
+        matrix: CategoryMatrix, product_ids, top: int, candidates: Optional[int], refreshed_at: datetime
+    ):
+        """Yield the best substitutes of the products, scored by the category matrix."""
+        for product_id in product_ids:
+            best = matrix.get_substitutes(product_id, top, candidates)
+
+            for rank, (substitute_id, score) in enumerate(best, start=1):
+                yield ProductSubstitute(
+                    product_id=product_id, substitute_id=substitute_id, score=score, rank=rank,
+                    refreshed_at=refreshed_at,
+                )
+
+    @staticmethod
+    def _insert_substitutes(product_ids, top: int, candidates: Optional[int], refreshed_at: datetime) -> None:
+        """Compute and insert the best substitutes of the products in a single query.
+
+        Without `candidates`, every product sharing a category with a product
+        is scored. Otherwise its candidates are the `candidates` healthiest
+        products of each of its categories, then scored on all the categories
+        they share with it. CROSS JOIN keeps the categories of the products
+        as the outer side of the join on SQLite, their candidates being looked
+        up by category.
+        """
+        qn = connection.ops.quote_name
+        substitutes, products = ProductSubstitute._meta.db_table, Product._meta.db_table
+        product_categories = Product.categories.through._meta.db_table
+        placeholders = ', '.join(['%s'] * len(product_ids))
+
+        if candidates is None:
+            scored = (
+                f"SELECT o.product_id, s.product_id AS substitute_id, sp.nutriscore_grade, COUNT(*) AS score "
+                f"FROM {product_categories} AS o "
+                f"INNER JOIN {product_categories} AS s "
+                f"  ON s.category_id = o.category_id AND s.product_id <> o.product_id "
+                f"INNER JOIN {products} AS op ON op.id = o.product_id "
+                f"INNER JOIN {products} AS sp ON sp.id = s.product_id "
+                f"WHERE o.product_id IN ({placeholders}) AND sp.nutriscore_grade <= op.nutriscore_grade "
+                f"GROUP BY o.product_id, s.product_id, sp.nutriscore_grade"
+            )
+            params = [*product_ids]
+        else:
+            scored = (
+                f"SELECT c.product_id, c.substitute_id, c.nutriscore_grade, COUNT(*) AS score FROM ("
+                f"  SELECT DISTINCT o.product_id, s.product_id AS substitute_id, s.nutriscore_grade "
+                f"  FROM {product_categories} AS o "
+                f"  CROSS JOIN ("
+                f"    SELECT product_id, category_id, nutriscore_grade FROM ("
+                f"      SELECT pc.product_id, pc.category_id, p.nutriscore_grade, ROW_NUMBER() OVER ("
+                f"        PARTITION BY pc.category_id ORDER BY p.nutriscore_grade, pc.product_id"
+                f"      ) AS position "
+                f"      FROM {product_categories} AS pc "
+                f"      INNER JOIN {products} AS p ON p.id = pc.product_id "
+                f"      WHERE pc.category_id IN ("
+                f"        SELECT category_id FROM {product_categories} WHERE product_id IN ({placeholders})"
+                f"      )"
+                f"    ) AS healthiest WHERE position <= %s"
+                f"  ) AS s "
+                f"  INNER JOIN {products} AS op ON op.id = o.product_id "
+                f"  WHERE o.product_id IN ({placeholders}) AND s.category_id = o.category_id "
+                f"    AND s.product_id <> o.product_id AND s.nutriscore_grade <= op.nutriscore_grade"
+                f") AS c "
+                f"INNER JOIN {product_categories} AS oc ON oc.product_id = c.product_id "
+                f"INNER JOIN {product_categories} AS sc "
+                f"  ON sc.product_id = c.substitute_id AND sc.category_id = oc.category_id "
+                f"GROUP BY c.product_id, c.substitute_id, c.nutriscore_grade"
+            )
+            params = [*product_ids, candidates, *product_ids]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {substitutes} (product_id, substitute_id, score, {qn('rank')}, refreshed_at) "
+                f"SELECT product_id, substitute_id, score, {qn('rank')}, %s FROM ("
+                f"  SELECT product_id, substitute_id, score, ROW_NUMBER() OVER ("
+                f"    PARTITION BY product_id ORDER BY score DESC, nutriscore_grade, substitute_id"
+                f"  ) AS {qn('rank')} "
+                f"  FROM ({scored}) AS scored"
+                f") AS ranked WHERE {qn('rank')} <= %s",
+                [refreshed_at, *params, top],
+            )
@@ -1,18 +1,21 @@
+from io import StringIO
 from typing import Tuple
 from unittest import mock
 from urllib.parse import quote_plus
 
-from algoliasearch_django.decorators import disable_auto_indexing
+from django.core.management import call_command
 from django.shortcuts import reverse
-from django.test import TestCase, TransactionTestCase, tag
+from django.test import TestCase, TransactionTestCase, override_settings, tag
 from selenium.webdriver.remote.webelement import WebElement
 
 from account.tests.factories import UserFactory
 from product.tests.factories import ProductFactory, CategoryFactory
-from product.tests.utils import algolia_mock_responses
+from product.tests.utils import algolia_mock_responses, disable_auto_indexing
 from purbeurre.tests import SeleniumServerTestCase
 from .factories import UserSubstituteFactory
-from ..models import UserSubstitute
+from ..matrix import CategoryMatrix
+from ..models import ProductSubstitute, UserSubstitute
+from ..services import SubstituteService
 
 
 class UserSubstituteListViewTests(TestCase):
@@ -73,6 +76,7 @@ class SubstituteSearchListViewTests(TransactionTestCase):
         ProductFactory.create_batch(
             size=10, categories=CategoryFactory.create_batch(3),
         )
+        SubstituteService.refresh()
 
         response = self.client.get(self.url)
 
@@ -90,18 +94,198 @@ class SubstituteSearchListViewTests(TransactionTestCase):
         different_products = ProductFactory.create_batch(
             size=4, categories=CategoryFactory.create_batch(5)
         )
+        SubstituteService.refresh()
 
         response = self.client.get(self.url)
         substitutes = response.context['substitutes']
 
         self.assertEqual(200, response.status_code)
-        self.assertEqual(n_substitutes, response.context['paginator'].count)
+        self.assertFalse(response.context['is_paginated'])
 
         self.assertQuerysetEqual(substitutes, similar_products)
         # Verify that any `different_products` are not present in the results.
         for item in different_products:
             self.assertNotIn(item, substitutes)
 
+    @disable_auto_indexing()
+    def test_substitute_search_list_queries(self) -> None:
+        """Test that each page of substitutes is fetched once, along with the ones already saved."""
+        substitutes = ProductFactory.create_batch(categories=self.original_product_categories, size=8)
+        UserSubstituteFactory(
+            user=self.user, original_product=self.original_product, substitute_product=substitutes[0]
+        )
+        SubstituteService.refresh()
+
+        # Session, user, product, page of substitutes and the saved ones, without counting the substitutes.
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+
+        self.assertEqual({substitutes[0].pk}, response.context['already_substituted_ids'])
+        first_page = list(response.context['substitutes'])
+
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url + f"&cursor={response.context['page_obj'].next_cursor}")
+
+        self.assertEqual(2, len(response.context['substitutes']))
+        self.assertEqual(set(), response.context['already_substituted_ids'])
+
+        # The sort key of the cursors is the rank annotated on the substitutes.
+        response = self.client.get(self.url + "&cursor=WzAsWzEwMDAwMDAwMDAwMDAwMDAwMDAwMDAwXV0")
+
+        self.assertEqual(first_page, list(response.context['substitutes']))
+
+
+class SubstituteServiceTests(TestCase):
+    @disable_auto_indexing()
+    def setUp(self) -> None:
+        self.categories = CategoryFactory.create_batch(3)
+        self.product = ProductFactory(nutriscore_grade='c', categories=self.categories)
+
+    def get_substitutes(self, product):
+        return [(s.substitute, s.score, s.rank) for s in ProductSubstitute.objects.filter(product=product)]
+
+    @disable_auto_indexing()
+    def test_refresh(self):
+        """Test that substitutes are ranked by shared categories, then by nutriscore."""
+        close = ProductFactory(nutriscore_grade='c', categories=self.categories)
+        healthiest = ProductFactory(nutriscore_grade='a', categories=self.categories[:2])
+        healthier = ProductFactory(nutriscore_grade='b', categories=self.categories[:2])
+        # Neither a worse nutriscore nor no shared category makes a substitute.
+        ProductFactory(nutriscore_grade='d', categories=self.categories)
+        ProductFactory(nutriscore_grade='a', categories=CategoryFactory.create_batch(2))
+
+        self.assertEqual(6, SubstituteService.refresh())
+
+        self.assertEqual(
+            [(close, 3, 1), (healthiest, 2, 2), (healthier, 2, 3)], self.get_substitutes(self.product)
+        )
+        self.assertEqual([(healthiest, 2, 1)], self.get_substitutes(healthier))
+
+        # Substitutes are replaced, and only the best ones are kept.
+        close.categories.clear()
+        SubstituteService.refresh([self.product.pk], top=1)
+
+        self.assertEqual([(healthiest, 2, 1)], self.get_substitutes(self.product))
+
+    @disable_auto_indexing()
+    def test_refresh_candidates(self):
+        """Test that the candidates are the healthiest products of each category, scored on all their categories."""
+        healthiest = ProductFactory(nutriscore_grade='a', categories=self.categories[:1])
+        close = ProductFactory(nutriscore_grade='b', categories=self.categories)
+        less_healthy = ProductFactory(nutriscore_grade='c', categories=self.categories[1:])
+
+        for engine in ('matrix', 'sql'):
+            with self.subTest(engine=engine), override_settings(SUBSTITUTE_ENGINE=engine):
+                SubstituteService.refresh([self.product.pk])
+
+                self.assertEqual(
+                    [(close, 3, 1), (less_healthy, 2, 2), (healthiest, 1, 3)], self.get_substitutes(self.product)
+                )
+
+                # The ranking is approximate: the less healthy product is never a candidate.
+                SubstituteService.refresh([self.product.pk], candidates=1)
+
+                self.assertEqual([(close, 3, 1), (healthiest, 1, 2)], self.get_substitutes(self.product))
+
+    @disable_auto_indexing()
+    def test_refresh_engines_rank_alike(self):
+        """Test that the category matrix ranks the substitutes like the database does."""
+        categories = self.categories + CategoryFactory.create_batch(2)
+
+        for i, grade in enumerate('aabbccdde'):
+            ProductFactory(nutriscore_grade=grade, categories=categories[i % 3:i % 3 + 1 + i % 4])
+
+        substitutes = ProductSubstitute.objects.values_list('product', 'substitute', 'score', 'rank')
+
+        for candidates in (2, None):
+            with self.subTest(candidates=candidates):
+                with override_settings(SUBSTITUTE_ENGINE='sql'):
+                    SubstituteService.refresh(top=4, candidates=candidates)
+
+                expected = list(substitutes.all())
+
+                with override_settings(SUBSTITUTE_ENGINE='matrix'):
+                    SubstituteService.refresh(top=4, candidates=candidates)
+
+                self.assertTrue(expected)
+                self.assertEqual(expected, list(substitutes.all()))
+
+    @disable_auto_indexing()
+    def test_get_outdated_product_ids(self):
+        """Test that products sharing categories with modified ones, or substituted by them, are outdated."""
+        substitute = ProductFactory(nutriscore_grade='a', categories=self.categories[:1])
+        other = ProductFactory(categories=CategoryFactory.create_batch(1))
+        SubstituteService.refresh()
+        last_refresh = SubstituteService.get_last_refresh()
+
+        self.assertEqual(set(), SubstituteService.get_outdated_product_ids(since=last_refresh))
+
+        substitute.categories.set(CategoryFactory.create_batch(1))
+        substitute.save()
+
+        self.assertEqual(
+            {substitute.pk, self.product.pk}, SubstituteService.get_outdated_product_ids(since=last_refresh)
+        )
+        self.assertNotIn(other.pk, SubstituteService.get_outdated_product_ids(since=last_refresh))
+
+    @disable_auto_indexing()
+    def test_refresh_substitutes_command(self):
+        substitute = ProductFactory(nutriscore_grade='a', categories=self.categories)
+        out = StringIO()
+
+        call_command('refresh_substitutes', stdout=out)
+
+        self.assertIn("Refreshed the substitutes of 2 products.", out.getvalue())
+        self.assertEqual([(substitute, 3, 1)], self.get_substitutes(self.product))
+
+        # Nothing changed since the last refresh.
+        call_command('refresh_substitutes', '--incremental', stdout=out)
+
+        self.assertIn("Refreshed the substitutes of 0 products.", out.getvalue())
+
+
+class CategoryMatrixTests(TestCase):
+    def setUp(self) -> None:
+        products = [(1, 'c'), (2, 'b'), (3, 'a'), (4, 'c'), (5, 'd'), (6, '')]
+        relations = [(1, 10), (1, 11), (2, 10), (3, 10), (3, 11), (4, 11), (5, 10), (6, 12), (7, 10)]
+        self.matrix = CategoryMatrix(products, relations)
+
+    def test_get_substitutes(self):
+        """Test that substitutes are ranked by shared categories, nutriscore and ID."""
+        self.assertEqual(6, len(self.matrix))
+        self.assertEqual([(3, 2), (2, 1), (4, 1)], self.matrix.get_substitutes(1, top=5))
+        self.assertEqual([(3, 2), (2, 1)], self.matrix.get_substitutes(1, top=2))
+        self.assertEqual([(3, 1)], self.matrix.get_substitutes(2, top=5))
+
+    def test_get_substitutes_with_candidates(self):
+        """Test that the candidates are the healthiest products of each category, still scored on all of them."""
+        self.assertEqual([(3, 2)], self.matrix.get_substitutes(1, top=5, candidates=1))
+        self.assertEqual([(3, 2), (2, 1)], self.matrix.get_substitutes(1, top=5, candidates=2))
+
+    def test_get_substitutes_with_candidates_approximate_the_exact_ones(self):
+        """Test that the capped substitutes keep their exact score, and are the exact ones with a large cap."""
+        products = [(i, 'abcde'[i * 7 % 5]) for i in range(60)]
+        # Nested categories, the first ones holding most products.
+        relations = [(i, category) for i in range(60) for category in range(i % 6 + 1) if (i + category) % 3]
+        matrix = CategoryMatrix(products, relations)
+
+        for product_id, _ in products:
+            exact = matrix.get_substitutes(product_id, top=60)
+
+            for candidates in (1, 5, 20):
+                with self.subTest(product=product_id, candidates=candidates):
+                    capped = matrix.get_substitutes(product_id, top=60, candidates=candidates)
+
+                    self.assertLessEqual(set(capped), set(exact))
+
+            self.assertEqual(exact, matrix.get_substitutes(product_id, top=60, candidates=60))
+
+    def test_get_substitutes_without_candidates(self):
+        self.assertEqual([], self.matrix.get_substitutes(3, top=5))
+        self.assertEqual([], self.matrix.get_substitutes(6, top=5))
+        # Unknown products have no substitutes.
+        self.assertEqual([], self.matrix.get_substitutes(7, top=5))
+
 
 class SaveUserSubstituteView(TestCase):
     def setUp(self) -> None:
@@ -209,7 +393,8 @@ class DeleteUserSubstituteView(TestCase):
 
 
 @tag('selenium')
-@mock.patch("product.views.raw_search", side_effect=algolia_mock_responses, autospec=True)
+@override_settings(SEARCH_BACKEND='product.search.backends.AlgoliaSearchBackend')
+@mock.patch("product.search.backends.araw_search", side_effect=algolia_mock_responses, autospec=True)
 class SeleniumTests(SeleniumServerTestCase):
     fixtures = ['users', 'products']
 
@@ -221,6 +406,11 @@ class SeleniumTests(SeleniumServerTestCase):
         cls.qs = "?query=Riz&page=1"
         cls.url = cls.live_server_url + reverse('product:search') + cls.qs
 
+    def setUp(self) -> None:
+        super().setUp()
+        # Substitutes are precomputed from the products of the fixtures.
+        SubstituteService.refresh()
+
     def get_substitute_element_by_xpath(self, nutriscore_letter: str) -> Tuple[WebElement, WebElement, str]:
         element = self.browser.find_element_by_xpath(
             "//div[contains(@class, 'ns-%s')]/parent::node()" % nutriscore_letter.lower()
@@ -1,15 +1,16 @@
-from django.db.models import Count
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
+from django.db.models import F
 from django.shortcuts import reverse, redirect, get_object_or_404, render
 from django.views import generic
 
 from product.models import Product
+from purbeurre.pagination import CursorPaginationMixin
 from .models import UserSubstitute
 from .forms import UserSubstituteCreateForm
 
 
-class UserSubstituteIndexView(LoginRequiredMixin, generic.ListView):
+class UserSubstituteIndexView(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     model = UserSubstitute
     template_name = 'substitute/index.html'
     context_object_name = 'substitutes'
@@ -21,11 +22,12 @@ class UserSubstituteIndexView(LoginRequiredMixin, generic.ListView):
         return UserSubstitute.objects.filter(user_id=user.pk)
 
 
-class ProductSubstituteSearchListView(LoginRequiredMixin, generic.ListView):
+class ProductSubstituteSearchListView(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     model = Product
     template_name = 'substitute/search.html'
     context_object_name = 'substitutes'
     paginate_by = 6
+    cursor_ordering = ('substitute_rank',)
 
     original_product: Product
 
@@ -38,34 +40,25 @@ class ProductSubstituteSearchListView(LoginRequiredMixin, generic.ListView):
         self.original_product = get_object_or_404(Product, pk=product_id)
 
     def get_queryset(self):
-        """Return the list of items for this view.
+        """Return the precomputed substitutes of the product, best first.
 
-        The return value must be an iterable and may be an instance of
-        `QuerySet` in which case `QuerySet` specific behavior will be enabled.
+        They are read with a single lookup of the `ProductSubstitute` index (see `SubstituteService`).
         """
-        category_ids = self.original_product.categories.values_list('id', flat=True)
-
         return Product.objects.filter(
-            categories__in=category_ids,
-            nutriscore_grade__lte=self.original_product.nutriscore_grade
-        ).distinct().exclude(
-            pk=self.original_product.pk
-        ).annotate(
-            categories_count=Count('categories')
-        ).order_by(
-            '-categories_count', 'nutriscore_grade',
-        )
+            top_substitute_of__product_id=self.original_product.pk
+        ).annotate(substitute_rank=F('top_substitute_of__rank')).order_by('substitute_rank')
 
     def get_context_data(self, *, object_list=None, **kwargs):
         """Get the context for this view."""
         ctx = super().get_context_data(object_list=object_list, **kwargs)
-        skip = (int(self.request.GET.get('page', 1)) - 1) * 6
+        # The page of substitutes is fetched once, then rendered from its cache by the template.
+        page_substitute_ids = [substitute.pk for substitute in ctx['object_list']]
 
-        already_substituted_ids = UserSubstitute.objects.filter(
+        already_substituted_ids = set(UserSubstitute.objects.filter(
             user_id=self.request.user.pk,
             original_product_id=self.original_product.pk,
-            substitute_product_id__in=self.get_queryset()[skip:skip + 6]
-        ).values_list('substitute_product_id', flat=True)
+            substitute_product_id__in=page_substitute_ids
+        ).values_list('substitute_product_id', flat=True))
 
         adds = {
             "already_substituted_ids": already_substituted_ids,
@@ -1,5 +1,5 @@
 #!/bin/sh
 cd purbeurre/ || exit
 python manage.py migrate
-python manage.py populate
-python manage.py algolia_reindex
+python manage.py populate --incremental
+python manage.py refresh_substitutes --incremental